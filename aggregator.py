@@ -0,0 +1,80 @@
+# ================== 本地多週期K棒合成 ==================
+# 只訂閱 kline_1m，由收盤的 1 分K合成 5m / 1h / 4h（對齊 UTC 整點邊界），
+# 新增週期只要在 TIMEFRAMES 加一行
+
+TIMEFRAMES = {"5m": 300_000, "1h": 3_600_000, "4h": 14_400_000}
+MINUTE_MS = 60_000
+
+
+class Candle:
+    __slots__ = ("open_ms", "open", "high", "low", "close", "volume", "quote_vol", "minutes")
+
+    def __init__(self, open_ms, open_price):
+        self.open_ms = open_ms
+        self.open = self.high = self.low = self.close = open_price
+        self.volume = 0.0
+        self.quote_vol = 0.0
+        self.minutes = 0
+
+    @classmethod
+    def from_rest(cls, k):
+        # REST K線 [open_time, open, high, low, close, volume, close_time, quote_volume, ...]
+        c = cls(k[0], float(k[1]))
+        c.high, c.low, c.close = float(k[2]), float(k[3]), float(k[4])
+        c.volume, c.quote_vol = float(k[5]), float(k[7])
+        return c
+
+    def row(self):
+        # 與 klinestore.KLINE_DTYPE 欄位順序相同
+        return self.open_ms, self.open, self.high, self.low, self.close, self.volume, self.quote_vol
+
+
+class CandleAggregator:
+    """on_close(sym, interval, candle, close_ms, complete)
+    on_gap(sym, open_ms)：第一分鐘或分K中斷後恢復時呼叫，之前整根沒看到的K棒由呼叫端補"""
+
+    def __init__(self, on_close, timeframes=TIMEFRAMES, on_gap=None):
+        self.on_close = on_close
+        self.on_gap = on_gap
+        self.timeframes = timeframes
+        self.partial = {}
+        self.last_minute = {}
+
+    def add_minute(self, sym, open_ms, open_price, high, low, close, volume, quote_vol):
+        # 只接收已收盤的 1 分K，重複或過期的直接略過
+        last = self.last_minute.get(sym, -1)
+        if open_ms <= last:
+            return
+        if self.on_gap is not None and open_ms - last > MINUTE_MS:
+            self.on_gap(sym, open_ms)
+        self.last_minute[sym] = open_ms
+        candles = self.partial.get(sym)
+        if candles is None:
+            candles = self.partial[sym] = {}
+        for interval, span in self.timeframes.items():
+            bucket = open_ms - open_ms % span
+            c = candles.get(interval)
+            if c is not None and c.open_ms != bucket:
+                # 上一根的最後一分鐘遺失，換桶時直接收掉（視為不完整）
+                self._emit(sym, interval, span, c)
+                c = None
+            if c is None:
+                c = candles[interval] = Candle(bucket, open_price)
+            if high > c.high:
+                c.high = high
+            if low < c.low:
+                c.low = low
+            c.close = close
+            c.volume += volume
+            c.quote_vol += quote_vol
+            c.minutes += 1
+            if open_ms + MINUTE_MS == bucket + span:
+                self._emit(sym, interval, span, c)
+                del candles[interval]
+
+    def _emit(self, sym, interval, span, c):
+        self.on_close(sym, interval, c, c.open_ms + span - 1, c.minutes == span // MINUTE_MS)
+
+    def discard(self, sym):
+        self.partial.pop(sym, None)
+        self.last_minute.pop(sym, None)
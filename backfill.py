@@ -0,0 +1,67 @@
+import asyncio
+import time
+import clock
+from config import BACKFILL_CONCURRENCY
+from models import symbol_state
+from gateway import gateway
+from binance_opendata import apply_closed_kline
+from aggregator import Candle, TIMEFRAMES
+from klinestore import kline_store
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 啟動時 K線回補 ==================
+# 各週期回補根數：5m 對應 volume_5m 長度，1h/4h 多抓一些讓 EMA 收斂
+BACKFILL_LIMITS = {"5m": 240, "1h": 499, "4h": 499}
+
+async def backfill_symbol(sym):
+    for interval, limit in BACKFILL_LIMITS.items():
+        # 本地已存的K線先寫入，REST 只補後面缺少的根數（+1 為尚未收盤的那根）
+        span = TIMEFRAMES[interval]
+        missing = limit
+        last = kline_store.last_time(sym, interval)
+        if last >= 0:
+            missing = int((clock.now() * 1000 - last) // span) - 1
+            if missing < limit:
+                apply_rows(sym, interval, kline_store.tail(sym, interval, limit - missing), span)
+                if missing <= 0:
+                    continue
+        # 權重預算與限流由 gateway 處理，回補排在最低優先
+        klines = await gateway.klines(sym, interval, min(limit, missing + 1))
+        if sym not in symbol_state:
+            return  # 回補期間已被移出監控
+        apply_klines(sym, interval, klines)
+
+def apply_rows(sym, interval, rows, span):
+    for open_ms, close, quote_vol in zip(rows["open_ms"].tolist(), rows["close"].tolist(), rows["quote_vol"].tolist()):
+        apply_closed_kline(sym, interval, (open_ms + span - 1) // 1000, close, quote_vol)
+
+def apply_klines(sym, interval, klines):
+    now_ms = clock.now() * 1000
+    closed = []
+    for k in klines:
+        # [open_time, open, high, low, close, volume, close_time, quote_volume, ...]
+        if k[6] > now_ms:
+            continue  # 最後一根尚未收盤
+        apply_closed_kline(sym, interval, k[6] // 1000, float(k[4]), float(k[7]))
+        closed.append(Candle.from_rest(k).row())
+    kline_store.append_later(sym, interval, closed)
+
+async def backfill_symbols(symbols):
+    if not symbols:
+        return
+    start = time.time()
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+    async def run(sym):
+        async with semaphore:
+            try:
+                await backfill_symbol(sym)
+                return True
+            except Exception as e:
+                log.error("[回補錯誤] %s: %s", sym, e)
+                return False
+
+    results = await asyncio.gather(*(run(s) for s in symbols))
+    log.info("K線回補完成：%d/%d 幣，耗時 %.1f 秒", sum(results), len(symbols), time.time() - start)
@@ -0,0 +1,226 @@
+import argparse
+import itertools
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from config import OI_THRESHOLD, PRICE_THRESHOLD, VOLUME_THRESHOLD, ALERT_COOLDOWN, KLINE_STORE_DIR
+from klinestore import KlineStore, import_archives
+from indicators import EMABank, EMA_PERIODS
+from screener import VOL_HOUR_BARS
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 告警門檻回測（參數掃描） ==================
+# 讀本地K線儲存（klinestore，可先匯入 data.binance.vision 的 5m K線與 metrics 檔），
+# 每個幣種的指標序列只算一次；以 5m 收盤為評估點，套用與 MarketArrays.screen 相同的判斷：
+#   1h 多頭排列、5m 成交量（最近 60 根 vs 其餘平均）、15 分鐘漲幅
+# 先用網格中最寬鬆的門檻篩出候選列放進共享記憶體，各 worker 直接掛載，
+# 每組參數只需在候選列上比較門檻並套用冷卻時間；持倉量只在設定 OI 門檻時才過濾
+#
+#   python backtest.py --import data/ --price 3,4,5,6 --volume 3,5,8 --cooldown 1800,3600
+
+BAR_MS = 300_000
+VOL_BARS = 240                   # 與 MarketArrays.vol_5m 長度相同
+PRICE_BARS = 3                   # 15 分鐘 = 3 根 5m
+HORIZONS = {"1h": 12, "4h": 48, "24h": 288}
+COLUMNS = ("sym", "t", "price_pct", "vol_ratio", "oi_pct", "trend_4h") + tuple(f"ret_{h}" for h in HORIZONS)
+
+# ---------- 讀檔 ----------
+
+def load_dataset(store):
+    """store 內有 5m K線的幣種：{symbol: {"open_ms", "close", "quote_vol", "oi_t", "oi"}}（memmap view）"""
+    data = {}
+    for sym in store.symbols("5m"):
+        k = store.view(sym, "5m")
+        oi = store.view(sym, "oi")
+        data[sym] = {"open_ms": k["open_ms"], "close": k["close"], "quote_vol": k["quote_vol"],
+                     "oi_t": oi["t"], "oi": oi["oi"]}
+    return data
+
+# ---------- 指標序列 ----------
+
+def _window_sum(csum, i, n):
+    # 每個位置 i 往回 n 根（不足則到開頭）的加總；csum 前面補 0
+    return csum[i + 1] - csum[np.maximum(i + 1 - n, 0)]
+
+def volume_stats(quote_vol):
+    """每根 5m 收盤時的 (cur, avg, n)，與 MarketArrays.volume_stats 相同算法"""
+    idx = np.arange(len(quote_vol))
+    csum = np.concatenate([[0.0], np.cumsum(quote_vol)])
+    n = np.minimum(idx + 1, VOL_BARS)
+    total = _window_sum(csum, idx, VOL_BARS)
+    cur = _window_sum(csum, idx, VOL_HOUR_BARS)
+    prev_n = np.maximum(n - VOL_HOUR_BARS, 0)
+    avg = np.where(prev_n > 0, (total - cur) / np.maximum(1, prev_n // VOL_HOUR_BARS), 1.0)
+    return cur, avg, n
+
+def trend_series(open_ms, close, span_ms):
+    """每根 5m 收盤時，最近一根已收盤 span K棒的 EMA15>30>45>60 排列與 EMA45"""
+    bars = span_ms // BAR_MS
+    bucket = open_ms // span_ms
+    last = np.flatnonzero(np.diff(np.append(bucket, -1)) != 0)       # 每個桶的最後一根 5m
+    counts = np.diff(np.concatenate([[-1], last]))
+    complete = last[counts == bars]                                  # 只用完整的 K棒
+    bank = EMABank()
+    emas = np.full((len(complete), len(EMA_PERIODS)), np.nan)
+    for j, i in enumerate(complete):
+        bank.update(close[i])
+        emas[j] = [np.nan if bank[p] is None else bank[p] for p in EMA_PERIODS]
+    # 第 i 根 5m 收盤時可用的是 complete 中 <= i 的最後一根
+    k = np.searchsorted(complete, np.arange(len(close)), side="right") - 1
+    e = np.where(k[:, None] >= 0, emas[np.maximum(k, 0)], np.nan)
+    with np.errstate(invalid="ignore"):
+        return (e[:, 0] > e[:, 1]) & (e[:, 1] > e[:, 2]) & (e[:, 2] > e[:, 3]) & (close > e[:, 2])
+
+def oi_change(close_ms, oi_t, oi):
+    """每個時間點的持倉量相對 1 小時前的變化 %，無資料為 NaN"""
+    if not len(oi):
+        return np.full(len(close_ms), np.nan)
+    cur = np.searchsorted(oi_t, close_ms, side="right") - 1
+    ref = np.searchsorted(oi_t, close_ms - 3_600_000, side="right") - 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = (oi[np.maximum(cur, 0)] - oi[np.maximum(ref, 0)]) / oi[np.maximum(ref, 0)] * 100
+    return np.where((cur >= 0) & (ref >= 0) & (oi[np.maximum(ref, 0)] > 0), pct, np.nan)
+
+def candidates(data, min_price, min_volume):
+    """所有幣種、所有評估點中可能被網格任一組參數觸發的列，欄位依 COLUMNS"""
+    symbols = sorted(data)
+    rows = []
+    for s, sym in enumerate(symbols):
+        d = data[sym]
+        close, open_ms = d["close"], d["open_ms"]
+        close_ms = open_ms + BAR_MS
+        cur, avg, n = volume_stats(d["quote_vol"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ref = np.concatenate([np.full(PRICE_BARS, np.nan), close[:-PRICE_BARS]])
+            price_pct = (close - ref) / ref * 100
+            vol_ratio = cur / avg
+            mask = (trend_series(open_ms, close, 3_600_000) & (n >= 24) & (avg > 0)
+                    & (vol_ratio > min_volume) & (ref > 0) & (price_pct > min_price))
+        i = np.flatnonzero(mask)
+        if not len(i):
+            continue
+        cols = [np.full(len(i), s), close_ms[i] / 1000, price_pct[i], vol_ratio[i],
+                oi_change(close_ms[i], d["oi_t"], d["oi"]),
+                trend_series(open_ms, close, 14_400_000)[i]]
+        for h in HORIZONS.values():
+            j = i + h
+            fwd = np.full(len(i), np.nan)
+            ok = j < len(close)
+            fwd[ok] = (close[j[ok]] - close[i[ok]]) / close[i[ok]] * 100
+            cols.append(fwd)
+        rows.append(np.column_stack(cols))
+    table = np.vstack(rows) if rows else np.zeros((0, len(COLUMNS)))
+    return symbols, table
+
+# ---------- 參數評估（worker） ----------
+
+_table = None
+
+def _attach(name, shape):
+    global _table, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    _table = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+
+def evaluate(params, table=None):
+    """一組 (price, volume, oi, cooldown) 的告警數與告警後報酬統計；oi 為 None 表示不以持倉量過濾"""
+    table = _table if table is None else table
+    price, volume, oi, cooldown = params
+    c = {name: table[:, k] for k, name in enumerate(COLUMNS)}
+    mask = (c["price_pct"] > price) & (c["vol_ratio"] > volume)
+    if oi is not None:
+        with np.errstate(invalid="ignore"):
+            mask &= c["oi_pct"] > oi
+    hits = np.flatnonzero(mask)
+    # 冷卻時間：同一幣種上次告警後 cooldown 秒內不再觸發（列已依幣種、時間排序）
+    keep = []
+    last_sym, last_t = -1, -np.inf
+    for i, sym, t in zip(hits.tolist(), c["sym"][hits].tolist(), c["t"][hits].tolist()):
+        if sym != last_sym:
+            last_sym, last_t = sym, -np.inf
+        if t - last_t >= cooldown:
+            keep.append(i)
+            last_t = t
+    result = {"price": price, "volume": volume, "oi": oi, "cooldown": cooldown,
+              "alerts": len(keep), "symbols": len(set(c["sym"][keep].tolist()))}
+    for h in HORIZONS:
+        r = c[f"ret_{h}"][keep]
+        r = r[~np.isnan(r)]
+        result[f"mean_{h}"] = float(r.mean()) if len(r) else np.nan
+        result[f"median_{h}"] = float(np.median(r)) if len(r) else np.nan
+        result[f"win_{h}"] = float((r > 0).mean() * 100) if len(r) else np.nan
+    return result
+
+def _evaluate_chunk(grid):
+    return [evaluate(p) for p in grid]
+
+def sweep(table, grid, workers=None):
+    if not len(table):
+        return [evaluate(p, table) for p in grid]
+    shm = shared_memory.SharedMemory(create=True, size=table.nbytes)
+    try:
+        np.ndarray(table.shape, dtype=np.float64, buffer=shm.buf)[:] = table
+        workers = workers or os.cpu_count()
+        chunks = [grid[i::workers * 4] for i in range(workers * 4)]
+        with ProcessPoolExecutor(workers, initializer=_attach, initargs=(shm.name, table.shape)) as pool:
+            return [r for rs in pool.map(_evaluate_chunk, chunks) for r in rs]
+    finally:
+        shm.close()
+        shm.unlink()
+
+# ---------- 主程式 ----------
+
+def _floats(text):
+    return [None if v.lower() == "none" else float(v) for v in text.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="告警門檻參數掃描回測")
+    parser.add_argument("--import", dest="archives", help="先匯入 data.binance.vision 下載的 K線 / metrics 檔目錄")
+    parser.add_argument("--store", default=KLINE_STORE_DIR, help="本地K線儲存目錄")
+    parser.add_argument("--price", type=_floats, default=[2, 3, 4, 5, 6, 7, 8, 9, 10, 12], help="PRICE_THRESHOLD 候選值")
+    parser.add_argument("--volume", type=_floats, default=[2, 3, 4, 5, 6, 7, 8, 10, 12, 15], help="VOLUME_THRESHOLD 候選值")
+    parser.add_argument("--oi", type=_floats, default=[None, 0, 4, 8, 12], help="OI_THRESHOLD 候選值，none 為不過濾")
+    parser.add_argument("--cooldown", type=_floats, default=[ALERT_COOLDOWN, ALERT_COOLDOWN * 4], help="ALERT_COOLDOWN 候選值（秒）")
+    parser.add_argument("--sort", default="mean_4h", help="排序欄位")
+    parser.add_argument("--top", type=int, default=20, help="顯示前幾名")
+    parser.add_argument("--out", help="完整結果輸出 CSV")
+    parser.add_argument("--workers", type=int, help="行程數，預設為 CPU 核心數")
+    args = parser.parse_args()
+
+    store = KlineStore(args.store)
+    if args.archives:
+        import_archives(args.archives, store)
+    start = time.time()
+    data = load_dataset(store)
+    bars = sum(len(d["close"]) for d in data.values())
+    log.info(f"載入 {len(data)} 幣、{bars:,} 根 5m K線，耗時 {time.time() - start:.1f} 秒")
+
+    start = time.time()
+    symbols, table = candidates(data, min(args.price), min(args.volume))
+    log.info(f"候選列 {len(table):,} 筆，耗時 {time.time() - start:.1f} 秒")
+
+    start = time.time()
+    grid = list(itertools.product(args.price, args.volume, args.oi, args.cooldown))
+    results = sweep(table, grid, args.workers)
+    log.info(f"評估 {len(grid)} 組參數，耗時 {time.time() - start:.1f} 秒"
+             f"（目前設定：價格 {PRICE_THRESHOLD}% / 成交量 {VOLUME_THRESHOLD}× / 持倉 {OI_THRESHOLD}% / 冷卻 {ALERT_COOLDOWN} 秒）")
+
+    keys = list(results[0]) if results else []
+    if args.out and results:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(",".join(keys) + "\n")
+            for r in results:
+                f.write(",".join("" if r[k] is None else str(r[k]) for k in keys) + "\n")
+
+    ranked = sorted((r for r in results if r["alerts"]), key=lambda r: -np.nan_to_num(r[args.sort], nan=-np.inf))
+    for r in ranked[:args.top]:
+        stats = "  ".join(f"{h} 平均 {r[f'mean_{h}']:+.2f}% 勝率 {r[f'win_{h}']:.0f}%" for h in HORIZONS)
+        log.info(f"價格>{r['price']}% 成交量>{r['volume']}× 持倉>{r['oi']}% 冷卻 {r['cooldown']:.0f}s："
+                 f"{r['alerts']} 則 / {r['symbols']} 幣  {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""本地委託簿增量套用吞吐量（事件 / 秒）與前 N 檔買賣壓力耗時，對照逐筆 dict 參考實作
+
+  python benchmarks/bench_depth.py [--events 20000] [--levels 1000]
+
+事件含 JSON 解碼（DepthMonitor.on_message 的完整路徑），合成資料沿用 tests/test_depth.py
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from depth import DepthMonitor, LocalBook
+from utils import json_loads
+from tests.test_depth import DictBook, events, snapshot, message
+
+
+def main(args):
+    rng = random.Random(0)
+    snap = snapshot(rng, 1, n=args.levels)
+    evs = events(rng, 1, args.events)
+    raws = [message("BTCUSDT", *ev) for ev in evs]
+
+    mon = DepthMonitor(1)
+    book = mon.books["BTCUSDT"] = LocalBook("BTCUSDT", 0)
+    book.load(dict(snap, lastUpdateId=evs[0][0]))
+    t0 = time.perf_counter()
+    for raw in raws:
+        mon.on_message(raw)
+    numpy_s = time.perf_counter() - t0
+    assert mon.resyncs == 0 and book.updates == len(evs)
+
+    ref = DictBook()
+    ref.load(snap)
+    t0 = time.perf_counter()
+    for raw in raws:
+        data = json_loads(raw)["data"]
+        ref.apply(data["b"], data["a"])
+    dict_s = time.perf_counter() - t0
+
+    n = 100_000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        book.imbalance(10)
+    imb_numpy = (time.perf_counter() - t0) / n
+    n = 1000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        bid = sum(ref.bids[p] for p in heapq.nlargest(10, ref.bids))
+        ask = sum(ref.asks[p] for p in heapq.nsmallest(10, ref.asks))
+        (bid - ask) / (bid + ask)
+    imb_dict = (time.perf_counter() - t0) / n
+
+    per = sum(len(ev[3]) + len(ev[4]) for ev in evs) / len(evs)
+    print(f"{len(evs):,} 筆增量（平均每筆 {per:.0f} 個價位），快照每側 {args.levels} 檔")
+    print(f"  numpy 委託簿 {len(evs) / numpy_s:>9,.0f} 事件/秒（{numpy_s / len(evs) * 1e6:5.1f} µs/事件）")
+    print(f"  dict 參考   {len(evs) / dict_s:>9,.0f} 事件/秒（{dict_s / len(evs) * 1e6:5.1f} µs/事件）")
+    print(f"  前 10 檔買賣壓力：numpy {imb_numpy * 1e6:.2f} µs，dict {imb_dict * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--levels", type=int, default=1000)
+    main(parser.parse_args())
@@ -0,0 +1,60 @@
+"""整點爆量：所有幣種同時收 1h / 4h K棒時，EMA 更新的耗時
+
+  python benchmarks/bench_ema.py [--symbols 400]
+
+舊作法：每根收盤把最近 100 根轉成 numpy array，talib.EMA 算 4 個週期（需安裝 TA-Lib）
+新作法：EMABank.update，每個週期 O(1)
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators import EMABank, EMA_PERIODS
+
+
+def main(symbols, rounds):
+    rng = np.random.default_rng(0)
+    history = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (symbols * 2, 160)), axis=1))
+    banks, windows = [], []
+    for row in history[:, :100]:
+        bank, window = EMABank(), deque(maxlen=100)
+        for c in row:
+            bank.update(c)
+            window.append(c)
+        banks.append(bank)
+        windows.append(window)
+
+    # 每一輪 = 一次整點：symbols 個幣種 × (1h, 4h)
+    t0 = time.perf_counter()
+    for r in range(rounds):
+        for bank, row in zip(banks, history):
+            bank.update(row[100 + r])
+    new = (time.perf_counter() - t0) / rounds
+    print(f"EMABank.update：{symbols} 幣 × 2 週期，每次整點 {new * 1000:.2f} ms")
+
+    try:
+        import talib
+    except ImportError:
+        print("未安裝 TA-Lib，略過舊作法（pip install -r requirements-dev.txt）")
+        return
+    t0 = time.perf_counter()
+    for r in range(rounds):
+        for window, row in zip(windows, history):
+            window.append(row[100 + r])
+            closes = np.array(window)
+            for p in EMA_PERIODS:
+                talib.EMA(closes, timeperiod=p)[-1]
+    old = (time.perf_counter() - t0) / rounds
+    print(f"talib 整段重算：每次整點 {old * 1000:.2f} ms（{old / new:.0f}×）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    main(args.symbols, args.rounds)
@@ -0,0 +1,117 @@
+"""本地K線儲存：冷 / 熱區間讀取，以及整點收盤時寫檔佔用 event loop 的時間
+
+  python benchmarks/bench_klinestore.py [--symbols 400] [--days 365]
+
+冷讀取：每個檔案先以 posix_fadvise(DONTNEED) 請系統丟掉頁快取、再開新的 memmap；
+熱讀取：同一個 KlineStore 重複查詢（memmap 與頁快取都在）。
+寫入：所有幣種 5m / 1h 收盤 + 持倉量各一筆，比較逐筆同步 append 與 append_later 在
+event loop 上的耗時（append_later 的檔案 I/O 由 flush 在背景執行緒完成，另列）
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klinestore import KlineStore, KLINE_DTYPE, OI_DTYPE
+
+SPAN = 300_000  # 5m
+T0 = 1_700_000_000_000 // SPAN * SPAN
+
+
+def build(root, symbols, days):
+    n = days * 288
+    rows = np.zeros(n, dtype=KLINE_DTYPE)
+    rows["open_ms"] = T0 + np.arange(n) * SPAN
+    rows["close"] = rows["quote_vol"] = 1.0
+    store = KlineStore(root)
+    for sym in symbols:
+        store.append(sym, "5m", rows)
+    return n
+
+
+def drop_cache(root):
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def read_all(store, symbols, start_ms, end_ms):
+    # 實際讀出資料（sum 會觸碰每一頁），不只是建立切片
+    return sum(float(store.range(sym, "5m", start_ms, end_ms)["close"].sum()) for sym in symbols)
+
+
+def bench_reads(root, symbols, n, repeat):
+    windows = (("1 天", 288), ("30 天", 288 * 30), ("全部", n))
+    for label, bars in windows:
+        end = T0 + n * SPAN
+        start = end - bars * SPAN
+        cold = []
+        for _ in range(repeat):
+            if hasattr(os, "posix_fadvise"):
+                drop_cache(root)
+            t0 = time.perf_counter()
+            read_all(KlineStore(root), symbols, start, end)
+            cold.append(time.perf_counter() - t0)
+        store = KlineStore(root)
+        read_all(store, symbols, start, end)
+        warm = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            read_all(store, symbols, start, end)
+            warm.append(time.perf_counter() - t0)
+        print(f"  {label:<4}（{bars:>6,} 根 × {len(symbols)} 幣）冷 {min(cold) * 1000:8.1f} ms，熱 {min(warm) * 1000:7.1f} ms")
+
+
+def bench_writes(root, symbols):
+    now = T0 + 10 ** 12
+
+    def burst(store, append):
+        for sym in symbols:
+            for name, t in (("5m", now), ("1h", now)):
+                append(sym, name, (t, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0))
+            append(sym, "oi", np.array([(now, 1.0)], dtype=OI_DTYPE))
+
+    for label, method in (("同步 append", "append"), ("append_later", "append_later")):
+        store = KlineStore(os.path.join(root, method))
+        # 先各寫一筆，讓量測只包含追加（last_time 已快取）
+        for sym in symbols:
+            for name in ("5m", "1h"):
+                store.append(sym, name, (now - SPAN, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0))
+            store.append(sym, "oi", np.array([(now - SPAN, 1.0)], dtype=OI_DTYPE))
+        t0 = time.perf_counter()
+        burst(store, getattr(store, method))
+        loop = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        written = store.flush()
+        extra = f"，背景 flush {(time.perf_counter() - t0) * 1000:.1f} ms（{written} 筆）" if written else ""
+        print(f"  {label:<12} event loop 佔用 {loop * 1000:6.1f} ms{extra}")
+
+
+def main(args):
+    root = tempfile.mkdtemp(prefix="bench_store_")
+    try:
+        symbols = [f"S{i:04d}USDT" for i in range(args.symbols)]
+        n = build(os.path.join(root, "reads"), symbols, args.days)
+        print(f"區間讀取：{args.symbols} 幣 × {n:,} 根 5m")
+        bench_reads(os.path.join(root, "reads"), symbols, n, args.repeat)
+        print(f"整點收盤寫入：{args.symbols} 幣 × (5m + 1h + 持倉量)")
+        bench_writes(os.path.join(root, "writes"), symbols)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+"""大量 log 時 event loop 的延遲：同步寫檔（舊設定）vs 佇列 + 背景執行緒（utils.setup_logging）
+
+  python benchmarks/bench_logging.py [--tasks 20] [--lines 500]
+
+每種設定在獨立行程、暫存目錄中執行（log 檔寫在該處，控制台輸出由父行程收下後丟棄）；
+一個 1 ms 週期的 ticker 量測 event loop 延遲，同時 tasks 個 coroutine 各寫 lines 筆
+INFO（一般訊息）或 ERROR（同一模板重複，會被 BurstFilter 限流）
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("sync", "queue")
+LEVELS = ("info", "error")
+
+
+def sync_logging():
+    # 改用佇列之前的設定：basicConfig 直接掛 FileHandler + StreamHandler，在呼叫端格式化與寫檔
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(message)s', datefmt='%H:%M:%S',
+                        handlers=[logging.FileHandler('_codeExecution.log', encoding='utf-8'), logging.StreamHandler()])
+    return logging.getLogger()
+
+
+async def burst(log, level, tasks, lines):
+    lags = []
+
+    async def ticker():
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - t0 - 0.001)
+
+    async def worker(i):
+        for j in range(lines):
+            if level == "info":
+                log.info("告警 → %s：%s", i, j)
+            else:
+                log.error("[WS#%d] 連線錯誤: %s", i, j)
+            if j % 10 == 0:
+                await asyncio.sleep(0)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(tasks)))
+    elapsed = time.perf_counter() - t0
+    await asyncio.sleep(0.05)
+    tick.cancel()
+    lags.sort()
+    return elapsed, lags[int(len(lags) * 0.99)], lags[-1]
+
+
+def child(mode, level, tasks, lines):
+    if mode == "sync":
+        log = sync_logging()
+    else:
+        from utils import setup_logging
+        log = setup_logging()
+    elapsed, p99, worst = asyncio.run(burst(log, level, tasks, lines))
+    print(f"{elapsed} {p99} {worst}", file=sys.__stdout__, flush=True)
+
+
+def main(args):
+    print(f"{args.tasks} 個 coroutine × {args.lines} 筆")
+    for level in LEVELS:
+        for mode in MODES:
+            tmp = tempfile.mkdtemp(prefix="bench_logging_")
+            try:
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, level,
+                                      "--tasks", str(args.tasks), "--lines", str(args.lines)],
+                                     cwd=tmp, check=True, capture_output=True, text=True).stdout
+            finally:
+                shutil.rmtree(tmp)
+            elapsed, p99, worst = map(float, out.split())
+            print(f"  {level.upper():<5} {mode:<5} 寫完 {elapsed * 1000:6.0f} ms，"
+                  f"loop 延遲 p99 {p99 * 1000:5.1f} ms / 最大 {worst * 1000:5.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "LEVEL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child, args.tasks, args.lines)
+    else:
+        main(args)
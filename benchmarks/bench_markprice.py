@@ -0,0 +1,76 @@
+"""全市場標記價格 frame 吞吐量（frame / 秒）：!markPrice@arr 整批寫入 vs 每幣一條 @markPrice
+
+  python benchmarks/bench_markprice.py [--symbols 1000,3000] [--frames 200]
+
+每個 frame 含全部幣種，時間每 frame 前進 1 秒（每 10 個 frame 追加一次價格取樣）。
+分別量測：完整路徑 handle_price_websocket（含 JSON 解碼）、只有 on_mark_price_arr、
+只有 MarketArrays.set_prices，以及同樣資料拆成每幣一則訊息逐筆處理
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clock
+from models import market, register_symbol, unregister_symbol
+from utils import json_loads
+from binance_opendata import handle_price_websocket, on_mark_price_arr, MARK_PRICE_ALL
+
+T0 = 1_760_000_000.0
+
+
+def frame_items(symbols, i):
+    return [{"e": "markPriceUpdate", "E": int((T0 + i) * 1000), "s": s, "p": f"{100 + (i + k) % 97 * 0.01:.4f}",
+             "i": "100.0000", "P": "100.0000", "r": "0.00010000", "T": 0} for k, s in enumerate(symbols)]
+
+
+def rate(fn, items, vclock):
+    vclock.t = T0
+    t0 = time.perf_counter()
+    for item in items:
+        vclock.t += 1
+        fn(item)
+    return len(items) / (time.perf_counter() - t0)
+
+
+def main(args):
+    vclock = clock.VirtualClock(T0)
+    clock.now = vclock
+    for n in args.symbols:
+        symbols = [f"S{i:05d}USDT" for i in range(n)]
+        for s in symbols:
+            register_symbol(s, T0)
+        frames = [frame_items(symbols, i) for i in range(args.frames)]
+        raws = [json.dumps({"stream": MARK_PRICE_ALL, "data": f}, separators=(",", ":")) for f in frames]
+        singles = [[json.dumps({"stream": f"{d['s'].lower()}@markPrice", "data": d}, separators=(",", ":"))
+                    for d in f] for f in frames[:max(1, args.frames // 10)]]
+        slots = np.array([market.slots[s] for s in symbols])
+        arrays = [(np.array([float(d["p"]) for d in f]), np.full(n, 0.01)) for f in frames]
+
+        full = rate(handle_price_websocket, raws, vclock)
+        decoded = [json_loads(r)["data"] for r in raws]
+        handler = rate(lambda f: on_mark_price_arr(None, f), decoded, vclock)
+        batch = rate(lambda a: market.set_prices(slots, a[0], a[1], clock.now()), arrays, vclock)
+
+        def per_symbol(msgs):
+            for raw in msgs:
+                handle_price_websocket(raw)
+        single = rate(per_symbol, singles, vclock)
+
+        print(f"{n:,} 幣：完整路徑 {full:8,.0f} frame/秒，on_mark_price_arr {handler:8,.0f}，"
+              f"set_prices {batch:9,.0f}；每幣一則 @markPrice {single:6,.1f} frame/秒（{full / single:.0f}×）")
+        for s in symbols:
+            unregister_symbol(s)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", default="1000,3000")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+    args.symbols = [int(x) for x in args.symbols.split(",")]
+    main(args)
@@ -0,0 +1,117 @@
+"""錄製檔全速回放的吞吐量（訊息 / 秒），比較標準庫 json 與 orjson 解碼
+
+  python benchmarks/bench_replay.py [--symbols 300] [--minutes 30] [--recording recordings/]
+
+沒給 --recording 時先合成一份錄製檔：開頭的 ticker / K線回補 / 持倉量 REST 回應，
+之後每秒一個 !markPrice@arr@1s，每個幣種每 2 秒一筆未收盤 kline_1m、每分鐘一筆收盤
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import binance_opendata
+import replay
+from recorder import read_feed
+
+T0 = 1_760_000_000.0
+BACKFILL = (("5m", 300, 240), ("1h", 3600, 499), ("4h", 14400, 499))
+
+
+def synthesize(directory, n_symbols, minutes):
+    syms = [f"S{i:04d}USDT" for i in range(n_symbols)]
+    lines = []
+
+    def rest(t, path, params, data):
+        lines.append(f"{t:.3f}\trest\t" + json.dumps({"path": path, "params": params, "data": data}, separators=(",", ":")))
+
+    def ws(t, obj):
+        lines.append(f"{t:.3f}\tws\t" + json.dumps(obj, separators=(",", ":")))
+
+    rest(T0, "/fapi/v1/ticker/24hr", None, [{"symbol": s, "quoteVolume": "9e9"} for s in syms])
+    for s in syms:
+        for iv, span, n in BACKFILL:
+            end = int(T0 // span * span)
+            ks = [[(end - (n - i) * span) * 1000, "1", "1", "1", "1", "1", (end - (n - i - 1) * span) * 1000 - 1,
+                   "1000", 0, "0", "0", "0"] for i in range(n)]
+            rest(T0 + 0.5, "/fapi/v1/klines", {"symbol": s, "interval": iv, "limit": n}, ks)
+        rest(T0 + 1, "/fapi/v1/openInterest", {"symbol": s}, {"openInterest": "1000"})
+
+    for sec in range(2, minutes * 60 + 2):
+        t = T0 + sec
+        ms = int(t * 1000)
+        ws(t, {"stream": "!markPrice@arr@1s", "data": [
+            {"e": "markPriceUpdate", "E": ms, "s": s, "p": "1.0000", "i": "1.0000", "P": "1.0000", "r": "0.00010000",
+             "T": 0} for s in syms]})
+        minute_open = int(t // 60 * 60) * 1000
+        for i, s in enumerate(syms):
+            closed = sec % 60 == 0
+            if not closed and (sec + i) % 2:
+                continue
+            start = minute_open - 60_000 if closed else minute_open
+            ws(t, {"stream": s.lower() + "@kline_1m", "data": {"e": "kline", "E": ms, "s": s, "k": {
+                "t": start, "T": start + 59_999, "s": s, "i": "1m", "f": 1, "L": 2, "o": "1.0000", "c": "1.0000",
+                "h": "1.0000", "l": "1.0000", "v": "10", "n": 5, "x": closed, "q": "10.0000", "V": "5",
+                "Q": "5.0000", "B": "0"}}})
+    with gzip.open(os.path.join(directory, "feed-20251009-000000.log.gz"), "wt", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def run(directory, decoder):
+    # 每個解碼器各開一個行程回放，避免前一次回放留下的幣種狀態影響後一次
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--recording", directory, "--decoder", decoder],
+                         check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def replay_once(directory, decoder):
+    binance_opendata.json_loads = __import__(decoder).loads
+    t0 = time.perf_counter()
+    asyncio.run(replay.replay(directory))
+    print(time.perf_counter() - t0)
+
+
+def main(args):
+    tmp = None
+    directory = args.recording
+    if directory is None:
+        directory = tmp = tempfile.mkdtemp(prefix="bench_replay_")
+        synthesize(directory, args.symbols, args.minutes)
+    try:
+        total = ws = 0
+        for _, kind, _ in read_feed(directory):
+            total += 1
+            ws += kind == "ws"
+        decoders = ["json"]
+        try:
+            import orjson  # noqa: F401
+            decoders.append("orjson")
+        except ImportError:
+            print("未安裝 orjson，只量測標準庫 json")
+        results = {name: run(directory, name) for name in decoders}
+        print(f"錄製檔 {total:,} 筆（WS {ws:,}）")
+        for name, elapsed in results.items():
+            print(f"  {name:<7} {elapsed:6.2f} 秒，{total / elapsed:>9,.0f} 筆/秒")
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--recording", help="改用現有的 RECORD_DIR 錄製目錄")
+    parser.add_argument("--decoder", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.decoder:
+        replay_once(args.recording, args.decoder)
+    else:
+        main(args)
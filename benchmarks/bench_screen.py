@@ -0,0 +1,39 @@
+"""全市場一次向量化篩選 vs 逐幣判斷的耗時
+
+  python benchmarks/bench_screen.py [--symbols 300,1000,5000]
+
+合成行情與逐幣參考實作沿用 tests/test_screener.py
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PRICE_THRESHOLD, VOLUME_THRESHOLD
+from tests.test_screener import build_market, reference_screen, NOW
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(sizes, repeat):
+    for n in sizes:
+        m = build_market(n)
+        vec = timed(lambda: m.screen(NOW, None, PRICE_THRESHOLD, VOLUME_THRESHOLD), repeat)
+        loop = timed(lambda: reference_screen(m, NOW, PRICE_THRESHOLD, VOLUME_THRESHOLD), max(1, repeat // 5))
+        print(f"{n:>6} 幣：screen {vec * 1000:7.2f} ms，逐幣 {loop * 1000:8.2f} ms（{loop / vec:.0f}×）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", default="300,1000,5000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main([int(x) for x in args.symbols.split(",")], args.repeat)
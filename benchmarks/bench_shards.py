@@ -0,0 +1,93 @@
+"""分片接收的擴展性：1 / 2 / 4 / 8 個 worker 行程同時解碼並寫入共享陣列的總吞吐量
+
+  python benchmarks/bench_shards.py [--workers 1,2,4,8] [--symbols 512] [--messages 200000]
+
+主行程配置 slot 並建立 shared_memory，各 worker 以 adopt_symbol 接手自己那一份幣種，
+預先產生好 @markPrice 訊息，全部就緒後同時開始呼叫 handle_price_websocket
+（JSON 解碼 + 寫入共享陣列 + 標記 dirty），以最慢的 worker 結束時間算總吞吐量。
+注意：worker 數超過 CPU 核心數時只是輪流分時，量到的是行程切換的額外成本而非加速
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def messages(symbols, n):
+    out = []
+    i = 0
+    while len(out) < n:
+        for s in symbols:
+            out.append(json.dumps({"stream": f"{s.lower()}@markPrice", "data": {
+                "e": "markPriceUpdate", "E": 1_760_000_000_000 + i, "s": s, "p": f"{100 + i * 0.01:.4f}",
+                "i": "100.0000", "P": "100.0000", "r": "0.00010000", "T": 0}}, separators=(",", ":")))
+        i += 1
+    return out[:n]
+
+
+def worker(shm_name, capacity, items, n, ready, start, results):
+    from models import market, adopt_symbol
+    from binance_opendata import handle_price_websocket
+    market.share(shm_name, capacity)
+    now = time.time()
+    for sym, slot in items:
+        adopt_symbol(sym, slot, now)
+    raws = messages([sym for sym, _ in items], n)
+    ready.put(None)
+    start.wait()
+    t0 = time.perf_counter()
+    for raw in raws:
+        handle_price_websocket(raw)
+    results.put((len(raws), time.perf_counter() - t0, time.perf_counter()))
+
+
+def main(args):
+    from models import register_symbol, market
+    now = time.time()
+    symbols = [f"S{i:04d}USDT" for i in range(args.symbols)]
+    for sym in symbols:
+        register_symbol(sym, now)
+    capacity = max(market.capacity, args.symbols)
+    shm = market.share(capacity=capacity)
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{args.symbols} 幣、共 {args.messages:,} 筆 @markPrice，本機 CPU 核心數 {os.cpu_count()}")
+    try:
+        for w in args.workers:
+            ready, results, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+            parts = [[(s, market.slots[s]) for s in symbols[i::w]] for i in range(w)]
+            procs = [ctx.Process(target=worker, args=(shm.name, capacity, parts[i], args.messages // w,
+                                                      ready, start, results)) for i in range(w)]
+            for p in procs:
+                p.start()
+            for _ in procs:
+                ready.get()
+            t0 = time.perf_counter()
+            start.set()
+            res = [results.get() for _ in procs]
+            wall = max(r[2] for r in res) - t0
+            for p in procs:
+                p.join()
+            total = sum(r[0] for r in res)
+            per = "、".join(f"{r[0] / r[1]:,.0f}" for r in res)
+            print(f"  {w} worker：{total / wall:>9,.0f} 筆/秒（各 worker {per}）")
+        written = (market.last_price[[market.slots[s] for s in symbols]] > 0).all()
+        print(f"所有 slot 皆已寫入：{bool(written)}")
+    finally:
+        shm.unlink()
+    if args.workers[-1] > (os.cpu_count() or 1):
+        print("（worker 數超過 CPU 核心數的結果只反映分時，需在多核心機器上量測擴展性）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--symbols", type=int, default=512)
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+    args.workers = [int(x) for x in args.workers.split(",")]
+    main(args)
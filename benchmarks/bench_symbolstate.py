@@ -0,0 +1,138 @@
+"""幣種狀態的記憶體（tracemalloc）與每則訊息 CPU 耗時：SymbolState / KlineTrack vs 改寫前的 dict
+
+  python benchmarks/bench_symbolstate.py [--symbols 1000] [--messages 200000]
+
+dict 版本照改寫前的 new_symbol_state：每幣一個 dict、f"ema_{interval}" 之類的字串 key，
+寫入陣列前再以幣種名稱查 slot。訊息已先解碼（兩邊相同，不計入），只量狀態更新本身：
+標記價格（價格 + 資金費率）與 1h K棒收盤（收盤價 deque + EMA + 同步到陣列）
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clock
+from indicators import EMABank, EMA_PERIODS
+from models import market, symbol_state, register_symbol, SymbolState
+from binance_opendata import on_mark_price, apply_closed_kline
+
+T0 = 1_760_000_000.0
+
+
+# ---------- 改寫前的 dict 版本 ----------
+
+def old_state(now):
+    return {
+        "last_price": None,
+        "last_oi": None,
+        "funding_rate": 0.0,
+        "monitor_start": now - 120,
+        "last_kline_close_time": 0,
+        "last_kline_1h_close_time": 0,
+        "last_kline_4h_close_time": 0,
+        "kline_1h_closes": deque(maxlen=100),
+        "ema_1h": EMABank(),
+        "kline_4h_closes": deque(maxlen=100),
+        "ema_4h": EMABank(),
+    }
+
+
+def old_mark_price(states, data, now):
+    sym = data["s"].upper()
+    if sym not in states:
+        return
+    price = float(data["p"])
+    state = states[sym]
+    state["last_price"] = price
+    state["funding_rate"] = float(data["r"]) * 100
+    market.set_price(market.slots[sym], price, now)
+
+
+def old_closed_kline(states, sym, interval, close_time, close_price):
+    state = states.get(sym)
+    if state is None:
+        return False
+    key = f"last_kline_{interval}_close_time"
+    if close_time <= state[key]:
+        return False
+    state[f"kline_{interval}_closes"].append(close_price)
+    state[f"ema_{interval}"].update(close_price)
+    state[key] = close_time
+    slot = market.slots[sym]
+    for iv, arr in (("1h", market.ema_1h), ("4h", market.ema_4h)):
+        bank = state[f"ema_{iv}"]
+        arr[slot] = [np.nan if bank[p] is None else bank[p] for p in EMA_PERIODS]
+    market.mark_dirty(slot)
+    return True
+
+
+# ---------- 量測 ----------
+
+def traced(build):
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def old_states(symbols, closes):
+    states = {s: old_state(T0) for s in symbols}
+    for st in states.values():
+        for iv in ("1h", "4h"):
+            st[f"kline_{iv}_closes"].extend(float(i) for i in range(closes))
+    return states
+
+
+def new_states(symbols, closes):
+    states = {s: SymbolState(s, T0) for s in symbols}
+    for st in states.values():
+        for track in st.klines.values():
+            track.closes.extend(float(i) for i in range(closes))
+    return states
+
+
+def cpu(fn, items):
+    t0 = time.process_time()
+    for item in items:
+        fn(item)
+    return (time.process_time() - t0) / len(items)
+
+
+def main(args):
+    symbols = [f"S{i:04d}USDT" for i in range(args.symbols)]
+    # 陣列在兩種版本都存在，先建好 slot 再比較每幣的狀態物件本身
+    for sym in symbols:
+        register_symbol(sym, T0)
+    n = args.symbols
+    print(f"{n:,} 幣（tracemalloc，每幣平均）")
+    for closes in (0, 100):
+        _, old_bytes = traced(lambda: old_states(symbols, closes))
+        _, new_bytes = traced(lambda: new_states(symbols, closes))
+        print(f"  收盤價 {closes:>3} 根：dict {old_bytes / n:6,.0f} B，__slots__ {new_bytes / n:6,.0f} B")
+    old = old_states(symbols, 100)
+
+    rng = np.random.default_rng(0)
+    msgs = [{"e": "markPriceUpdate", "s": symbols[i % n], "p": f"{100 + rng.random():.4f}", "r": "0.00010000"}
+            for i in range(args.messages)]
+    clock.now = clock.VirtualClock(T0)
+    old_mp = cpu(lambda d: old_mark_price(old, d, T0), msgs)
+    new_mp = cpu(lambda d: on_mark_price(symbol_state[d["s"]], d), msgs)
+    print(f"  標記價格：dict {old_mp * 1e6:5.2f} µs/則，__slots__ + 陣列 {new_mp * 1e6:5.2f} µs/則")
+
+    closes = [(symbols[i % n], T0 + 3600 * (1 + i // n), 100 + rng.random()) for i in range(args.messages // 10)]
+    old_k = cpu(lambda c: old_closed_kline(old, c[0], "1h", c[1], c[2]), closes)
+    new_k = cpu(lambda c: apply_closed_kline(c[0], "1h", c[1], c[2], 0.0), closes)
+    print(f"  1h 收盤：  dict {old_k * 1e6:5.2f} µs/根，__slots__ {new_k * 1e6:5.2f} µs/根")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    main(parser.parse_args())
@@ -0,0 +1,125 @@
+"""價格 / 持倉 / 5m 成交量歷史：欄式環形陣列（TimeSeriesStore）vs 每幣一個 deque 的記憶體與耗時
+
+  python benchmarks/bench_timeseries.py [--symbols 1000] [--rounds 20]
+
+deque 版本即改寫前的 price_history / oi_history（deque(maxlen=100/370)，元素為 (t, v) tuple）
+與 volume_5m（deque(maxlen=240)，每次判斷時對最近 60 根求和）；兩邊都先寫滿再量測。
+精確回看在 deque 版本以 bisect 對時間做二分搜尋（舊做法直接取 hist[0]，不精確）
+"""
+import argparse
+import bisect
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from screener import MarketArrays, PRICE_WINDOW, SAMPLE_INTERVAL, VOL_HOUR_BARS
+
+T0 = 1_760_000_000.0
+
+
+def build_deques(n, rng):
+    tracemalloc.start()
+    price = {s: deque(maxlen=100) for s in range(n)}
+    oi = {s: deque(maxlen=370) for s in range(n)}
+    vol = {s: deque(maxlen=240) for s in range(n)}
+    for s in range(n):
+        for i in range(370):
+            t = T0 + i * SAMPLE_INTERVAL
+            price[s].append((t, float(rng.random())))
+            oi[s].append((t, float(rng.random())))
+        for i in range(240):
+            vol[s].append(float(rng.random()))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return price, oi, vol, size
+
+
+def build_arrays(n, rng):
+    tracemalloc.start()
+    market = MarketArrays(n)
+    for s in range(n):
+        market.add(f"S{s:04d}USDT", T0)
+    slots = np.arange(n)
+    for i in range(370):
+        t = T0 + i * SAMPLE_INTERVAL
+        market.price_hist.append_many(slots, t, rng.random(n))
+        market.oi_hist.append_many(slots, t, rng.random(n))
+    for i in range(240):
+        market.vol_5m.append_many(slots, T0 + i * 300, rng.random(n))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return market, size
+
+
+def timed(fn, rounds):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - t0) / rounds
+
+
+def main(args):
+    n = args.symbols
+    rng = np.random.default_rng(0)
+    price, oi, vol, deque_bytes = build_deques(n, rng)
+    market, array_bytes = build_arrays(n, rng)
+    slots = np.arange(n)
+    now = T0 + 370 * SAMPLE_INTERVAL
+    values = rng.random(n)
+
+    def deque_tick():
+        for s in range(n):
+            price[s].append((now, values[s]))
+            oi[s].append((now, values[s]))
+
+    def array_tick():
+        market.price_hist.append_many(slots, now, values)
+        market.oi_hist.append_many(slots, now, values)
+
+    def array_tick_single():
+        for s in range(n):
+            market.price_hist.append(s, now, values[s])
+            market.oi_hist.append(s, now, values[s])
+
+    when = now - PRICE_WINDOW
+
+    def deque_lookback():
+        for s in range(n):
+            hist = price[s]
+            i = bisect.bisect_right([t for t, _ in hist], when)
+            hist[i - 1] if i else None
+
+    def array_lookback():
+        market.price_hist.as_of(slots, when)
+
+    def deque_volume():
+        for s in range(n):
+            hist = vol[s]
+            sum(islice(hist, len(hist) - VOL_HOUR_BARS, None))
+
+    def array_volume():
+        market.vol_5m.sums[VOL_HOUR_BARS][slots]
+
+    rows = [("每 10 秒寫入一輪（價格 + 持倉）", deque_tick, array_tick),
+            ("全市場 15 分鐘前價格（精確回看）", deque_lookback, array_lookback),
+            ("全市場最近 60 根成交量加總", deque_volume, array_volume)]
+    print(f"{n:,} 幣，各 {args.rounds} 輪")
+    print(f"  記憶體：deque {deque_bytes / 1e6:6.1f} MB，陣列 {array_bytes / 1e6:6.1f} MB")
+    for name, slow, fast in rows:
+        d, a = timed(slow, args.rounds), timed(fast, args.rounds)
+        print(f"  {name}：deque {d * 1e3:7.2f} ms，陣列 {a * 1e3:6.3f} ms（{d / a:5.1f}x）")
+    single = timed(array_tick_single, args.rounds)
+    print(f"  （逐 slot append 寫入一輪：{single * 1e3:.2f} ms）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    main(parser.parse_args())
@@ -1,199 +1,363 @@
 import asyncio
+import heapq
 import time
-import talib
+from collections import OrderedDict
+import clock
 import numpy as np
-from binance import BinanceSocketManager
-from config import EXCLUDE_SYMBOLS, BATCH_SIZE, RESTART_INTERVAL, QUOTE_VOLUME
-from models import symbol_state, semaphore, running, price_history, oi_history, last_alert
-from utils import setup_logging
-from collections import deque
+from config import OI_MAX_PER_MIN, OI_MIN_INTERVAL, OI_MAX_INTERVAL, MARK_PRICE_ARR, LIQUIDATIONS, BATCH_SIZE
+from models import symbol_state, register_symbol, unregister_symbol, market, running
+from aggregator import Candle, CandleAggregator, TIMEFRAMES
+from ws_manager import ConnectionManager
+from universe import universe
+from gateway import gateway
+from recorder import feed
+from klinestore import kline_store
+from screener import LIQ_BUY, LIQ_SELL
+import metrics
+from metrics import TIMING, WS_DECODE, WS_UPDATE, WS_AGE, OI_FETCH
+from utils import setup_logging, json_loads
 
 log = setup_logging()
 
 # ================== 合約幣對 初始化 ==================
 
-async def initialize_symbols(client):
+async def initialize_symbols():
+    added = []
     try:
-        ticker24 = await client.futures_ticker()
-        valid = set()
-        for t in ticker24:
-            s = t["symbol"]
-            if (s.endswith("USDT") 
-                and float(t["quoteVolume"]) >= QUOTE_VOLUME # 24h 成交量
-                and not any(ex in s for ex in EXCLUDE_SYMBOLS)):
-                valid.add(s)
+        # 共用 ticker 快取，不再每輪打一次完整 REST
+        if not universe.updated_at:
+            await universe.reconcile()
+        valid = universe.valid
 
-        now = time.time()
+        now = clock.now()
         for s in valid:
             if s not in symbol_state:
-                symbol_state[s] = {
-                    "last_price": None,
-                    "last_oi": None,
-                    "funding_rate": 0.0,
-                    "monitor_start": now - 120,
-                    "volume_5m": deque(maxlen=240),
-                    "last_kline_close_time": 0,  # 避免重複處理同一根
-                    "kline_1h_closes": deque(maxlen=100),
-                    "ema_1h": {15: None, 30: None, 45: None, 60: None},
-                    "kline_4h_closes": deque(maxlen=100),
-                    "ema_4h": {15: None, 30: None, 45: None, 60: None},
-                }
+                register_symbol(s, now)
+                added.append(s)
 
         for s in list(symbol_state):
             if s not in valid:
-                symbol_state.pop(s, None)
-                price_history.pop(s, None)
-                oi_history.pop(s, None)
-                last_alert.pop(s, None)
+                unregister_symbol(s)
+                aggregator.discard(s)
+                drop_routes(s)
 
     except:
         pass
+    return added
+
+# ================== 收盤K棒寫入（WebSocket / 回補共用） ==================
+
+def apply_closed_kline(sym, interval, close_time, close_price, quote_vol):
+    """寫入一根已收盤K棒，close_time（秒）不大於上一根時略過，回傳是否寫入"""
+    state = symbol_state.get(sym)
+    if state is None:
+        return False
+    if interval == "5m":
+        # 避免重複處理同一根K（Binance 會重發）
+        if close_time <= state.last_kline_close_time:
+            return False
+        market.add_volume(state.slot, close_time, quote_vol)
+        state.last_kline_close_time = close_time
+        return True
+
+    track = state.klines[interval]
+    if close_time <= track.last_close_time:
+        return False
+    # 超簡單一行：自動丟最舊
+    track.closes.append(close_price)
+    # 每根收盤 O(1) 更新 EMA，不再整段重算
+    track.ema.update(close_price)
+    track.last_close_time = close_time
+    market.sync_emas(state)
+    return True
+
+kline_tasks = set()  # 補抓 / 補缺K棒的背景任務，保留參考避免執行中被回收
+
+def on_candle_close(sym, interval, candle, close_ms, complete):
+    if sym not in symbol_state:
+        return
+    if not complete:
+        # 訂閱後的第一根或中途漏了分K，改用 REST 取正確的整根
+        task = asyncio.create_task(repair_kline(sym, interval, candle.open_ms))
+        kline_tasks.add(task)
+        task.add_done_callback(kline_tasks.discard)
+        return
+    apply_closed_kline(sym, interval, close_ms // 1000, candle.close, candle.quote_vol)
+    kline_store.append_later(sym, interval, candle.row())
+
+async def repair_kline(sym, interval, open_ms):
+    try:
+        klines = await gateway.klines(sym, interval, 2)
+    except Exception as e:
+        log.error("[K線補抓錯誤] %s %s: %s", sym, interval, e)
+        return
+    for k in klines:
+        # [open_time, open, high, low, close, volume, close_time, quote_volume, ...]
+        if k[0] == open_ms:
+            on_candle_close(sym, interval, Candle.from_rest(k), k[6], True)
+
+def on_minute_gap(sym, open_ms):
+    """訂閱後第一根分K（或斷線恢復）：上次收盤到目前這一桶之間整根沒看到的K棒用 REST 補齊"""
+    state = symbol_state.get(sym)
+    if state is None:
+        return
+    for interval, span in TIMEFRAMES.items():
+        last = state.last_kline_close_time if interval == "5m" else state.klines[interval].last_close_time
+        if not last:
+            continue
+        next_open = (last + 1) * 1000
+        first = open_ms - open_ms % span
+        if first > next_open:
+            task = asyncio.create_task(fill_klines(sym, interval, next_open, first))
+            kline_tasks.add(task)
+            task.add_done_callback(kline_tasks.discard)
+
+async def fill_klines(sym, interval, start_ms, end_ms):
+    # 回補與第一根分K之間收盤的K棒（start_ms <= open_time < end_ms）；
+    # 多抓兩根涵蓋進行中的那一桶，與 repair_kline 同優先級、依序送出
+    missing = (end_ms - start_ms) // TIMEFRAMES[interval]
+    try:
+        klines = await gateway.klines(sym, interval, min(missing + 2, 1500))
+    except Exception as e:
+        log.error("[K線補缺錯誤] %s %s: %s", sym, interval, e)
+        return
+    for k in klines:
+        if start_ms <= k[0] < end_ms:
+            on_candle_close(sym, interval, Candle.from_rest(k), k[6], True)
+
+aggregator = CandleAggregator(on_candle_close, on_gap=on_minute_gap)
 
 # ================== 合約幣對 持倉量監控 ==================
 
-async def update_open_interest(client):
+async def update_open_interest():
+    # 每個幣種一個下次到期時間（heap），活躍的幣種輪詢間隔縮短、冷門的拉長，
+    # 整體受 OI_MAX_PER_MIN 限制
+    heap = []
+    scheduled = set()
+    pace = 60 / OI_MAX_PER_MIN
+    last_report = time.time()
+    inflight = set()
+
     while running:
-        symbols = list(symbol_state.keys())
-        if not symbols:
-            await asyncio.sleep(60)
-            continue
+        now = time.time()
+        for sym in symbol_state:
+            if sym not in scheduled:
+                scheduled.add(sym)
+                heapq.heappush(heap, (now, sym))
 
-        for i in range(0, len(symbols), 50):
-            batch = symbols[i:i+50]
-            tasks = [fetch_oi(client, sym) for sym in batch]
-            await asyncio.gather(*tasks, return_exceptions=True)
+        if now - last_report >= 60:
+            log_oi_freshness(now)
+            last_report = now
+
+        if not heap:
             await asyncio.sleep(1)
-        await asyncio.sleep(60)
+            continue
 
-async def fetch_oi(client, sym):
-    async with semaphore:
-        data = await client.futures_open_interest(symbol=sym)
-        oi = float(data["openInterest"])
-        now = time.time()
-        state = symbol_state[sym]
-        state["last_oi"] = oi
+        due, sym = heap[0]
+        if due > now:
+            await asyncio.sleep(min(due - now, 1))
+            continue
+        heapq.heappop(heap)
+        if sym not in symbol_state:
+            scheduled.discard(sym)
+            continue
 
-        hist = oi_history[sym]
-        if not hist or now - hist[-1][0] >= 10:
-            hist.append((now, oi))
+        task = asyncio.create_task(poll_oi(sym))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+        heapq.heappush(heap, (now + oi_poll_interval(sym), sym))
+        await asyncio.sleep(pace)
+
+def oi_poll_interval(sym):
+    slot = market.slots.get(sym)
+    heat = market.activity(slot) if slot is not None else 1.0
+    return OI_MAX_INTERVAL - (OI_MAX_INTERVAL - OI_MIN_INTERVAL) * heat
+
+def oi_staleness_metrics():
+    now = clock.now()
+    samples = [({"symbol": sym}, round(now - market.oi_t[slot], 1))
+               for sym, slot in market.slots.items() if market.oi_t[slot] == market.oi_t[slot]]
+    return metrics.family("oi_staleness_seconds", "gauge", "各幣種持倉量距上次更新秒數", samples)
+
+metrics.collectors.append(oi_staleness_metrics)
+
+def log_oi_freshness(now):
+    ages = market.oi_age(now)
+    if not len(ages):
+        return
+    hot = market.oi_age(now, hot_only=True)
+    if len(hot):
+        log.info("OI 新鮮度：中位數 %.0f 秒，p95 %.0f 秒，活躍 %d 幣中位數 %.0f 秒",
+                 np.median(ages), np.percentile(ages, 95), len(hot), np.median(hot))
+    else:
+        log.info("OI 新鮮度：中位數 %.0f 秒，p95 %.0f 秒", np.median(ages), np.percentile(ages, 95))
+
+async def poll_oi(sym):
+    # 背景輪詢：失敗只記錄，等下次排程再抓（不留下未取回的 task 例外）
+    try:
+        await fetch_oi(sym)
+    except Exception as e:
+        log.error("[持倉量錯誤] %s: %s", sym, e)
+
+async def fetch_oi(sym):
+    t0 = time.perf_counter()
+    data = await gateway.open_interest(sym)
+    OI_FETCH.observe(time.perf_counter() - t0)
+    oi = float(data["openInterest"])
+    now = clock.now()
+    state = symbol_state.get(sym)
+    if state is None:
+        return  # 請求期間已被移出監控
+    state.last_oi = oi
+    market.set_oi(state.slot, oi, now)
+    kline_store.append_later(sym, "oi", (int(now * 1000), oi))
 
 # ================== 合約幣對 價格K棒監控 ==================
 
-async def handle_price_websocket(client, batch_symbols):
-    bm = BinanceSocketManager(client, user_timeout=60)
-    # 同時訂閱 markPrice + kline_1m
-    streams = []
-    for sym in batch_symbols:
-        s = sym.lower()
-        streams.append(f"{s}@markPrice") # 價格
-        streams.append(f"{s}@kline_5m") # 5分K棒
-        streams.append(f"{s}@kline_1h") # 1小K棒
-        streams.append(f"{s}@kline_4h") # 4小K棒
+MARK_PRICE_ALL = "!markPrice@arr@1s"  # 全市場標記價格，每秒一個 frame
+FORCE_ORDER_ALL = "!forceOrder@arr"    # 全市場強平單，每個幣種每秒最多推送一筆
+
+def market_streams():
+    # 全市場 stream（不分幣種），分片模式只由主行程訂閱
+    return [s for s, on in ((MARK_PRICE_ALL, MARK_PRICE_ARR), (FORCE_ORDER_ALL, LIQUIDATIONS)) if on]
+
+def price_streams(sym):
+    # 每個幣種訂閱 markPrice + kline_1m；全市場 stream 在 ConnectionManager 裡
+    # 當成一個「幣種」，一樣有輪替與心跳檢查
+    if sym.startswith("!"):
+        return (sym,)
+    s = sym.lower()
+    if MARK_PRICE_ARR:
+        return (f"{s}@kline_1m",)
+    return (f"{s}@markPrice", # 價格
+            f"{s}@kline_1m")  # 1分K棒（本地合成 5m/1h/4h）
+
+# ================== WS 訊息分派 ==================
+# stream 名稱 → (處理函式, 幣種狀態) 的查表，第一次收到時建立，
+# 幣種移除時清掉；未收盤的 1 分K在解碼前就丟棄
+
+def on_mark_price(state, data):
+    slot = state.slot
+    market.funding_rate[slot] = float(data["r"]) * 100
+    market.set_price(slot, float(data["p"]), clock.now())
+
+def on_mark_price_arr(_, items):
+    # 整個市場一個 frame：幣種對應 slot 後，價格 / 資金費率整批轉成陣列寫入
+    get = market.slots.get
+    slots, prices, funding = [], [], []
+    for d in items:
+        slot = get(d["s"])
+        if slot is not None:
+            slots.append(slot)
+            prices.append(d["p"])
+            funding.append(d["r"])
+    if slots:
+        market.set_prices(np.array(slots), np.array(prices, dtype=np.float64),
+                          np.array(funding, dtype=np.float64) * 100, clock.now())
+
+LIQ_DEDUP_SECONDS = 10  # 強平單去重保留時間（秒）
+seen_liqs = OrderedDict()  # (symbol, 方向, 成交時間 ms) -> 收到時間，依收到順序排列
+
+def on_force_order(_, data):
+    # 強平單：成交均價 × 累計成交量為爆倉金額，依方向累加到目前的 1 分鐘桶。
+    # 連線輪替重疊期間新舊連線會各收到一次，同一筆（幣種 + 方向 + 成交時間）只算一次
+    now = clock.now()
+    while seen_liqs and now - next(iter(seen_liqs.values())) >= LIQ_DEDUP_SECONDS:
+        seen_liqs.popitem(last=False)
+    for d in data if isinstance(data, list) else (data,):
+        o = d["o"]
+        key = (o["s"], o["S"], o["T"])
+        if key in seen_liqs:
+            continue
+        seen_liqs[key] = now
+        slot = market.slots.get(o["s"])
+        if slot is not None:
+            market.add_liquidation(slot, LIQ_BUY if o["S"] == "BUY" else LIQ_SELL,
+                                   float(o["ap"]) * float(o["z"]), now)
+
+def on_kline_1m(state, data):
+    k = data["k"]
+    aggregator.add_minute(state.symbol, k["t"], float(k["o"]), float(k["h"]), float(k["l"]),
+                          float(k["c"]), float(k["v"]), float(k["q"]))
+
+STREAM_HANDLERS = {"markPrice": on_mark_price, "kline_1m": on_kline_1m}
+MARKET_HANDLERS = {MARK_PRICE_ALL: on_mark_price_arr, FORCE_ORDER_ALL: on_force_order}
+routes = {}
+
+def route(stream):
+    r = routes.get(stream)
+    if r is None:
+        handler = MARKET_HANDLERS.get(stream)
+        if handler is not None:
+            r = routes[stream] = (handler, None)
+            return r
+        sym, _, kind = stream.partition("@")
+        handler = STREAM_HANDLERS.get(kind)
+        state = symbol_state.get(sym.upper())
+        if handler is None or state is None:
+            return None
+        r = routes[stream] = (handler, state)
+    return r
+
+def drop_routes(sym):
+    s = sym.lower()
+    for kind in STREAM_HANDLERS:
+        routes.pop(f"{s}@{kind}", None)
+
+STREAM_PREFIX = '{"stream":"'
+
+def handle_price_websocket(raw):
     try:
-        async with bm.futures_multiplex_socket(streams) as stream:
-            while running:
-                try:
-                    msg = await stream.recv()
-                    if not msg or "data" not in msg:
-                        continue
-
-                    stream_name = msg["stream"]
-                    data = msg["data"]
-
-                    if stream_name.endswith("@markPrice"):
-                        sym = data["s"].upper()
-                        if sym not in symbol_state:
-                            continue
-
-                        price = float(data["p"])
-                        fund = float(data["r"]) * 100
-                        state = symbol_state[sym]
-                        state["last_price"] = price
-                        state["funding_rate"] = fund
-
-                        now = time.time()
-                        hist = price_history[sym]
-                        if not hist or now - hist[-1][0] >= 10:
-                            hist.append((now, price))
-                        # === 處理 5m K線（成交量）===
-                    elif stream_name.endswith("@kline_5m"):
-                        k = data["k"]
-                        sym = k["s"]
-                        if sym not in symbol_state:
-                            continue
-
-                        # 只有收盤的K才處理（x=True）
-                        if not k["x"]:
-                            continue
-
-                        close_time = k["T"] // 1000  # 毫秒 → 秒
-                        state = symbol_state[sym]
-
-                        # 避免重複處理同一根K（Binance 會重發）
-                        if close_time <= state["last_kline_close_time"]:
-                            continue
-
-                        quote_vol = float(k["q"])  # quoteVolume（USDT量）
-                        state["volume_5m"].append(quote_vol)
-                        state["last_kline_close_time"] = close_time
-                    elif stream_name.endswith("@kline_4h") or stream_name.endswith("@kline_1h"):
-                        k = data["k"]
-                        sym = k["s"]
-                        interval = k["i"]
-                        if sym not in symbol_state: continue
-                        if not k["x"]: continue  # 只處理收盤
-
-                        close_price = float(k["c"])
-                        state = symbol_state[sym]
-
-                        # 超簡單一行：自動丟最舊
-                        state[f"kline_{interval}_closes"].append(close_price)
-
-                        # 轉成 numpy array（talib 必備）
-                        closes = np.array(state[f"kline_{interval}_closes"])
-
-                        # 一行算出所有 EMA
-                        if len(closes) >= 60:  # 至少要有 60 根才算 EMA60
-                            state[f"ema_{interval}"][15] = talib.EMA(closes, timeperiod=15)[-1]
-                            state[f"ema_{interval}"][30] = talib.EMA(closes, timeperiod=30)[-1]
-                            state[f"ema_{interval}"][45] = talib.EMA(closes, timeperiod=45)[-1]
-                            state[f"ema_{interval}"][60] = talib.EMA(closes, timeperiod=60)[-1]
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    log.error(f"接收錯誤: {e}")
-                    break
+        # 組合串流格式固定為 {"stream":"...","data":{...}}，先從字串切出 stream 名稱
+        if not raw.startswith(STREAM_PREFIX):
+            return  # SUBSCRIBE 回應等非資料訊息
+        end = raw.find('"', len(STREAM_PREFIX))
+        r = route(raw[len(STREAM_PREFIX):end])
+        if r is None:
+            return
+        handler, state = r
+        if handler is on_kline_1m and '"x":false' in raw:
+            return  # 只有收盤的K才處理（x=True）
+        if not TIMING.due:
+            handler(state, json_loads(raw)["data"])
+            return
+        # 抽樣量測：解碼 / 寫入耗時與交易所事件時間的延遲
+        TIMING.due = False
+        t0 = time.perf_counter()
+        data = json_loads(raw)["data"]
+        t1 = time.perf_counter()
+        handler(state, data)
+        WS_DECODE.observe(t1 - t0)
+        WS_UPDATE.observe(time.perf_counter() - t1)
+        event_ms = data["E"] if handler is not on_mark_price_arr else data[0]["E"]
+        WS_AGE.observe(max(0.0, clock.now() - event_ms / 1000))
     except Exception as e:
-        log.error(f"Price WebSocket 連線失敗: {e}")
+        log.error("接收錯誤: %s", e)
 
-async def monitor_price_websocket(client):
+async def monitor_price_websocket(per_symbol=True, market_wide=True):
+    """per_symbol：訂閱各幣種的 stream；market_wide：訂閱全市場 stream（分片模式由主行程負責）"""
     log.info("啟動 Price WebSocket 監控...")
-    while running:
-        try:
-            symbols = list(symbol_state.keys())
-            if not symbols:
-                log.warning("symbol_state 為空，10 秒後重試...")
-                await asyncio.sleep(10)
-                continue
-
-            batches = [symbols[i:i + BATCH_SIZE] for i in range(0, len(symbols), BATCH_SIZE)]
-            log.info(f"🚀 啟動 {len(batches)} 個 Price WebSocket 批次（共 {len(symbols)} 幣）")
-
-            tasks = []
-            for idx, batch in enumerate(batches):
-                tasks.append(asyncio.create_task(handle_price_websocket(client, batch)))
-
-            log.info(f"✅ 所有 {len(tasks)} 個批次已啟動，持續監控中...")
-
-            # 定期重啟（例如每15分鐘）
-            await asyncio.sleep(RESTART_INTERVAL)
-
-            log.info("♻️ 開始重啟所有 Price WebSocket 連線...")
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            log.info("🔄 所有批次已結束，準備重新啟動...")
-
-        except Exception as e:
-            log.error(f"Price WebSocket 總錯誤: {e}")
-            await asyncio.sleep(10)
+    on_message = handle_price_websocket
+    if feed.enabled:
+        def on_message(raw):
+            feed.ws(raw)
+            handle_price_websocket(raw)
+    # 每條連線的 stream 數維持 BATCH_SIZE × 2，全市場模式每個幣種只剩 kline_1m 一條
+    manager = ConnectionManager(on_message, price_streams, BATCH_SIZE * 2 if MARK_PRICE_ARR else BATCH_SIZE)
+    extra = market_streams() if market_wide else []
+    metrics.collectors.append(manager.collect)
+    rotate_task = asyncio.create_task(manager.rotate())
+    watchdog_task = asyncio.create_task(manager.watchdog())
+    try:
+        while running:
+            try:
+                # 幣種增減直接改訂閱，不用整批重連
+                await manager.sync([*(symbol_state if per_symbol else ()), *extra])
+            except Exception as e:
+                log.error("Price WebSocket 總錯誤: %s", e)
+            await asyncio.sleep(5)
+    finally:
+        metrics.collectors.remove(manager.collect)
+        rotate_task.cancel()
+        watchdog_task.cancel()
+        await manager.close()
@@ -0,0 +1,20 @@
+import time
+
+# ================== 時鐘 ==================
+# 資料路徑（價格 / 持倉 / 篩選 / 告警冷卻）取「現在」一律呼叫 clock.now()，
+# 回放時換成虛擬時鐘，時間依錄製的時間戳前進；量測耗時仍用 time.time()
+
+now = time.time
+
+
+class VirtualClock:
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def use(fn):
+    global now
+    now = fn
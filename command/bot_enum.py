@@ -3,4 +3,10 @@ from enum import StrEnum
 class TGBotCommand(StrEnum):
     COMMAND = "command"
     SEARCH = "s"
-    CHECK = "c"
\ No newline at end of file
+    CHECK = "c"
+    SUBSCRIBE = "sub"
+    UNSUBSCRIBE = "unsub"
+    RULE = "rule"
+    ALLOW = "allow"
+    DENY = "deny"
+    TOP = "top"
\ No newline at end of file
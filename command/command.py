@@ -2,9 +2,10 @@ from telegram import Update
 from telegram.ext import (
     ContextTypes,
 )
-from models import symbol_state, price_history
+from models import symbol_state, market
 from conditions import check_conditions_manual
-from binance import AsyncClient
+from subscriptions import subscriptions, RULE_FIELDS, OPTIONAL_FIELDS
+from ranking import ranking
 
 async def command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -14,6 +15,11 @@ async def command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "可用指令：\n"
         "/s <coin> 搜尋指定幣種的歷史資料，ex: btc\n"
         "/c <coin> 檢查是否符合發送條件，ex: btc\n"
+        "/sub 此聊天室訂閱告警，/unsub 取消訂閱\n"
+        "/rule 查看或修改門檻，ex: /rule price=6 volume=5 oi=8 liq=500000 cooldown=3600\n"
+        "/allow <coin> 只接收指定幣種（/allow clear 清除）\n"
+        "/deny <coin> 不接收指定幣種（/deny clear 清除）\n"
+        "/top 15 分鐘漲幅、1 小時量比、1 小時持倉變化排行\n"
         "試試看吧！"
     )
 
@@ -30,7 +36,8 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     for symbol in symbols:
         # 檢查是否有歷史資料
-        price_hist = price_history.get(symbol, [])
+        slot = market.slots.get(symbol)
+        price_hist = list(zip(*market.price_hist.series(slot))) if slot is not None else []
         
         if not price_hist:
             await update.message.reply_text(f"{symbol}：無歷史資料")
@@ -62,9 +69,6 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 處理多個幣對
     symbols = [arg.upper() if "USDT" in arg.upper() else f"{arg.upper()}USDT" for arg in args]
     
-    # 建立 Binance 客戶端
-    client = await AsyncClient.create()
-    
     try:
         for symbol in symbols:
             # 檢查幣對是否存在
@@ -73,7 +77,7 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 continue
                 
             # 執行手動檢查
-            result, logs = await check_conditions_manual(client, symbol)
+            result, logs = await check_conditions_manual(symbol)
             
             # 組合日誌訊息
             log_message = f"{symbol} 條件檢查結果：\n\n" + "\n".join(logs)
@@ -93,5 +97,91 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
     except Exception as e:
         await update.message.reply_text(f"檢查過程發生錯誤：{str(e)}")
-    finally:
-        await client.close_connection()
\ No newline at end of file
+
+# ================== 訂閱指令 ==================
+
+def _symbols(args):
+    return [arg.upper() if "USDT" in arg.upper() else f"{arg.upper()}USDT" for arg in args]
+
+def _rule_of(update):
+    chat_id = str(update.effective_chat.id)
+    return chat_id, subscriptions.rules.get(chat_id)
+
+# /sub 指令主處理器
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = str(update.effective_chat.id)
+    rule = subscriptions.subscribe(chat_id)
+    await update.message.reply_text(f"✅ 已訂閱告警，目前規則：\n{rule.describe()}")
+
+# /unsub 指令主處理器
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = str(update.effective_chat.id)
+    if subscriptions.unsubscribe(chat_id) is None:
+        await update.message.reply_text("此聊天室尚未訂閱")
+        return
+    await update.message.reply_text("已取消訂閱")
+
+# /rule 指令主處理器
+async def rule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id, current = _rule_of(update)
+    if current is None:
+        await update.message.reply_text("此聊天室尚未訂閱，請先輸入 /sub")
+        return
+    if not context.args:
+        await update.message.reply_text(f"目前規則：\n{current.describe()}\n\n"
+                                        "用法：\n/rule price=6 volume=5 oi=8 liq=500000 cooldown=3600\n"
+                                        "oi=none / liq=none 為不限持倉變化 / 爆倉金額")
+        return
+
+    fields = {}
+    for arg in context.args:
+        key, _, value = arg.partition("=")
+        key = key.lower()
+        if key not in RULE_FIELDS or not value:
+            await update.message.reply_text(f"無法解析：{arg}\n可用欄位：{', '.join(RULE_FIELDS)}")
+            return
+        if key in OPTIONAL_FIELDS and value.lower() == "none":
+            fields[key] = None
+            continue
+        try:
+            fields[key] = float(value)
+        except ValueError:
+            await update.message.reply_text(f"{key} 需為數字：{value}")
+            return
+        if fields[key] < 0:
+            await update.message.reply_text(f"{key} 不可為負數：{value}")
+            return
+
+    current = subscriptions.update(chat_id, **fields)
+    await update.message.reply_text(f"✅ 規則已更新：\n{current.describe()}")
+
+async def _edit_list(update, context, field):
+    chat_id, current = _rule_of(update)
+    if current is None:
+        await update.message.reply_text("此聊天室尚未訂閱，請先輸入 /sub")
+        return
+    args = context.args
+    if not args:
+        await update.message.reply_text(f"目前規則：\n{current.describe()}\n\n"
+                                        f"用法：\n/{field} btc eth\n/{field} clear 清除")
+        return
+
+    if args[0].lower() == "clear":
+        value = None if field == "allow" else set()
+    else:
+        value = (getattr(current, field) or set()) | set(_symbols(args))
+    current = subscriptions.update(chat_id, **{field: value})
+    await update.message.reply_text(f"✅ 規則已更新：\n{current.describe()}")
+
+# /allow 指令主處理器
+async def allow(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _edit_list(update, context, "allow")
+
+# /deny 指令主處理器
+async def deny(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _edit_list(update, context, "deny")
+
+# /top 指令主處理器
+async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 同一更新週期內直接回覆快取的排行
+    await update.message.reply_text(ranking.reply())
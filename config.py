@@ -9,6 +9,41 @@ OI_THRESHOLD = 8 # 持倉量變化百分比
 PRICE_THRESHOLD = 6 # 價格異動百分比
 VOLUME_THRESHOLD = 5 # 成交量倍數
 QUOTE_VOLUME = 8_000_000 # 24h成交量額
-ALERT_COOLDOWN = 3600 # 同一幣種告警冷卻時間
-BATCH_SIZE = 20 # 批次數量
-RESTART_INTERVAL = 900 # 固定重啟秒數
\ No newline at end of file
+ALERT_COOLDOWN = 3600 # 同一幣種告警冷卻時間（新訂閱的預設值）
+ALERT_QUEUE_SIZE = 500 # 告警派送佇列上限
+ALERT_DIGEST_MAX = 20 # 同時排隊的告警最多合併幾則成一則摘要
+SUBSCRIPTIONS_PATH = "subscriptions.json" # 各聊天室訂閱規則（/sub、/rule 等指令編輯）
+BATCH_SIZE = 20 # 每條 WS 連線的幣種數（逐幣 markPrice 模式；全市場模式每條連線的 stream 數不變）
+MARK_PRICE_ARR = os.getenv("MARK_PRICE_ARR", "1") != "0" # 標記價格改用 !markPrice@arr@1s 全市場串流，0 為逐幣訂閱 @markPrice
+LIQUIDATIONS = os.getenv("LIQUIDATIONS", "1") != "0" # 訂閱 !forceOrder@arr 統計 5m / 15m / 1h 爆倉金額
+LIQ_THRESHOLD = None # 15 分鐘空單爆倉金額門檻（USDT，新訂閱的預設值），None 為不作為條件
+RESTART_INTERVAL = 900 # 連線輪替週期秒數（先連後斷，逐條錯開）
+BACKFILL_CONCURRENCY = 10 # K線回補同時請求數
+REST_BASE_URL = "https://fapi.binance.com" # 合約 REST 位址
+REST_WEIGHT_LIMIT = 2000 # REST 每分鐘權重預算（IP 上限 2400）
+REST_CONCURRENCY = 20 # REST 同時請求數
+SNAPSHOT_PATH = "state_snapshot.npz" # 狀態快照檔
+SNAPSHOT_INTERVAL = 60 # 快照間隔秒數
+SCREEN_DEBOUNCE = 0.05 # 事件篩選合併等待秒數
+SCREEN_MAX_LATENCY = 0.5 # 資料進來到篩選的最長延遲秒數
+UNIVERSE_RECONCILE_INTERVAL = 600 # 24h ticker REST 校正間隔秒數
+OI_MAX_PER_MIN = 300 # 持倉量輪詢每分鐘請求上限
+OI_MIN_INTERVAL = 10 # 活躍幣種持倉量輪詢間隔秒數
+OI_MAX_INTERVAL = 180 # 冷門幣種持倉量輪詢間隔秒數
+WS_URL = "wss://fstream.binance.com/stream" # 合約 WebSocket 位址
+WS_STALL_TIMEOUT = 30 # 單條連線無資料多久視為卡住（秒）
+RECORD_DIR = os.getenv("RECORD_DIR") # 設定後把 WS 原始訊息與 REST 回應錄製到此目錄（回放 / 回歸測試用）
+RECORD_SEGMENT_SECONDS = 3600 # 錄製檔每段涵蓋秒數
+KLINE_STORE_DIR = "kline_store" # 本地歷史K線 / 持倉量儲存目錄
+KLINE_STORE_FLUSH = 5 # 即時收盤K線 / 持倉量暫存多久整批寫檔（秒）
+METRICS_HOST = "127.0.0.1" # Prometheus 指標端點位址
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108")) # 指標端點埠號，0 為不啟用
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0")) # WS 接收分片的 worker 行程數，0 為單行程
+SHARD_CAPACITY = 2048 # 分片模式共享記憶體的幣種 slot 數（固定，不能動態擴充）
+DEPTH_HOT_MAX = int(os.getenv("DEPTH_HOT_MAX", "10")) # 同時維護本地委託簿（@depth@100ms）的幣種上限，0 為關閉
+DEPTH_HEAT = 0.7 # 活躍度（價格 / 成交量 / 持倉相對門檻的比例）達此值即訂閱委託簿
+DEPTH_COOL_SECONDS = 300 # 活躍度低於 DEPTH_HEAT 超過此秒數即退訂
+DEPTH_TOP_N = 10 # 買賣壓力取最優前 N 檔
+DEPTH_SNAPSHOT_LIMIT = 1000 # 委託簿 REST 快照檔數
+RANK_TOP_K = 10 # /top 每個排行列出的幣種數
+RANK_INTERVAL = 5 # /top 排行更新週期秒數（同一週期內回覆快取）
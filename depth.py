@@ -0,0 +1,261 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from itertools import chain
+import numpy as np
+import clock
+from config import DEPTH_HOT_MAX, DEPTH_HEAT, DEPTH_COOL_SECONDS, DEPTH_TOP_N, DEPTH_SNAPSHOT_LIMIT
+from models import symbol_state, market, running
+from gateway import gateway
+from ws_manager import ConnectionManager
+import metrics
+from utils import setup_logging, json_loads
+
+log = setup_logging()
+
+# ================== 熱門幣種本地委託簿 ==================
+# 全市場都訂閱 depth 太貴，只替活躍度接近觸發門檻的少數幣種（最多 DEPTH_HOT_MAX 個）
+# 訂閱 @depth@100ms 增量 stream，並以 REST 快照建立本地委託簿：
+#   1. 先訂閱、暫存收到的事件，再抓 /fapi/v1/depth 快照（lastUpdateId）
+#   2. 丟掉 u < lastUpdateId 的事件，第一筆須滿足 U <= lastUpdateId <= u
+#   3. 之後每筆的 pu 須等於上一筆的 u，否則序號斷裂、重新抓快照
+# 每一側是依價格排序的 numpy 陣列（賣方以負價格為鍵，兩側最優價都在尾端），
+# 前 N 檔買賣壓力只需加總尾端 N 格。幣種冷卻後依最近活躍時間 LRU 退訂
+
+REFRESH_INTERVAL = 5      # 熱門名單更新間隔（秒）
+RESYNC_BACKOFF = 1.0      # 快照對不上序號時，隔多久再抓（秒）
+MAX_BUFFER = 1000         # 等快照期間最多暫存幾筆事件
+MAX_LEVELS = DEPTH_SNAPSHOT_LIMIT * 2  # 每側最多保留檔數，超過時捨棄最遠的價位
+
+
+def depth_streams(sym):
+    return (f"{sym.lower()}@depth@100ms",)
+
+
+def _levels(levels):
+    # [["價格", "數量"], ...] → 兩個 float 陣列
+    if not levels:
+        return None, None
+    a = np.fromiter(map(float, chain.from_iterable(levels)), np.float64, len(levels) * 2)
+    return a[0::2], a[1::2]
+
+
+class BookSide:
+    """一側委託簿：keys 遞增排列（買方為價格、賣方為負價格），最優價在尾端"""
+    __slots__ = ("sign", "keys", "qty")
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = np.empty(0)
+        self.qty = np.empty(0)
+
+    def load(self, levels):
+        px, qty = _levels(levels)
+        if px is None:
+            self.keys, self.qty = np.empty(0), np.empty(0)
+            return
+        keys = px * self.sign
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.qty = keys[order][-MAX_LEVELS:], qty[order][-MAX_LEVELS:]
+
+    def apply(self, levels):
+        px, qty = _levels(levels)
+        if px is None:
+            return
+        # 新舊價位接在一起做穩定排序（兩段已排序，timsort 近似線性合併），
+        # 同價位留後面的（增量），數量 0 的刪掉
+        keys = np.concatenate((self.keys, px * self.sign))
+        q = np.concatenate((self.qty, qty))
+        order = np.argsort(keys, kind="stable")
+        keys, q = keys[order], q[order]
+        keep = np.empty(len(keys), bool)
+        keep[-1] = True
+        np.not_equal(keys[1:], keys[:-1], out=keep[:-1])
+        keep &= q > 0
+        self.keys, self.qty = keys[keep][-MAX_LEVELS:], q[keep][-MAX_LEVELS:]
+
+    def best(self):
+        return self.keys[-1] * self.sign if len(self.keys) else None
+
+    def top(self, n):
+        return float(self.qty[-n:].sum())
+
+
+class LocalBook:
+    __slots__ = ("symbol", "bids", "asks", "last_u", "live", "first", "buffer", "fetching",
+                 "retry_at", "hot_at", "updates")
+
+    def __init__(self, symbol, now):
+        self.symbol = symbol
+        self.bids = BookSide(1)
+        self.asks = BookSide(-1)
+        self.hot_at = now   # 最近一次活躍度達標的時間（LRU 依據）
+        self.fetching = False
+        self.retry_at = 0.0
+        self.updates = 0
+        self.reset()
+
+    def reset(self):
+        self.last_u = 0
+        self.live = False
+        self.first = True
+        self.buffer = deque(maxlen=MAX_BUFFER)
+
+    def load(self, snapshot):
+        """套用 REST 快照與暫存事件，序號對不上時回傳 False"""
+        self.bids.load(snapshot["bids"])
+        self.asks.load(snapshot["asks"])
+        self.last_u = snapshot["lastUpdateId"]
+        self.first = True
+        buffered, self.buffer = self.buffer, deque(maxlen=MAX_BUFFER)
+        for ev in buffered:
+            if not self.feed(ev):
+                return False
+        self.live = True
+        return True
+
+    def feed(self, ev):
+        """套用一筆增量事件 (U, u, pu, bids, asks)，序號斷裂時回傳 False"""
+        U, u, pu, bids, asks = ev
+        if self.first:
+            if u < self.last_u:
+                return True  # 快照之前的事件
+            if U > self.last_u:
+                return False
+            self.first = False
+        elif u <= self.last_u:
+            return True      # 連線輪替重疊期間的重複事件
+        elif pu != self.last_u:
+            return False
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        self.last_u = u
+        self.updates += 1
+        return True
+
+    def imbalance(self, n=DEPTH_TOP_N):
+        """前 n 檔 (買 - 賣) / (買 + 賣) 數量，-1 ~ 1"""
+        bid, ask = self.bids.top(n), self.asks.top(n)
+        total = bid + ask
+        return (bid - ask) / total if total > 0 else None
+
+
+class DepthMonitor:
+    def __init__(self, max_books=DEPTH_HOT_MAX):
+        self.max_books = max_books
+        self.books = OrderedDict()  # symbol -> LocalBook，越後面越近期活躍
+        self.manager = None
+        self.tasks = set()
+        self.resyncs = 0
+        self.evictions = 0
+
+    # ---------- 增量事件 ----------
+
+    def on_message(self, raw):
+        data = json_loads(raw).get("data")
+        if not data or data.get("e") != "depthUpdate":
+            return
+        book = self.books.get(data["s"])
+        if book is None:
+            return  # 已退訂，UNSUBSCRIBE 生效前的殘留訊息
+        ev = (data["U"], data["u"], data["pu"], data["b"], data["a"])
+        if not book.live:
+            book.buffer.append(ev)
+            if not book.fetching and time.time() >= book.retry_at:
+                self._fetch(book)
+        elif not book.feed(ev):
+            log.warning("[委託簿] %s 序號斷裂（pu %s ≠ %s），重新同步", book.symbol, ev[2], book.last_u)
+            self.resyncs += 1
+            book.reset()
+            book.buffer.append(ev)
+            self._fetch(book)
+
+    def _fetch(self, book):
+        book.fetching = True
+        task = asyncio.create_task(self._snapshot(book))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _snapshot(self, book):
+        try:
+            snapshot = await gateway.depth(book.symbol, DEPTH_SNAPSHOT_LIMIT)
+        except Exception as e:
+            log.error("[委託簿] %s 快照失敗: %s", book.symbol, e)
+            book.retry_at = time.time() + RESYNC_BACKOFF
+            return
+        finally:
+            book.fetching = False
+        if self.books.get(book.symbol) is not book:
+            return  # 等快照期間已退訂
+        if not book.load(snapshot):
+            # 快照比暫存的事件舊（或新到中間有缺口），等 stream 追上後重抓
+            self.resyncs += 1
+            book.reset()
+            book.retry_at = time.time() + RESYNC_BACKOFF
+
+    # ---------- 熱門名單 ----------
+
+    def refresh(self, now):
+        slots = np.flatnonzero(market.active)
+        if len(slots):
+            heat = market.heat(now, slots)
+            hot = slots[heat >= DEPTH_HEAT]
+            if len(hot) > self.max_books:
+                hot = hot[np.argpartition(-market.heat(now, hot), self.max_books)[:self.max_books]]
+            for slot in hot.tolist():
+                sym = market.symbols[slot]
+                book = self.books.get(sym)
+                if book is None:
+                    self.books[sym] = LocalBook(sym, now)
+                else:
+                    book.hot_at = now
+                    self.books.move_to_end(sym)
+        for sym in [s for s in self.books if s not in symbol_state]:
+            del self.books[sym]
+        # 最久沒活躍的在最前面：超過上限或冷卻過久就退訂
+        while self.books:
+            sym, book = next(iter(self.books.items()))
+            if len(self.books) <= self.max_books and now - book.hot_at <= DEPTH_COOL_SECONDS:
+                break
+            del self.books[sym]
+            self.evictions += 1
+
+    def imbalance(self, symbol, n=DEPTH_TOP_N):
+        """已同步的委託簿前 n 檔買賣壓力，沒有則為 None"""
+        book = self.books.get(symbol)
+        return book.imbalance(n) if book is not None and book.live else None
+
+    def collect(self):
+        return (metrics.family("depth_books", "gauge", "維護中的本地委託簿數",
+                               [({"state": "live"}, sum(b.live for b in self.books.values())),
+                                ({"state": "syncing"}, sum(not b.live for b in self.books.values()))])
+                + metrics.family("depth_updates_total", "counter", "各委託簿已套用的增量事件數",
+                                 [({"symbol": s}, b.updates) for s, b in self.books.items()])
+                + metrics.family("depth_resyncs_total", "counter", "序號斷裂重新抓快照次數", [({}, self.resyncs)])
+                + metrics.family("depth_evictions_total", "counter", "冷卻或超過上限而退訂的委託簿數",
+                                 [({}, self.evictions)]))
+
+    async def run(self):
+        log.info(f"啟動委託簿監控（最多 {self.max_books} 幣）...")
+        self.manager = ConnectionManager(self.on_message, depth_streams, self.max_books)
+        metrics.collectors.append(self.collect)
+        rotate_task = asyncio.create_task(self.manager.rotate())
+        watchdog_task = asyncio.create_task(self.manager.watchdog())
+        try:
+            while running:
+                try:
+                    self.refresh(clock.now())
+                    await self.manager.sync(list(self.books))
+                except Exception as e:
+                    log.error("委託簿監控錯誤: %s", e)
+                await asyncio.sleep(REFRESH_INTERVAL)
+        finally:
+            metrics.collectors.remove(self.collect)
+            rotate_task.cancel()
+            watchdog_task.cancel()
+            for task in self.tasks:
+                task.cancel()
+            await self.manager.close()
+
+
+depth = DepthMonitor()
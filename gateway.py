@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import time
+import aiohttp
+from config import REST_BASE_URL, REST_WEIGHT_LIMIT, REST_CONCURRENCY
+from recorder import feed
+import metrics
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== REST 閘道（權重預算 + 優先佇列） ==================
+# 所有 REST 請求都經過這裡：共用一個 aiohttp session，依回應的
+# X-MBX-USED-WEIGHT-1M 校正每分鐘已用權重，超過預算就等到下一分鐘；
+# 排隊時依優先等級取出，429/418 依 Retry-After 暫停全部請求
+
+PRIORITY_COMMAND = 0  # 使用者指令
+PRIORITY_OI = 1       # 持倉量輪詢 / ticker 校正
+PRIORITY_BACKFILL = 2 # 歷史K線回補
+
+MAX_RETRIES = 3
+
+
+class RestError(Exception):
+    pass
+
+
+class RestGateway:
+    def __init__(self, base_url=REST_BASE_URL, weight_limit=REST_WEIGHT_LIMIT, concurrency=REST_CONCURRENCY):
+        self.base_url = base_url
+        self.weight_limit = weight_limit
+        self.concurrency = concurrency
+        self.session = None
+        self.queue = None
+        self.worker = None
+        self.seq = itertools.count()
+        self.minute = 0
+        self.used = 0             # 本分鐘已用（含已送出未回應）的權重
+        self.blocked_until = 0.0  # 429/418 後的暫停時間
+        self.total_requests = 0
+        self.source = None        # 回放時改由錄製的回應作答：source(path, params) -> data
+
+    def _start(self):
+        if self.worker is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=10),
+            )
+            self.queue = asyncio.PriorityQueue()
+            self.slots = asyncio.Semaphore(self.concurrency)
+            self.worker = asyncio.create_task(self._dispatch())
+
+    def collect(self):
+        return (metrics.family("rest_weight_used", "gauge", "本分鐘已用 REST 權重", [({}, self.used)])
+                + metrics.family("rest_weight_limit", "gauge", "REST 每分鐘權重預算", [({}, self.weight_limit)])
+                + metrics.family("rest_requests_total", "counter", "已送出的 REST 請求數", [({}, self.total_requests)])
+                + metrics.family("rest_queue_depth", "gauge", "排隊中的 REST 請求數",
+                                 [({}, self.queue.qsize() if self.queue is not None else 0)]))
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get(self, path, params=None, weight=1, priority=PRIORITY_OI):
+        if self.source is not None:
+            return self.source(path, params)
+        self._start()
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((priority, next(self.seq), path, params, weight, fut, 0))
+        return await fut
+
+    # ---------- 權重預算 ----------
+
+    def _roll_minute(self, now):
+        # Binance 權重以整分鐘重置
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute, self.used = minute, 0
+
+    async def _reserve(self, weight):
+        while True:
+            now = time.time()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._roll_minute(now)
+            if self.used + weight <= self.weight_limit:
+                self.used += weight
+                return
+            await asyncio.sleep(60 - now % 60 + 0.05)
+
+    def _observe(self, resp):
+        used = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None:
+            self._roll_minute(time.time())
+            # 伺服器數字包含其他程式同 IP 的用量，取較大值
+            self.used = max(self.used, int(used))
+
+    # ---------- 派送 ----------
+
+    async def _dispatch(self):
+        while True:
+            item = await self.queue.get()
+            await self.slots.acquire()
+            await self._reserve(item[4])
+            asyncio.create_task(self._send(*item))
+
+    async def _send(self, priority, seq, path, params, weight, fut, attempt):
+        try:
+            async with self.session.get(self.base_url + path, params=params) as resp:
+                self.total_requests += 1
+                self._observe(resp)
+                if resp.status in (429, 418):
+                    retry_after = float(resp.headers.get("Retry-After", 60 if resp.status == 429 else 120))
+                    self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+                    log.warning("[REST 限流] %s %s，暫停 %.0f 秒", resp.status, path, retry_after)
+                    if attempt + 1 >= MAX_RETRIES:
+                        raise RestError(f"{resp.status} {path}")
+                    await self.queue.put((priority, seq, path, params, weight, fut, attempt + 1))
+                    return
+                data = await resp.json(content_type=None)
+                if resp.status >= 400:
+                    raise RestError(f"{resp.status} {path}: {data}")
+                if feed.enabled:
+                    feed.rest(path, params, data)
+            if not fut.done():
+                fut.set_result(data)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        finally:
+            self.slots.release()
+
+    # ---------- 常用端點 ----------
+
+    async def futures_ticker(self, priority=PRIORITY_OI):
+        return await self.get("/fapi/v1/ticker/24hr", weight=40, priority=priority)
+
+    async def open_interest(self, symbol, priority=PRIORITY_OI):
+        return await self.get("/fapi/v1/openInterest", {"symbol": symbol}, weight=1, priority=priority)
+
+    async def klines(self, symbol, interval, limit, priority=PRIORITY_BACKFILL):
+        return await self.get("/fapi/v1/klines", {"symbol": symbol, "interval": interval, "limit": limit},
+                              weight=kline_weight(limit), priority=priority)
+
+    async def depth(self, symbol, limit, priority=PRIORITY_OI):
+        return await self.get("/fapi/v1/depth", {"symbol": symbol, "limit": limit},
+                              weight=depth_weight(limit), priority=priority)
+
+
+def kline_weight(limit):
+    # Binance /fapi/v1/klines 權重依 limit 計算
+    if limit < 100: return 1
+    if limit < 500: return 2
+    if limit <= 1000: return 5
+    return 10
+
+
+def depth_weight(limit):
+    # Binance /fapi/v1/depth 權重依 limit 計算
+    if limit <= 50: return 2
+    if limit <= 100: return 5
+    if limit <= 500: return 10
+    return 20
+
+
+gateway = RestGateway()
+metrics.collectors.append(gateway.collect)
@@ -0,0 +1,48 @@
+# ================== 串流指標（O(1) 更新） ==================
+# 與 talib.EMA 相同：前 period 根取 SMA 作為種子，之後每根
+# ema = (close - ema) * k + ema，k = 2 / (period + 1)
+
+EMA_PERIODS = (15, 30, 45, 60)
+
+
+class EMA:
+    __slots__ = ("period", "k", "value", "count", "seed_sum")
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.value = None
+        self.count = 0
+        self.seed_sum = 0.0
+
+    def update(self, close):
+        self.count += 1
+        if self.value is None:
+            # 種子階段：累加到 period 根後取平均
+            self.seed_sum += close
+            if self.count == self.period:
+                self.value = self.seed_sum / self.period
+        else:
+            self.value += (close - self.value) * self.k
+        return self.value
+
+
+class EMABank:
+    """一組同週期序列的 EMA，用 bank[15] 取 EMA15 的值"""
+    __slots__ = ("emas",)
+
+    def __init__(self, periods=EMA_PERIODS):
+        self.emas = {p: EMA(p) for p in periods}
+
+    def __getitem__(self, period):
+        return self.emas[period].value
+
+    def update(self, close):
+        for ema in self.emas.values():
+            ema.update(close)
+
+    def __repr__(self):
+        return repr({p: ema.value for p, ema in self.emas.items()})
+
+    def ready(self):
+        return all(ema.value is not None for ema in self.emas.values())
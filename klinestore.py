@@ -0,0 +1,221 @@
+import asyncio
+import glob
+import io
+import os
+import re
+import threading
+import time
+import zipfile
+import numpy as np
+from config import KLINE_STORE_DIR, KLINE_STORE_FLUSH
+from models import running
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 本地歷史K線 / 持倉量儲存 ==================
+# 每個幣種、每個週期一個定長紀錄檔 <root>/<SYMBOL>/<interval>.bin（持倉量為 oi.bin），
+# 依時間遞增只追加；讀取用 np.memmap，區間查詢以時間欄二分搜尋後直接切片，
+# 回傳的是檔案的零複製 view（store.range(...)["close"]）
+# 即時收盤K棒 / 持倉量用 append_later 先暫存在記憶體，由 run() 每 KLINE_STORE_FLUSH 秒
+# 在背景執行緒整批寫檔，event loop 上不做檔案 I/O；讀到還有暫存的檔案時先寫入再讀
+
+KLINE_DTYPE = np.dtype([("open_ms", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+                        ("close", "<f8"), ("volume", "<f8"), ("quote_vol", "<f8")])
+OI_DTYPE = np.dtype([("t", "<i8"), ("oi", "<f8")])
+
+ARCHIVE_PATTERN = re.compile(r"^([A-Z0-9]+)-(\d+[mhdwM]|metrics)-\d{4}-\d{2}(?:-\d{2})?\.(zip|csv)$")
+MANIFEST = "imported.txt"
+
+
+def _dtype(name):
+    return OI_DTYPE if name == "oi" else KLINE_DTYPE
+
+
+class KlineStore:
+    def __init__(self, root=KLINE_STORE_DIR):
+        self.root = root
+        self.maps = {}  # (symbol, name) -> memmap，長度變動後重建
+        self.last = {}  # (symbol, name) -> 最後一筆時間（含暫存），追加時不必重新 mmap
+        self.pending = {}  # (symbol, name) -> [rows, ...] 尚未寫檔的紀錄
+        self.lock = threading.Lock()        # 保護 pending 的交換
+        self.write_lock = threading.Lock()  # 同一時間只有一方在寫檔，維持每個檔案的追加順序
+
+    def _path(self, sym, name):
+        return os.path.join(self.root, sym, f"{name}.bin")
+
+    def view(self, sym, name):
+        key = (sym, name)
+        if key in self.pending or self.write_lock.locked():
+            self.flush([key])
+        m = self.maps.get(key)
+        if m is None:
+            dtype = _dtype(name)
+            path = self._path(sym, name)
+            n = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+            if not n:
+                return np.zeros(0, dtype=dtype)
+            m = self.maps[key] = np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+        return m
+
+    def last_time(self, sym, name):
+        key = (sym, name)
+        t = self.last.get(key)
+        if t is None:
+            v = self.view(sym, name)
+            t = self.last[key] = int(v[v.dtype.names[0]][-1]) if len(v) else -1
+        return t
+
+    def _new_rows(self, sym, name, rows):
+        dtype = _dtype(name)
+        rows = np.asarray(rows, dtype=dtype).reshape(-1)
+        return rows[rows[dtype.names[0]] > self.last_time(sym, name)]
+
+    def append(self, sym, name, rows):
+        """追加時間晚於最後一筆的紀錄並立即寫檔，回傳寫入筆數"""
+        rows = self._new_rows(sym, name, rows)
+        if not len(rows):
+            return 0
+        with self.write_lock:
+            batch = self._take([(sym, name)])
+            self._write(sym, name, np.concatenate(batch[(sym, name)] + [rows]) if batch else rows)
+        self.last[(sym, name)] = int(rows[rows.dtype.names[0]][-1])
+        return len(rows)
+
+    def append_later(self, sym, name, rows):
+        """同 append，但只放進暫存，由 flush() 寫檔"""
+        rows = self._new_rows(sym, name, rows)
+        if not len(rows):
+            return 0
+        with self.lock:
+            self.pending.setdefault((sym, name), []).append(rows)
+        self.last[(sym, name)] = int(rows[rows.dtype.names[0]][-1])
+        return len(rows)
+
+    def _take(self, keys=None):
+        with self.lock:
+            if keys is None:
+                batch, self.pending = self.pending, {}
+            else:
+                batch = {k: self.pending.pop(k) for k in keys if k in self.pending}
+        return batch
+
+    def reopen(self, root):
+        """改用另一個目錄（回放用）：暫存先寫回原目錄，清掉舊目錄的 memmap 與最後時間快取，回傳原目錄"""
+        self.flush()
+        old, self.root = self.root, root
+        self.maps.clear()
+        self.last.clear()
+        return old
+
+    def flush(self, keys=None):
+        """把暫存的紀錄寫入檔案，回傳筆數（可在背景執行緒呼叫）"""
+        written = 0
+        with self.write_lock:
+            for (sym, name), chunks in self._take(keys).items():
+                rows = np.concatenate(chunks)
+                try:
+                    self._write(sym, name, rows)
+                    written += len(rows)
+                except OSError as e:
+                    log.error("[K線儲存錯誤] %s %s: %s", sym, name, e)
+        return written
+
+    def _write(self, sym, name, rows):
+        dtype = rows.dtype
+        path = self._path(sym, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            # 上次寫到一半當機留下的殘缺紀錄先截掉
+            extra = f.tell() % dtype.itemsize
+            if extra:
+                f.truncate(f.tell() - extra)
+                f.seek(0, os.SEEK_END)
+            f.write(rows.tobytes())
+        self.maps.pop((sym, name), None)
+
+    async def run(self, interval=KLINE_STORE_FLUSH):
+        try:
+            while running:
+                await asyncio.sleep(interval)
+                if self.pending:
+                    await asyncio.to_thread(self.flush)
+        finally:
+            self.flush()
+
+    def range(self, sym, name, start_ms, end_ms):
+        """[start_ms, end_ms) 之間的紀錄（memmap 切片，不複製）"""
+        v = self.view(sym, name)
+        t = v[v.dtype.names[0]]
+        i, j = np.searchsorted(t, [start_ms, end_ms])
+        return v[i:j]
+
+    def tail(self, sym, name, n):
+        return self.view(sym, name)[-n:]
+
+    def symbols(self, name):
+        return sorted(os.path.basename(os.path.dirname(p)) for p in glob.glob(self._path("*", name)))
+
+# ================== Binance 歷史檔匯入 ==================
+# data.binance.vision 的 klines / metrics zip（或解壓後的 csv），
+# 已匯入的檔名記在 imported.txt，重跑只處理新檔
+
+def _read_csv(path):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as z:
+            text = z.read(z.namelist()[0]).decode()
+    else:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    lines = text.splitlines()
+    if lines and not lines[0][:1].isdigit():
+        lines = lines[1:]  # 新版檔案有表頭
+    return lines
+
+def parse_klines(lines):
+    # open_time, open, high, low, close, volume, close_time, quote_volume, ...
+    arr = np.loadtxt(io.StringIO("\n".join(lines)), delimiter=",", usecols=(0, 1, 2, 3, 4, 5, 7), ndmin=2)
+    rows = np.zeros(len(arr), dtype=KLINE_DTYPE)
+    for k, name in enumerate(KLINE_DTYPE.names):
+        rows[name] = arr[:, k]
+    return rows
+
+def parse_metrics(lines):
+    # create_time, symbol, sum_open_interest, ...
+    rows = np.zeros(len(lines), dtype=OI_DTYPE)
+    rows["t"] = np.array([line[:19] for line in lines], dtype="datetime64[ms]").astype(np.int64)
+    rows["oi"] = np.loadtxt(io.StringIO("\n".join(lines)), delimiter=",", usecols=(2,), ndmin=1)
+    return rows
+
+def import_archives(directory, store):
+    start = time.time()
+    manifest = os.path.join(store.root, MANIFEST)
+    done = set()
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            done = set(f.read().split())
+
+    groups = {}
+    for path in glob.glob(os.path.join(directory, "**", "*"), recursive=True):
+        name = os.path.basename(path)
+        m = ARCHIVE_PATTERN.match(name)
+        if m and name not in done:
+            kind = "oi" if m.group(2) == "metrics" else m.group(2)
+            groups.setdefault((m.group(1), kind), []).append(path)
+
+    written = 0
+    os.makedirs(store.root, exist_ok=True)
+    for (sym, kind), paths in sorted(groups.items()):
+        parse = parse_metrics if kind == "oi" else parse_klines
+        rows = np.concatenate([parse(_read_csv(p)) for p in paths])
+        # 日檔 / 月檔可能重疊：排序去重後一次追加（早於既有資料的部分略過）
+        _, idx = np.unique(rows[rows.dtype.names[0]], return_index=True)
+        written += store.append(sym, kind, rows[idx])
+        with open(manifest, "a", encoding="utf-8") as f:
+            f.write("".join(os.path.basename(p) + "\n" for p in paths))
+    if groups:
+        log.info(f"匯入歷史檔：{sum(map(len, groups.values()))} 個檔案，新增 {written:,} 筆，耗時 {time.time() - start:.1f} 秒")
+    return written
+
+
+kline_store = KlineStore()
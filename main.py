@@ -4,10 +4,21 @@ from command import bot_enum
 from binance import AsyncClient
 from telegram import Update
 from telegram.ext import Application, CommandHandler
-from config import BOT_TOKEN
+from config import BOT_TOKEN, RECORD_DIR, METRICS_PORT, SHARD_WORKERS, DEPTH_HOT_MAX
 from models import running, symbol_state
-from binance_opendata import initialize_symbols, monitor_price_websocket, update_open_interest
-from monitor import periodic_screen
+from binance_opendata import initialize_symbols, monitor_price_websocket, market_streams, update_open_interest
+from backfill import backfill_symbols
+from universe import universe
+from gateway import gateway
+from monitor import event_screen, poll_screen, periodic_refresh_symbols
+from telegram_bot import dispatcher
+from snapshot import load_snapshot, periodic_snapshot, save_snapshot
+from subscriptions import subscriptions
+from recorder import feed
+from klinestore import kline_store
+from sharding import shards
+from depth import depth
+import metrics
 from utils import setup_logging
 from command import command
 
@@ -25,23 +36,65 @@ async def main():
     application.add_handler(CommandHandler(bot_enum.TGBotCommand.COMMAND, command.command))
     application.add_handler(CommandHandler(bot_enum.TGBotCommand.SEARCH, command.search))
     application.add_handler(CommandHandler(bot_enum.TGBotCommand.CHECK, command.check))
+    application.add_handler(CommandHandler(bot_enum.TGBotCommand.SUBSCRIBE, command.subscribe))
+    application.add_handler(CommandHandler(bot_enum.TGBotCommand.UNSUBSCRIBE, command.unsubscribe))
+    application.add_handler(CommandHandler(bot_enum.TGBotCommand.RULE, command.rule))
+    application.add_handler(CommandHandler(bot_enum.TGBotCommand.ALLOW, command.allow))
+    application.add_handler(CommandHandler(bot_enum.TGBotCommand.DENY, command.deny))
+    application.add_handler(CommandHandler(bot_enum.TGBotCommand.TOP, command.top))
 
-    # Binance client
-    client = await AsyncClient.create()
-    await client.ping()
+    # Binance client：只給 BinanceSocketManager 用，不走 create()，避免啟動時繞過 gateway 的 ping / 伺服器時間查詢
+    client = AsyncClient()
+
+    if RECORD_DIR and SHARD_WORKERS:
+        log.warning("分片模式的 WS 訊息在 worker 行程接收，不支援錄製，RECORD_DIR 已忽略")
+    elif RECORD_DIR:
+        feed.open(RECORD_DIR)
 
     try:
-        await initialize_symbols(client)
+        # 先載入訂閱規則與上次的快照（OI 歷史、告警冷卻），再與最新合約清單同步
+        try:
+            subscriptions.load()
+        except Exception as e:
+            log.error(f"[訂閱載入錯誤] {e}")
+        try:
+            load_snapshot()
+        except Exception as e:
+            log.error(f"[快照載入錯誤] {e}")
+        await initialize_symbols()
         log.info(f"初始化完成，共監控 {len(symbol_state)} 個合約")
 
         if not symbol_state:
             log.info("無合約，結束程式")
             return
 
+        if SHARD_WORKERS:
+            # 分片模式：K線回補與 WS 接收都在 worker 行程，主行程輪詢共享陣列篩選
+            ingest = [shards.run()]
+            if market_streams():
+                # 全市場標記價格 / 強平單由主行程整批寫入共享陣列
+                ingest.append(monitor_price_websocket(per_symbol=False))
+            price_task   = asyncio.gather(*ingest)
+            screen_task  = asyncio.create_task(poll_screen())
+        else:
+            # 先回補歷史K線，EMA / 成交量條件啟動即可用
+            await backfill_symbols(list(symbol_state))
+            price_task   = asyncio.create_task(monitor_price_websocket())
+            screen_task  = asyncio.create_task(event_screen())
+
         # 三個背景任務
-        price_task   = asyncio.create_task(monitor_price_websocket(client))
-        oi_task      = asyncio.create_task(update_open_interest(client))
-        screen_task      = asyncio.create_task(periodic_screen(client))
+        oi_task      = asyncio.create_task(update_open_interest())
+        refresh_task = asyncio.create_task(periodic_refresh_symbols(backfill=not SHARD_WORKERS))
+        snapshot_task = asyncio.create_task(periodic_snapshot())
+        universe_task = asyncio.create_task(universe.run(client))
+        # 收盤K線 / 持倉量整批在背景執行緒寫檔
+        store_task   = asyncio.create_task(kline_store.run())
+        if METRICS_PORT:
+            # 指標端點失敗不影響監控，不放進下面的 gather
+            metrics_task = asyncio.create_task(metrics.serve())
+        if DEPTH_HOT_MAX:
+            # 熱門幣種委託簿只用於告警的買賣壓力，同樣不放進 gather
+            depth_task = asyncio.create_task(depth.run())
 
         log.info("三個背景任務已啟動，準備啟動 Telegram polling...")
 
@@ -58,7 +111,7 @@ async def main():
 
         # 只等待你的三個 Binance 任務即可
         # Telegram polling 已經在背景跑了
-        await asyncio.gather(price_task, oi_task, screen_task)
+        await asyncio.gather(price_task, oi_task, screen_task, refresh_task, snapshot_task, universe_task, store_task)
 
     except KeyboardInterrupt:
         log.info("\n收到中斷信號，停止中...")
@@ -67,6 +120,10 @@ async def main():
     finally:
         running = False
         log.info("正在關閉所有服務...")
+        try:
+            await save_snapshot()
+        except Exception as e:
+            log.error(f"[快照錯誤] {e}")
 
         # 正確的關閉順序（Windows 必備）
         if application.updater.running:
@@ -74,6 +131,11 @@ async def main():
         await application.stop()                           # 停止 bot
         await application.shutdown()                       # 關閉 http session
         await client.close_connection()
+        await gateway.close()
+        await dispatcher.close()
+        await shards.close()
+        feed.close()
+        kline_store.flush()
 
         log.info("所有服務已安全關閉，掰掰")
 
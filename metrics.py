@@ -0,0 +1,154 @@
+import asyncio
+import bisect
+import time
+from aiohttp import web
+from config import METRICS_HOST, METRICS_PORT
+import utils
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 監控指標（Prometheus 文字格式） ==================
+# Counter / Histogram 都是預先配置好的 Python 數值與 list，只在 event loop
+# 內更新，不加鎖；會變動的標籤（每條連線、每個幣種）在抓取時由 collector 現算。
+# 熱路徑的耗時以時間抽樣：每 10 ms 只量下一筆
+#
+#   curl http://127.0.0.1:9108/metrics
+
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+AGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+registry = []
+collectors = []
+
+
+class Sampler:
+    """熱路徑抽樣旗標：每 interval 秒由 event loop 設為 True，呼叫端量完一筆後清掉"""
+    __slots__ = ("due", "interval")
+
+    def __init__(self, interval):
+        self.due = False
+        self.interval = interval
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+
+        def tick():
+            self.due = True
+            loop.call_later(self.interval, tick)
+
+        tick()
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name, self.help, self.value = name, help, 0
+        registry.append(self)
+
+    def inc(self, n=1):
+        self.value += n
+
+    def lines(self):
+        return [f"{self.name} {self.value}"]
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最後一格為 +Inf
+        self.sum = 0.0
+        self.count = 0
+        registry.append(self)
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def lines(self):
+        out, acc = [], 0
+        for le, n in zip(self.buckets + ("+Inf",), self.counts):
+            acc += n
+            out.append(f'{self.name}_bucket{{le="{le}"}} {acc}')
+        out.append(f"{self.name}_sum {self.sum}")
+        out.append(f"{self.name}_count {self.count}")
+        return out
+
+
+def family(name, kind, help, samples):
+    """collector 用：samples 為 [(標籤 dict, 值)]"""
+    out = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        out.append(f"{name}{{{text}}} {value}" if text else f"{name} {value}")
+    return out
+
+
+def render():
+    lines = []
+    for m in registry:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.lines())
+    for collect in collectors:
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            log.error("[指標錯誤] %s: %s", getattr(collect, "__qualname__", collect), e)
+    return "\n".join(lines) + "\n"
+
+# ================== 共用指標 ==================
+
+WS_DECODE = Histogram("ws_decode_seconds", "WS 訊息 JSON 解碼耗時（抽樣）")
+WS_UPDATE = Histogram("ws_update_seconds", "WS 訊息寫入狀態耗時（抽樣）")
+WS_AGE = Histogram("ws_message_age_seconds", "交易所事件時間到收到訊息的延遲（抽樣）", AGE_BUCKETS)
+SCREEN_PASS = Histogram("screen_pass_seconds", "一次批次篩選耗時")
+TELEGRAM_SEND = Histogram("telegram_send_seconds", "Telegram 告警送出耗時")
+OI_FETCH = Histogram("oi_fetch_seconds", "持倉量 REST 請求耗時")
+LOOP_LAG = Histogram("event_loop_lag_seconds", "event loop 排程延遲", LATENCY_BUCKETS)
+ALERTS = Counter("alerts_sent_total", "已送出的告警數")
+TIMING = Sampler(0.01)
+
+
+def log_queue_metrics():
+    q = utils._listener.queue if utils._listener is not None else None
+    return family("log_queue_depth", "gauge", "等待寫出的 log 筆數", [({}, q.qsize() if q is not None else 0)])
+
+collectors.append(log_queue_metrics)
+
+# ================== 背景任務 ==================
+
+async def monitor_loop_lag(interval=0.5):
+    while True:
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.perf_counter() - t - interval))
+
+
+async def serve(host=METRICS_HOST, port=METRICS_PORT):
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        log.error(f"[指標端點錯誤] 無法監聽 {host}:{port}: {e}")
+        await runner.cleanup()
+        return
+    TIMING.start()
+    log.info(f"📈 指標端點：http://{host}:{port}/metrics")
+    try:
+        await monitor_loop_lag()
+    finally:
+        await runner.cleanup()
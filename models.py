@@ -1,11 +1,96 @@
-import asyncio
 from collections import defaultdict, deque
+import numpy as np
+from indicators import EMABank
+from screener import MarketArrays
 
 # ================== 全域狀態 ==================
 running = True
 symbol_state = {}
-price_history = defaultdict(lambda: deque(maxlen=100)) # 多增加10個長度(緩衝)
-oi_history = defaultdict(lambda: deque(maxlen=370)) # 多增加10個長度(緩衝)
-last_alert = defaultdict(float)
+last_alert = defaultdict(dict) # symbol -> {chat_id: 上次告警送達時間}
+market = MarketArrays() # 向量化篩選用的 slot 陣列，含價格 / 持倉 / 5m 成交量歷史
+alert_latency = deque(maxlen=1000) # WS 訊息到告警送出的延遲（秒）
 bot = None
-semaphore = asyncio.Semaphore(20)
\ No newline at end of file
+
+# ================== 幣種狀態（__slots__ 記錄） ==================
+# slot 為 MarketArrays 的整數索引，WS 分派與篩選共用，熱路徑不再用字串 key 查表
+
+KLINE_INTERVALS = ("1h", "4h")
+
+
+class KlineTrack:
+    __slots__ = ("closes", "ema", "last_close_time")
+
+    def __init__(self):
+        self.closes = deque(maxlen=100)
+        self.ema = EMABank()
+        self.last_close_time = 0  # 避免重複處理同一根
+
+    def __repr__(self):
+        return f"KlineTrack(closes={len(self.closes)}, ema={self.ema!r}, last_close_time={self.last_close_time})"
+
+
+class SymbolState:
+    __slots__ = ("symbol", "slot", "last_oi", "monitor_start", "last_kline_close_time", "klines")
+    REPR_FIELDS = ("slot", "last_price", "last_oi", "funding_rate", "monitor_start", "last_kline_close_time", "klines")
+
+    def __init__(self, symbol, now):
+        self.symbol = symbol
+        self.slot = None
+        self.last_oi = None
+        self.monitor_start = now - 120
+        self.last_kline_close_time = 0  # 5m 成交量K棒
+        self.klines = {iv: KlineTrack() for iv in KLINE_INTERVALS}
+
+    # 價格 / 資金費率只存在 MarketArrays（全市場串流整批寫入、分片模式由其他行程寫入），這裡直接讀寫陣列
+    @property
+    def last_price(self):
+        v = float(market.last_price[self.slot])
+        return None if v != v else v
+
+    @last_price.setter
+    def last_price(self, v):
+        market.last_price[self.slot] = np.nan if v is None else v
+
+    @property
+    def funding_rate(self):
+        v = float(market.funding_rate[self.slot])
+        return 0.0 if v != v else v
+
+    @funding_rate.setter
+    def funding_rate(self, v):
+        market.funding_rate[self.slot] = v
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.REPR_FIELDS)
+        return f"SymbolState({fields})"
+
+
+def register_symbol(sym, now):
+    state = SymbolState(sym, now)
+    state.slot = market.add(sym, state.monitor_start)
+    symbol_state[sym] = state
+    return state
+
+
+def adopt_symbol(sym, slot, now):
+    """分片 worker 用：接手主行程已配置的 slot，狀態從共享陣列還原，不清空資料"""
+    state = SymbolState(sym, now)
+    state.slot = market.adopt(sym, slot)
+    state.monitor_start = float(market.monitor_start[slot])
+    # 5m 成交量已寫到的位置，回補時不重複追加
+    last_t, _ = market.vol_5m.last(slot)
+    state.last_kline_close_time = 0 if last_t is None else int(last_t)
+    symbol_state[sym] = state
+    return state
+
+
+def forget_symbol(sym):
+    """分片 worker 用：放掉幣種時只丟本行程的狀態，不動共享陣列（搬移後由新 worker 接手）"""
+    symbol_state.pop(sym, None)
+    market.forget(sym)
+
+
+def unregister_symbol(sym):
+    symbol_state.pop(sym, None)
+    last_alert.pop(sym, None)
+    market.remove(sym)
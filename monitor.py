@@ -1,53 +1,74 @@
 import time
+import clock
 import asyncio
-from config import EXCLUDE_SYMBOLS, QUOTE_VOLUME
-from models import running, symbol_state
+from config import SCREEN_DEBOUNCE, SCREEN_MAX_LATENCY
+from models import running, market
 from binance_opendata import initialize_symbols
-from conditions import check_conditions
+from backfill import backfill_symbols
 from telegram_bot import send_alert
+from subscriptions import subscriptions
+import metrics
+from metrics import SCREEN_PASS
 from utils import setup_logging
 
 log = setup_logging()
 
 # ================== 監控條件邏輯 ==================
 
-async def screen_and_alert(client):
+async def screen_and_alert(subset=None, recv_t=None):
     try:
-        ticker24 = await client.futures_ticker()
-        valid_symbols = [
-            t["symbol"] for t in ticker24
-            if t["symbol"].endswith("USDT")
-            and float(t["quoteVolume"]) > QUOTE_VOLUME
-            and not any(ex in t["symbol"] for ex in EXCLUDE_SYMBOLS)
-        ]
-
-        monitored = [
-            s for s in valid_symbols
-            if s in symbol_state
-            and symbol_state[s]["last_price"] is not None
-            and symbol_state[s]["last_oi"] is not None
-            and time.time() - symbol_state[s]["monitor_start"] >= 60
-        ]
-        # log.info(f"正在篩選 {len(monitored)} 個幣種...")
-
-        tasks = [check_conditions(client, s) for s in monitored]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # 排行指標只更新這一波有新資料的幣種，沒有訂閱也照常更新給 /top
+        market.update_movers(clock.now(), subset)
+        if not subscriptions.rules:
+            return
+        # 整個市場以最寬鬆的門檻一次批次判斷，再依各聊天室的門檻分組分派
+        t0 = time.perf_counter()
+        triggered = market.screen(clock.now(), subset, *subscriptions.loosest())
+        routed = subscriptions.route(triggered)
+        SCREEN_PASS.observe(time.perf_counter() - t0)
 
+        # 只排進派送佇列，不等 Telegram 回應
         alerted = 0
-        for sym, res in zip(monitored, results):
-            if isinstance(res, Exception):
-                continue
-            if res:
-                if await send_alert(sym, res):
-                    alerted += 1
+        for chat_id, rule, sym, res in routed:
+            if send_alert(chat_id, sym, res, recv_t[market.slots[sym]] if recv_t is not None else None, rule.cooldown):
+                alerted += 1
         if alerted:
-            log.info(f"結果：發送 {alerted} 則告警")
+            log.info("結果：排入 %d 則告警", alerted)
 
     except Exception as e:
-        log.info(f"[篩選錯誤] {e}")
+        log.info("[篩選錯誤] %s", e)
 
-async def periodic_screen(client):
+def screen_metrics():
+    return metrics.family("screen_pending_symbols", "gauge", "等待篩選的 dirty 幣種數", [({}, int(market.dirty.sum()))])
+
+metrics.collectors.append(screen_metrics)
+
+async def event_screen():
+    # 有 dirty 幣種才篩選：等 SCREEN_DEBOUNCE 收集同一波更新，但不超過 SCREEN_MAX_LATENCY
+    wake = asyncio.Event()
+    market.on_dirty = wake.set
+    while running:
+        await wake.wait()
+        wake.clear()
+        if market.first_dirty_t is None:
+            continue
+        waited = clock.now() - market.first_dirty_t
+        await asyncio.sleep(max(0, min(SCREEN_DEBOUNCE, SCREEN_MAX_LATENCY - waited)))
+        subset, recv_t = market.take_dirty()
+        await screen_and_alert(subset, recv_t)
+
+async def poll_screen():
+    # 分片模式：worker 行程無法喚醒主行程的 event loop，改為每 SCREEN_DEBOUNCE 檢查 dirty
+    while running:
+        await asyncio.sleep(SCREEN_DEBOUNCE)
+        if market.dirty.any():
+            subset, recv_t = market.take_dirty()
+            await screen_and_alert(subset, recv_t)
+
+async def periodic_refresh_symbols(backfill=True):
     while running:
-        await initialize_symbols(client)
-        await screen_and_alert(client)
-        await asyncio.sleep(10)
\ No newline at end of file
+        added = await initialize_symbols()
+        if added and backfill:
+            # 新加入的幣種在背景回補，不阻塞篩選
+            asyncio.create_task(backfill_symbols(added))
+        await asyncio.sleep(10)
@@ -0,0 +1,61 @@
+import time
+import numpy as np
+import clock
+from config import RANK_TOP_K, RANK_INTERVAL
+from models import market
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 漲幅 / 量能 / 持倉排行 ==================
+# 排行指標是 MarketArrays.movers（每個 slot 一列），篩選時只重算這一波 dirty 的幣種；
+# /top 以 np.argpartition 在每個指標挑出前 K 名、只排序這 K 筆，
+# 格式化好的回覆快取到下一個 RANK_INTERVAL 週期
+
+# (movers 欄位, 標題, 格式)
+BOARDS = (
+    (0, "🚀 15 分鐘漲幅", "{:+.2f}%"),
+    (1, "🔥 1 小時量比", "{:.1f}×"),
+    (2, "📊 1 小時持倉變化", "{:+.1f}%"),
+)
+
+
+def top_k(values, k, mask):
+    """mask 內數值最大的 k 個 slot（由大到小），NaN 不列入"""
+    rows = np.flatnonzero(mask & ~np.isnan(values))
+    if len(rows) > k:
+        rows = rows[np.argpartition(-values[rows], k - 1)[:k]]
+    return rows[np.argsort(-values[rows], kind="stable")]
+
+
+class Ranking:
+    def __init__(self, k=RANK_TOP_K, interval=RANK_INTERVAL):
+        self.k = k
+        self.interval = interval
+        self.tick = None
+        self.text = None
+
+    def boards(self):
+        """[(標題, 格式, [(symbol, 數值)])]"""
+        out = []
+        for col, title, fmt in BOARDS:
+            values = market.movers[:, col]
+            rows = top_k(values, self.k, market.active)
+            out.append((title, fmt, [(market.symbols[r], float(values[r])) for r in rows.tolist()]))
+        return out
+
+    def reply(self):
+        tick = int(clock.now() // self.interval)
+        if tick != self.tick:
+            t0 = time.perf_counter()
+            parts = []
+            for title, fmt, rows in self.boards():
+                lines = [f"{i}. {sym} {fmt.format(v)}" for i, (sym, v) in enumerate(rows, 1)]
+                parts.append("\n".join([title] + (lines or ["（資料不足）"])))
+            self.text = "\n\n".join(parts)
+            self.tick = tick
+            log.info("排行更新：%.2f ms", (time.perf_counter() - t0) * 1000)
+        return self.text
+
+
+ranking = Ranking()
@@ -0,0 +1,83 @@
+import glob
+import gzip
+import json
+import os
+import time
+from config import RECORD_SEGMENT_SECONDS
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 行情錄製 ==================
+# WS 原始訊息與 REST 回應依收到順序寫入 gzip 分段檔（只追加），一行一筆：
+#   <時間戳>\tws\t<原始 frame>
+#   <時間戳>\trest\t{"path": ..., "params": ..., "data": ...}
+# 每段涵蓋 RECORD_SEGMENT_SECONDS 秒；每秒 flush 一次，當機最多掉最後一秒
+
+FLUSH_INTERVAL = 1.0
+
+
+class FeedRecorder:
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.file = None
+        self.segment_start = 0.0
+        self.last_flush = 0.0
+        self.records = 0
+
+    def open(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.enabled = True
+        log.info(f"📼 開始錄製行情：{directory}")
+
+    def _segment(self, now):
+        if self.file is not None and now - self.segment_start < RECORD_SEGMENT_SECONDS:
+            return self.file
+        if self.file is not None:
+            self.file.close()
+        name = time.strftime("feed-%Y%m%d-%H%M%S.log.gz", time.gmtime(now))
+        self.file = gzip.open(os.path.join(self.directory, name), "at", encoding="utf-8", compresslevel=1)
+        self.segment_start = self.last_flush = now
+        return self.file
+
+    def _write(self, kind, payload):
+        now = time.time()
+        f = self._segment(now)
+        f.write(f"{now:.3f}\t{kind}\t{payload}\n")
+        self.records += 1
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            f.flush()
+            self.last_flush = now
+
+    def ws(self, raw):
+        self._write("ws", raw)
+
+    def rest(self, path, params, data):
+        self._write("rest", json.dumps({"path": path, "params": params, "data": data}, separators=(",", ":")))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.enabled:
+            log.info(f"📼 錄製結束：共 {self.records} 筆")
+        self.enabled = False
+
+
+def read_feed(directory):
+    """依時間順序逐筆讀出 (t, kind, payload)；最後一段若因當機截斷，讀到哪算到哪"""
+    for path in sorted(glob.glob(os.path.join(directory, "feed-*.log.gz"))):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # 截斷的最後一行
+                    t, kind, payload = line.rstrip("\n").split("\t", 2)
+                    yield float(t), kind, payload
+        except (EOFError, gzip.BadGzipFile) as e:
+            log.warning(f"[錄製檔截斷] {path}: {e}")
+
+
+feed = FeedRecorder()
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import clock
+import models
+from config import SCREEN_DEBOUNCE
+from models import market
+from binance_opendata import initialize_symbols, handle_price_websocket, fetch_oi
+from backfill import apply_klines
+from universe import universe
+from gateway import gateway, RestError
+from monitor import screen_and_alert
+from telegram_bot import dispatcher
+from subscriptions import subscriptions
+from recorder import read_feed
+from klinestore import kline_store
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 行情回放 ==================
+# 把 recorder 錄下的 WS / REST 依序餵回真正的處理流程
+# （handle_price_websocket / fetch_oi / screen_and_alert），時間用虛擬時鐘；
+# speed=0 全速，speed=1 依原始節奏。Telegram 換成只記錄訊息的假 bot
+#
+#   python replay.py recordings/ [--speed 1]
+
+
+class ReplayBot:
+    def __init__(self):
+        self.alerts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.alerts.append((clock.now(), text, chat_id))
+
+
+class RecordedResponses:
+    """gateway.source：回傳同一請求在虛擬時間之前最近一次錄到的回應"""
+
+    def __init__(self):
+        self.latest = {}
+
+    @staticmethod
+    def key(path, params):
+        return path, tuple(sorted((params or {}).items()))
+
+    def put(self, path, params, data):
+        self.latest[self.key(path, params)] = data
+
+    def __call__(self, path, params):
+        data = self.latest.get(self.key(path, params))
+        if data is None:
+            if path == "/fapi/v1/klines":
+                return []  # K線補抓的回應稍後才會出現在錄製檔，屆時由 apply_klines 寫入
+            raise RestError(f"回放資料中沒有 {path} {params}")
+        return data
+
+
+async def apply_rest(responses, rec):
+    path, params, data = rec["path"], rec["params"] or {}, rec["data"]
+    responses.put(path, params, data)
+    if path == "/fapi/v1/ticker/24hr":
+        await universe.reconcile()
+        await initialize_symbols()
+    elif path == "/fapi/v1/openInterest":
+        await fetch_oi(params["symbol"])
+    elif path == "/fapi/v1/klines":
+        apply_klines(params["symbol"], params["interval"], data)
+
+
+async def screen_due(force=False):
+    # 與 event_screen 相同的合併規則，只是等待時間以虛擬時鐘計算
+    if market.first_dirty_t is None:
+        return
+    if force or clock.now() - market.first_dirty_t >= SCREEN_DEBOUNCE:
+        subset, recv_t = market.take_dirty()
+        await screen_and_alert(subset, recv_t)
+        await dispatcher.join()
+
+
+async def replay(directory, speed=0.0):
+    vclock = clock.VirtualClock()
+    clock.use(vclock)
+    bot = models.bot = ReplayBot()
+    responses = RecordedResponses()
+    gateway.source = responses
+    # 回放不受 Telegram 送出頻率限制，摘要合併與冷卻邏輯不變
+    dispatcher.chat_interval = dispatcher.global_interval = 0
+    market.on_dirty = None
+    # 沿用現有訂閱規則但不寫回檔案；沒有訂閱時以 config 門檻建一個假聊天室
+    if subscriptions.path is not None and os.path.exists(subscriptions.path):
+        subscriptions.load()
+    subscriptions.path = None
+    if not subscriptions.rules:
+        subscriptions.subscribe("replay")
+    # 回放期間收盤K線 / 持倉量寫到暫存目錄，不污染本地歷史儲存；結束後還原並刪除
+    store_dir = tempfile.mkdtemp(prefix="replay_store_")
+    store_root = kline_store.reopen(store_dir)
+    try:
+        counts = {"ws": 0, "rest": 0}
+        first_t = None
+        start = time.time()
+        for t, kind, payload in read_feed(directory):
+            if first_t is None:
+                first_t = t
+            elif speed:
+                await asyncio.sleep(max(0.0, (t - vclock.t) / speed))
+            vclock.t = t
+            await screen_due()
+            if kind == "ws":
+                handle_price_websocket(payload)
+            elif kind == "rest":
+                await apply_rest(responses, json.loads(payload))
+            counts[kind] = counts.get(kind, 0) + 1
+        await screen_due(force=True)
+        elapsed = time.time() - start
+    finally:
+        kline_store.reopen(store_root)
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    total = sum(counts.values())
+    span = vclock.t - first_t if first_t is not None else 0.0
+    log.info(f"回放完成：{total} 筆（WS {counts['ws']} / REST {counts['rest']}），"
+             f"行情 {span / 60:.1f} 分鐘，耗時 {elapsed:.1f} 秒，{total / max(elapsed, 1e-9):,.0f} 筆/秒")
+    log.info(f"共產生 {len(bot.alerts)} 則告警")
+    for t, text, chat_id in bot.alerts:
+        log.info(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t))} [{chat_id}] {text.splitlines()[0]}")
+    return bot.alerts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回放錄製的行情並列出產生的告警")
+    parser.add_argument("directory", help="RECORD_DIR 錄製目錄")
+    parser.add_argument("--speed", type=float, default=0.0, help="回放倍速，0 為全速")
+    args = parser.parse_args()
+    asyncio.run(replay(args.directory, args.speed))
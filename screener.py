@@ -0,0 +1,355 @@
+import clock
+import numpy as np
+from multiprocessing import shared_memory
+from config import OI_THRESHOLD, PRICE_THRESHOLD, VOLUME_THRESHOLD
+from indicators import EMA_PERIODS
+from timeseries import TimeSeriesStore, BucketWindows
+
+# ================== 向量化篩選引擎 ==================
+# 每個幣種佔一個 slot，所有指標放在連續的 NumPy 陣列，
+# 一次批次運算整個市場，只回傳觸發的幣種
+
+PRICE_WINDOW = 900   # 價格回看 15 分鐘
+OI_WINDOW = 3600     # 持倉回看 1 小時
+SAMPLE_INTERVAL = 10 # 價格 / 持倉歷史取樣間隔（秒）
+VOL_HOUR_BARS = 60   # 成交量「當前」視窗根數
+LIQ_BUCKET = 60      # 爆倉金額每桶秒數
+LIQ_WINDOWS = (5, 15, 60)  # 爆倉滾動視窗（桶數）：5m / 15m / 1h
+LIQ_BUY, LIQ_SELL = 0, 1   # 強平方向：BUY 為空單被強平（軋空），SELL 為多單被強平
+
+FLOAT_FIELDS = ("last_price", "last_oi", "oi_t", "monitor_start", "funding_rate")
+MOVER_FIELDS = ("price_pct", "vol_ratio", "oi_pct")  # 排行指標：15 分鐘漲跌幅、1 小時量比、1 小時持倉變化
+
+
+class MarketArrays:
+    def __init__(self, capacity=512):
+        self.slots = {}
+        self.symbols = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.capacity = capacity
+        for f in FLOAT_FIELDS:
+            setattr(self, f, np.full(capacity, np.nan))
+        self.ema_1h = np.full((capacity, len(EMA_PERIODS)), np.nan)
+        self.ema_4h = np.full((capacity, len(EMA_PERIODS)), np.nan)
+        self.movers = np.full((capacity, len(MOVER_FIELDS)), np.nan)
+        self.active = np.zeros(capacity, dtype=bool)
+        # 價格 / 持倉每 10 秒一筆（多留緩衝），5m 成交量 240 根並維護最近 60 根加總
+        self.price_hist = TimeSeriesStore(capacity, 100)
+        self.oi_hist = TimeSeriesStore(capacity, 370)
+        self.vol_5m = TimeSeriesStore(capacity, 240, windows=(VOL_HOUR_BARS,))
+        # 爆倉金額：買 / 賣兩個方向各 60 個 1 分鐘桶，不保存逐筆事件
+        self.liq = BucketWindows(capacity, LIQ_BUCKET, max(LIQ_WINDOWS), LIQ_WINDOWS, channels=2)
+        # 事件驅動篩選：有新資料的 slot 標記 dirty，記錄最早的接收時間
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.dirty_t = np.full(capacity, np.nan)
+        self.first_dirty_t = None
+        self.on_dirty = None
+        # 分片模式：陣列放在共享記憶體，容量固定；移除的 slot 等 worker 放掉後才重用
+        self.shm = None
+        self.held = set()
+
+    def _grow(self):
+        if self.shm is not None:
+            raise RuntimeError(f"共享記憶體容量不足（{self.capacity} 個 slot），請調大 SHARD_CAPACITY")
+        old = self.capacity
+        new = old * 2
+        for f in FLOAT_FIELDS + ("ema_1h", "ema_4h", "movers", "dirty_t"):
+            arr = getattr(self, f)
+            grown = np.full((new,) + arr.shape[1:], np.nan)
+            grown[:old] = arr
+            setattr(self, f, grown)
+        for f in ("active", "dirty"):
+            arr = getattr(self, f)
+            grown = np.zeros(new, dtype=arr.dtype)
+            grown[:old] = arr
+            setattr(self, f, grown)
+        for store in (self.price_hist, self.oi_hist, self.vol_5m, self.liq):
+            store.grow(new)
+        self.symbols.extend([None] * old)
+        self.free.extend(range(new - 1, old - 1, -1))
+        self.capacity = new
+
+    def add(self, sym, monitor_start):
+        slot = self.slots.get(sym)
+        if slot is not None:
+            return slot
+        if not self.free:
+            self._grow()
+        slot = self.free.pop()
+        self.slots[sym] = slot
+        self.symbols[slot] = sym
+        for f in FLOAT_FIELDS:
+            getattr(self, f)[slot] = np.nan
+        for store in (self.price_hist, self.oi_hist, self.vol_5m, self.liq):
+            store.clear(slot)
+        self.ema_1h[slot] = np.nan
+        self.ema_4h[slot] = np.nan
+        self.movers[slot] = np.nan
+        self.monitor_start[slot] = monitor_start
+        self.active[slot] = True
+        self.dirty[slot] = False
+        return slot
+
+    def remove(self, sym):
+        slot = self.slots.pop(sym, None)
+        if slot is None:
+            return
+        self.active[slot] = False
+        self.dirty[slot] = False
+        self.symbols[slot] = None
+        if self.shm is not None:
+            self.held.add(slot)
+        else:
+            self.free.append(slot)
+
+    # ---------- 共享記憶體（分片模式） ----------
+
+    def _arrays(self):
+        # 所有 slot 陣列：(持有物件, 屬性名稱；sums 為 dict key)，順序固定，各行程依此對應位移
+        out = [(self, f) for f in FLOAT_FIELDS + ("ema_1h", "ema_4h", "movers", "active", "dirty", "dirty_t")]
+        for store in (self.price_hist, self.oi_hist, self.vol_5m):
+            out += [(store, f) for f in ("t", "v", "start", "count", "total")]
+            out += [(store.sums, w) for w in store.windows]
+        out += [(self.liq, "ring")] + [(self.liq.sums, w) for w in self.liq.windows]
+        return out
+
+    def share(self, name=None, capacity=None):
+        """把所有 slot 陣列搬到一塊 shared_memory：name 為 None 時建立並複製現有資料，否則連上既有的"""
+        while capacity is not None and self.capacity < capacity:
+            self._grow()
+        fields = [(owner, key, owner[key] if isinstance(owner, dict) else getattr(owner, key))
+                  for owner, key in self._arrays()]
+        sizes = [-(-arr.nbytes // 64) * 64 for _, _, arr in fields]  # 各陣列 64 bytes 對齊
+        shm = shared_memory.SharedMemory(name=name, create=name is None, size=sum(sizes) if name is None else 0)
+        offset = 0
+        for (owner, key, arr), size in zip(fields, sizes):
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=offset)
+            if name is None:
+                view[:] = arr
+            if isinstance(owner, dict):
+                owner[key] = view
+            else:
+                setattr(owner, key, view)
+            offset += size
+        self.shm = shm
+        return shm
+
+    def adopt(self, sym, slot):
+        # worker 接手主行程配置好的 slot，不清空資料
+        self.slots[sym] = slot
+        self.symbols[slot] = sym
+        return slot
+
+    def forget(self, sym):
+        # worker 放掉 slot：只移除本行程的對應，共享的 active / dirty 由主行程管理
+        slot = self.slots.pop(sym, None)
+        if slot is not None:
+            self.symbols[slot] = None
+
+    def release(self, slots):
+        # worker 確認不再寫入後，移除的 slot 才放回可用清單
+        for slot in slots:
+            if slot in self.held:
+                self.held.discard(slot)
+                self.free.append(slot)
+
+    # ---------- 熱路徑寫入 ----------
+
+    def mark_dirty(self, slot):
+        if self.dirty[slot]:
+            return
+        now = clock.now()
+        self.dirty[slot] = True
+        self.dirty_t[slot] = now
+        if self.first_dirty_t is None:
+            self.first_dirty_t = now
+            if self.on_dirty is not None:
+                self.on_dirty()
+
+    def mark_dirty_many(self, slots):
+        fresh = slots[~self.dirty[slots]]
+        if not len(fresh):
+            return
+        now = clock.now()
+        self.dirty[fresh] = True
+        self.dirty_t[fresh] = now
+        if self.first_dirty_t is None:
+            self.first_dirty_t = now
+            if self.on_dirty is not None:
+                self.on_dirty()
+
+    def take_dirty(self):
+        """取出目前的 dirty 遮罩與接收時間，並清空標記"""
+        mask = self.dirty.copy()
+        recv_t = self.dirty_t.copy()
+        # 只清掉已取出的標記：分片模式下 worker 可能同時標記新的 slot
+        self.dirty[mask] = False
+        self.first_dirty_t = None
+        return mask, recv_t
+
+    def _sample(self, store, slot, now, value):
+        last_t, _ = store.last(slot)
+        if last_t is None or now - last_t >= SAMPLE_INTERVAL:
+            store.append(slot, now, value)
+
+    def set_price(self, slot, price, now):
+        self.last_price[slot] = price
+        self._sample(self.price_hist, slot, now, price)
+        self.mark_dirty(slot)
+
+    def set_prices(self, slots, prices, funding, now):
+        """全市場標記價格一次寫入（slots 為整數陣列），歷史取樣只對距上一筆達 SAMPLE_INTERVAL 的 slot 追加"""
+        self.last_price[slots] = prices
+        self.funding_rate[slots] = funding
+        with np.errstate(invalid="ignore"):
+            due = ~(now - self.price_hist.last_t(slots) < SAMPLE_INTERVAL)
+        if due.any():
+            self.price_hist.append_many(slots[due], now, prices[due])
+        self.mark_dirty_many(slots)
+
+    def set_oi(self, slot, oi, now):
+        self.last_oi[slot] = oi
+        self.oi_t[slot] = now
+        self._sample(self.oi_hist, slot, now, oi)
+        self.mark_dirty(slot)
+
+    def add_volume(self, slot, close_time, quote_vol):
+        # 5m K棒收盤，成交量視窗加總 O(1) 更新
+        self.vol_5m.append(slot, close_time, quote_vol)
+        self.mark_dirty(slot)
+
+    def add_liquidation(self, slot, side, notional, now):
+        self.liq.add(slot, side, now, notional)
+        self.mark_dirty(slot)
+
+    def sync_emas(self, state):
+        slot = state.slot
+        for iv, arr in (("1h", self.ema_1h), ("4h", self.ema_4h)):
+            bank = state.klines[iv].ema
+            arr[slot] = [np.nan if bank[p] is None else bank[p] for p in EMA_PERIODS]
+        self.mark_dirty(slot)
+
+    # ---------- 查詢 ----------
+
+    def lookback(self, store, slot, now, window):
+        """window 秒前當下的 (t, value)，歷史不足時為 (None, None)"""
+        t, v = store.as_of([slot], now - window)
+        if np.isnan(t[0]):
+            return None, None
+        return float(t[0]), float(v[0])
+
+    def volume_stats(self, slots):
+        # 最近 60 根加總，與其餘資料換算成「每小時」平均（同逐幣判斷）
+        vol = self.vol_5m
+        n = vol.count[slots]
+        cur = vol.sums[VOL_HOUR_BARS][slots]
+        prev_n = np.maximum(n - VOL_HOUR_BARS, 0)
+        prev_sum = vol.total[slots] - cur
+        avg = np.where(prev_n > 0, prev_sum / np.maximum(1, prev_n // VOL_HOUR_BARS), 1.0)
+        return cur, avg, n
+
+    # ---------- 持倉量輪詢排程 ----------
+
+    def activity(self, slot):
+        """0~1 的活躍度：價格、成交量、持倉變化相對門檻的比例，接近觸發條件的幣種至少 0.5"""
+        return float(self.heat(clock.now(), np.array([slot]))[0])
+
+    def heat(self, now, slots=None):
+        """activity 的批次版，slots 預設為所有監控中的 slot"""
+        slots = np.flatnonzero(self.active) if slots is None else slots
+        _, ref_p = self.price_hist.as_of(slots, now - PRICE_WINDOW)
+        _, ref_oi = self.oi_hist.as_of(slots, now - OI_WINDOW)
+        cur, avg, _ = self.volume_stats(slots)
+        last = self.last_price[slots]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # 沒有歷史或參考值為 0 時該項不計
+            price = np.where(ref_p != 0, np.abs(last - ref_p) / ref_p * 100 / PRICE_THRESHOLD, 0.0)
+            price[np.isnan(ref_p)] = 0.0
+            oi = np.where(ref_oi != 0, np.abs(self.last_oi[slots] - ref_oi) / ref_oi * 100 / OI_THRESHOLD, 0.0)
+            oi[np.isnan(ref_oi)] = 0.0
+            vol = cur / avg / VOLUME_THRESHOLD
+            heat = np.fmax(np.fmax(np.fmax(price, vol), oi), 0.0)
+            e = self.ema_1h[slots]
+            trend = ((e[:, 0] > e[:, 1]) & (e[:, 1] > e[:, 2]) & (e[:, 2] > e[:, 3]) & (last > e[:, 2])
+                     & ((price > 0.5) | (vol > 0.5)))
+            heat = np.where(trend, np.fmax(heat, 0.5), heat)
+        return np.where(np.isfinite(heat), np.minimum(heat, 1.0), 1.0)
+
+    def oi_age(self, now, hot_only=False):
+        # 各幣種持倉量距離上次更新的秒數
+        mask = self.active & ~np.isnan(self.oi_t)
+        if hot_only:
+            slots = np.flatnonzero(mask)
+            mask[slots] = self.heat(now, slots) >= 0.5
+        return now - self.oi_t[mask]
+
+    # ---------- 批次篩選 ----------
+
+    def update_movers(self, now, subset=None):
+        """重算排行指標，subset 為只更新的 slot 遮罩（篩選時傳入這一波 dirty 的幣種）"""
+        rows = np.flatnonzero(self.active if subset is None else self.active & subset)
+        if not len(rows):
+            return
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cur = self.last_price[rows]
+            _, ref_p = self.price_hist.as_of(rows, now - PRICE_WINDOW)
+            vol_cur, vol_avg, vol_n = self.volume_stats(rows)
+            oi = self.last_oi[rows]
+            _, oi_ref = self.oi_hist.as_of(rows, now - OI_WINDOW)
+            # 與 screen 相同的算法，資料不足為 NaN（不列入排行）
+            m = self.movers
+            m[rows, 0] = np.where((ref_p > 0) & (cur > 0), (cur - ref_p) / ref_p * 100, np.nan)
+            m[rows, 1] = np.where((vol_n >= 24) & (vol_avg > 0), vol_cur / vol_avg, np.nan)
+            m[rows, 2] = np.where((oi > 0) & (oi_ref > 0), (oi - oi_ref) / oi_ref * 100, np.nan)
+
+    def screen(self, now, subset=None, price_threshold=PRICE_THRESHOLD, volume_threshold=VOLUME_THRESHOLD):
+        """回傳 [(symbol, alert_data)]，判斷邏輯與 tests/test_screener.py 的逐幣參考實作相同；subset 為只篩選的 slot 遮罩，
+        門檻預設為 config，多聊天室時傳入各規則中最寬鬆的門檻"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cur = self.last_price
+            e1 = self.ema_1h
+            vol_cur, vol_avg, vol_n = self.volume_stats(slice(None))
+            mask = (
+                (self.active if subset is None else self.active & subset)
+                & ~np.isnan(cur) & ~np.isnan(self.last_oi) & (cur > 0)
+                & (now - self.monitor_start >= 60)
+                # 1 小時多頭排列（NaN 比較一律為 False）
+                & (e1[:, 0] > e1[:, 1]) & (e1[:, 1] > e1[:, 2]) & (e1[:, 2] > e1[:, 3]) & (cur > e1[:, 2])
+                & (vol_n >= 24)
+                & (vol_avg > 0) & (vol_cur > vol_avg * volume_threshold)
+            )
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+
+            # 只對候選幣種查 15 分鐘前的價格（精確視窗）
+            _, ref_p = self.price_hist.as_of(rows, now - PRICE_WINDOW)
+            price_pct = (cur[rows] - ref_p) / ref_p * 100
+            met = (ref_p > 0) & (price_pct > price_threshold)
+            hits, price_pct = rows[met], price_pct[met]
+            if not len(hits):
+                return []
+
+            vol_ratio = vol_cur[hits] / vol_avg[hits]
+            oi = self.last_oi[hits]
+            _, oi_ref = self.oi_hist.as_of(hits, now - OI_WINDOW)
+            oi_pct = (oi - oi_ref) / oi_ref * 100
+            oi_valid = (oi > 0) & (oi_ref > 0)
+            e4 = self.ema_4h[hits]
+            cur_h = cur[hits]
+            trend_4h = (e4[:, 0] > e4[:, 1]) & (e4[:, 1] > e4[:, 2]) & (e4[:, 2] > e4[:, 3]) & (cur_h > e4[:, 2])
+            # 各視窗的爆倉金額：(幣種, 方向, 視窗)
+            self.liq.roll(now)
+            liq = np.stack([self.liq.sums[w][hits] for w in LIQ_WINDOWS], axis=2)
+
+        results = []
+        for i, slot in enumerate(hits.tolist()):
+            o_pct = float(oi_pct[i]) if oi_valid[i] else None
+            p_pct = float(price_pct[i])
+            reasons = [f"成交量暴增 {vol_ratio[i]:.1f}×\n價格異動 {p_pct:+.2f}%\n持倉變化 {o_pct or 0:+.1f}%"]
+            if trend_4h[i]:
+                reasons.append("4小時呈多頭趨勢")
+            results.append((self.symbols[slot], {"price_pct": p_pct, "oi_pct": o_pct, "vol_ratio": float(vol_ratio[i]),
+                                                 "liq_short": liq[i, LIQ_BUY].tolist(), "liq_long": liq[i, LIQ_SELL].tolist(),
+                                                 "reason": reasons}))
+        return results
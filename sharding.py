@@ -0,0 +1,294 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+import clock
+from config import SHARD_WORKERS, SHARD_CAPACITY, REST_CONCURRENCY, REST_WEIGHT_LIMIT
+from models import symbol_state, market, running, adopt_symbol, forget_symbol
+from binance_opendata import monitor_price_websocket, aggregator, drop_routes
+from backfill import backfill_symbols
+from klinestore import kline_store
+from gateway import gateway
+import metrics
+import utils
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 多行程分片接收 ==================
+# SHARD_WORKERS > 0 時，WS 連線、JSON 解碼、K棒合成與 EMA 分散到 N 個 worker 行程，
+# 每個 worker 只負責一部分幣種。MarketArrays 的所有 slot 陣列放在同一塊
+# shared_memory，worker 直接寫自己負責的 slot（每個 slot 只有一個行程寫入，不加鎖）；
+# 主行程負責幣種清單與 slot 配置、持倉量輪詢、篩選、指令與告警。
+#
+# 控制訊息（主 → worker）：("assign", [(symbol, slot)]) / ("drop", [symbol]) / ("stop",)
+# 回報（worker → 主）：("released", worker, [(symbol, slot)]) / ("beat", worker, 幣種數, CPU 秒數)
+
+CONTROL_POLL = 0.2      # worker 檢查控制訊息間隔（秒）
+HEARTBEAT_INTERVAL = 5  # worker 回報間隔（秒）
+STATUS_INTERVAL = 60    # 主行程輸出分片狀態間隔（秒）
+REBALANCE_SLACK = 0.2   # 負責幣種數差距超過平均的兩成才搬移
+
+# ---------- worker 行程 ----------
+
+def weight_share(workers):
+    # 每分鐘權重預算平均分給主行程與 N 個 worker
+    return REST_WEIGHT_LIMIT // (workers + 1)
+
+def worker_main(index, shm_name, capacity, workers, control, events, log_queue):
+    utils.log_to_queue(log_queue)
+    try:
+        asyncio.run(_worker(index, shm_name, capacity, workers, control, events))
+    except KeyboardInterrupt:
+        pass
+
+async def _worker(index, shm_name, capacity, workers, control, events):
+    market.share(shm_name, capacity)
+    # 同 IP 的 REST 權重與同時請求數由主行程與各 worker 分攤（標頭回報的用量只能事後校正）
+    gateway.weight_limit = weight_share(workers)
+    gateway.concurrency = max(2, REST_CONCURRENCY // workers)
+    log.info(f"[分片 {index}] 已啟動")
+    # 全市場 stream（標記價格、強平單）只由主行程訂閱，worker 只收各自幣種的 stream
+    ws_task = asyncio.create_task(monitor_price_websocket(market_wide=False))
+    store_task = asyncio.create_task(kline_store.run())
+    backfills = set()
+    last_beat = 0.0
+    try:
+        while True:
+            await asyncio.sleep(CONTROL_POLL)
+            try:
+                while True:
+                    msg = control.get_nowait()
+                    if msg[0] == "stop":
+                        return
+                    if msg[0] == "assign":
+                        now = clock.now()
+                        added = [adopt_symbol(sym, slot, now).symbol for sym, slot in msg[1]]
+                        # 接手的幣種在本行程回補 1h/4h K線重建 EMA（本地儲存有的不打 REST）
+                        task = asyncio.create_task(backfill_symbols(added))
+                        backfills.add(task)
+                        task.add_done_callback(backfills.discard)
+                    elif msg[0] == "drop":
+                        released = []
+                        for sym in msg[1]:
+                            state = symbol_state.get(sym)
+                            if state is None:
+                                continue
+                            released.append((sym, state.slot))
+                            forget_symbol(sym)
+                            aggregator.discard(sym)
+                            drop_routes(sym)
+                        events.put(("released", index, released))
+            except queue.Empty:
+                pass
+            now = time.time()
+            if now - last_beat >= HEARTBEAT_INTERVAL:
+                events.put(("beat", index, len(symbol_state), time.process_time()))
+                last_beat = now
+    finally:
+        ws_task.cancel()
+        store_task.cancel()
+        for task in backfills:
+            task.cancel()
+        await asyncio.gather(ws_task, store_task, *backfills, return_exceptions=True)
+        await gateway.close()
+
+# ---------- 主行程（協調者） ----------
+
+class ShardCoordinator:
+    def __init__(self, workers=SHARD_WORKERS, capacity=SHARD_CAPACITY):
+        self.workers = workers
+        self.capacity = capacity
+        self.ctx = multiprocessing.get_context("spawn")
+        self.shm = None
+        self.procs = [None] * workers
+        self.controls = [None] * workers
+        self.events = None
+        self.log_queue = None
+        self.owner = {}   # symbol -> (worker, slot)
+        self.moving = {}  # 搬移中的 symbol -> 目標 worker（等原 worker 放掉 slot）
+        self.dropping = {}  # worker -> {已下架的 symbol: slot}（等該 worker 確認放掉才回收）
+        self.beats = {}   # worker -> (回報時間, 幣種數, CPU 秒數)
+        self.cpu = {}     # worker -> 最近一段的 CPU 使用率
+        self.restarts = 0
+
+    def start(self):
+        if self.shm is not None:
+            return
+        # 啟動前已載入的快照資料一併複製到共享記憶體
+        self.shm = market.share(capacity=self.capacity)
+        gateway.weight_limit = weight_share(self.workers)
+        self.events = self.ctx.Queue()
+        self.log_queue = self.ctx.Queue()
+        utils.forward_logs(self.log_queue)
+        for i in range(self.workers):
+            self._spawn(i)
+        log.info(f"分片接收已啟動：{self.workers} 個 worker，共享記憶體 {self.shm.size / 1e6:.1f} MB")
+
+    def _spawn(self, index):
+        control = self.ctx.Queue()
+        proc = self.ctx.Process(target=worker_main, name=f"shard-{index}", daemon=True,
+                                args=(index, self.shm.name, self.capacity, self.workers, control,
+                                      self.events, self.log_queue))
+        proc.start()
+        self.procs[index], self.controls[index] = proc, control
+        # 重啟的 worker 接回原本負責的幣種
+        items = [(sym, slot) for sym, (w, slot) in self.owner.items() if w == index]
+        if items:
+            control.put(("assign", items))
+
+    # ---------- 分配 ----------
+
+    def _counts(self):
+        # 搬移中的幣種算在目標 worker
+        counts = [0] * self.workers
+        for sym, (w, _) in self.owner.items():
+            counts[self.moving.get(sym, w)] += 1
+        return counts
+
+    def rebalance(self):
+        # 下架（或重新上架換了 slot）的幣種通知原 worker 放掉
+        drop = {}
+        for sym, (w, slot) in list(self.owner.items()):
+            state = symbol_state.get(sym)
+            if state is None or state.slot != slot:
+                del self.owner[sym]
+                self.moving.pop(sym, None)
+                self.dropping.setdefault(w, {})[sym] = slot
+                drop.setdefault(w, []).append(sym)
+
+        # 新幣種交給負責最少的 worker
+        counts = self._counts()
+        assign = {}
+        fresh = set()
+        for sym, state in symbol_state.items():
+            if sym in self.owner:
+                continue
+            fresh.add(sym)
+            w = counts.index(min(counts))
+            counts[w] += 1
+            self.owner[sym] = (w, state.slot)
+            assign.setdefault(w, []).append((sym, state.slot))
+
+        # 幣種下架造成負載不均時搬移：先由原 worker 放掉，收到確認後才交給新的
+        avg = len(self.owner) / self.workers
+        while max(counts) - min(counts) > max(2, avg * REBALANCE_SLACK):
+            src, dst = counts.index(max(counts)), counts.index(min(counts))
+            sym = next((s for s, (w, _) in self.owner.items()
+                        if w == src and s not in self.moving and s not in fresh), None)
+            if sym is None:
+                break
+            self.moving[sym] = dst
+            drop.setdefault(src, []).append(sym)
+            counts[src] -= 1
+            counts[dst] += 1
+
+        for w, syms in drop.items():
+            self.controls[w].put(("drop", syms))
+        for w, items in assign.items():
+            self.controls[w].put(("assign", items))
+
+    def _released(self, index, items):
+        held = []
+        dropping = self.dropping.get(index, {})
+        for sym, slot in items:
+            dst = self.moving.pop(sym, None)
+            state = symbol_state.get(sym)
+            if dropping.get(sym) == slot:
+                del dropping[sym]
+                held.append(slot)
+            elif dst is not None and state is not None and state.slot == slot:
+                self.owner[sym] = (dst, slot)
+                self.controls[dst].put(("assign", [(sym, slot)]))
+            elif dst is not None:
+                # 搬移途中下架：slot 已放掉，不再列入負責清單
+                self.owner.pop(sym, None)
+                held.append(slot)
+            # 其餘為重啟時已回收的遲到確認，不重複放回
+        market.release(held)
+
+    def poll_events(self):
+        while True:
+            try:
+                msg = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if msg[0] == "released":
+                self._released(msg[1], msg[2])
+            elif msg[0] == "beat":
+                _, index, n, cpu = msg
+                prev = self.beats.get(index)
+                now = time.time()
+                if prev is not None and now > prev[0]:
+                    self.cpu[index] = (cpu - prev[2]) / (now - prev[0])
+                self.beats[index] = (now, n, cpu)
+
+    def supervise(self):
+        for i, proc in enumerate(self.procs):
+            if proc is not None and not proc.is_alive():
+                log.error("[分片 %d] worker 結束（exit %s），重新啟動", i, proc.exitcode)
+                self.restarts += 1
+                self.beats.pop(i, None)
+                # 原本要搬走的幣種收不到放掉的確認，取消搬移、由重啟的 worker 接回
+                for sym in [s for s in self.moving if self.owner[s][0] == i]:
+                    del self.moving[sym]
+                # 已下架、還沒確認放掉的 slot 不會再有人回報，直接回收
+                lost = list(self.dropping.pop(i, {}).values())
+                if lost:
+                    market.release(lost)
+                self._spawn(i)
+
+    def sync_states(self):
+        # 主行程的 5m 收盤時間由共享陣列更新（快照用；價格 / 資金費率本來就讀陣列）
+        for state in symbol_state.values():
+            last_t, _ = market.vol_5m.last(state.slot)
+            if last_t is not None:
+                state.last_kline_close_time = int(last_t)
+
+    def log_status(self):
+        parts = [f"#{i} {self.beats[i][1]} 幣 CPU {self.cpu.get(i, 0) * 100:.0f}%" for i in sorted(self.beats)]
+        log.info("分片狀態：%s", "，".join(parts) or "尚無回報")
+
+    def collect(self):
+        return (metrics.family("shard_symbols", "gauge", "各 worker 負責的幣種數",
+                               [({"worker": i}, b[1]) for i, b in sorted(self.beats.items())])
+                + metrics.family("shard_cpu_ratio", "gauge", "各 worker 最近一段的 CPU 使用率",
+                                 [({"worker": i}, round(c, 3)) for i, c in sorted(self.cpu.items())])
+                + metrics.family("shard_restarts_total", "counter", "worker 異常結束後重啟次數",
+                                 [({}, self.restarts)]))
+
+    async def run(self):
+        self.start()
+        metrics.collectors.append(self.collect)
+        last_status = time.time()
+        try:
+            while running:
+                self.poll_events()
+                self.supervise()
+                self.rebalance()
+                self.sync_states()
+                if time.time() - last_status >= STATUS_INTERVAL:
+                    self.log_status()
+                    last_status = time.time()
+                await asyncio.sleep(1)
+        finally:
+            metrics.collectors.remove(self.collect)
+            await self.close()
+
+    async def close(self):
+        if self.shm is None:
+            return
+        for control, proc in zip(self.controls, self.procs):
+            if proc is not None and proc.is_alive():
+                control.put(("stop",))
+        for proc in self.procs:
+            if proc is not None:
+                await asyncio.to_thread(proc.join, 5)
+                if proc.is_alive():
+                    proc.terminate()
+        # 陣列仍指向這塊記憶體，只移除名稱，行程結束時釋放
+        self.shm.unlink()
+        self.shm = None
+
+
+shards = ShardCoordinator()
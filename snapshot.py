@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+import numpy as np
+from config import SNAPSHOT_PATH, SNAPSHOT_INTERVAL, SHARD_WORKERS
+from models import symbol_state, register_symbol, market, running, last_alert, KLINE_INTERVALS, KlineTrack
+from indicators import EMA_PERIODS
+from subscriptions import subscriptions
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 狀態快照（欄式陣列，非 pickle） ==================
+# 每個欄位一個陣列，依 symbols 順序排列；不定長的歷史資料攤平成
+# values + offsets（第 i 個幣的資料為 values[offsets[i]:offsets[i+1]]）
+
+PRICE_KEEP = 1000  # 15 分鐘視窗 + 緩衝（秒）
+OI_KEEP = 3700     # 1 小時視窗 + 緩衝（秒）
+
+SCALAR_FIELDS = ("last_price", "last_oi", "funding_rate", "monitor_start", "last_kline_close_time")
+SNAPSHOT_VERSION = 3
+
+def _stores():
+    # (欄位名稱, 時間序列, 保留秒數)；成交量以根數為準，不依時間裁切
+    return (("price_history", market.price_hist, PRICE_KEEP),
+            ("oi_history", market.oi_hist, OI_KEEP),
+            ("volume_5m", market.vol_5m, None))
+
+def _ragged(seqs, width=None):
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in seqs])
+    shape = (int(offsets[-1]),) if width is None else (int(offsets[-1]), width)
+    values = np.concatenate([np.asarray(x, dtype=np.float64).reshape((-1,) + shape[1:]) for x in seqs]
+                            or [np.empty(shape)]).reshape(shape)
+    return values, offsets
+
+def build_snapshot():
+    # 在 event loop 內同步取值，確保資料一致
+    symbols = list(symbol_state)
+    states = [symbol_state[s] for s in symbols]
+    arrays = {"symbols": np.array(symbols, dtype=str), "saved_at": np.array(time.time()),
+              "version": np.array(SNAPSHOT_VERSION)}
+
+    for f in SCALAR_FIELDS:
+        arrays[f] = np.array([np.nan if v is None else v for v in (getattr(st, f) for st in states)], dtype=np.float64)
+    # 告警冷卻依聊天室記錄：時間攤平成 values + offsets，聊天室 id 另存同順序的字串陣列
+    alerts = [last_alert.get(s, {}) for s in symbols]
+    arrays["last_alert"], arrays["last_alert_off"] = _ragged([list(a.values()) for a in alerts])
+    arrays["last_alert_chat"] = np.array([c for a in alerts for c in a], dtype=str)
+
+    for name, store, _ in _stores():
+        seqs = [np.column_stack(store.series(st.slot)) for st in states]
+        arrays[name], arrays[f"{name}_off"] = _ragged(seqs, width=2)
+
+    # 分片模式下 K棒 / EMA 只存在各 worker 行程，主行程的 KlineTrack 從未更新：
+    # 存成空的，載入後由 worker 接手時回補重建，避免還原出過期的 EMA
+    empty = KlineTrack()
+    for iv in KLINE_INTERVALS:
+        tracks = [empty if SHARD_WORKERS else st.klines[iv] for st in states]
+        arrays[f"last_kline_{iv}_close_time"] = np.array([t.last_close_time for t in tracks], dtype=np.float64)
+        arrays[f"kline_{iv}_closes"], arrays[f"kline_{iv}_closes_off"] = _ragged([t.closes for t in tracks])
+        banks = [t.ema.emas for t in tracks]
+        arrays[f"ema_{iv}_value"] = np.array(
+            [[np.nan if b[p].value is None else b[p].value for p in EMA_PERIODS] for b in banks],
+            dtype=np.float64).reshape(len(banks), len(EMA_PERIODS))
+        arrays[f"ema_{iv}_count"] = np.array(
+            [[b[p].count for p in EMA_PERIODS] for b in banks], dtype=np.int64).reshape(len(banks), len(EMA_PERIODS))
+        arrays[f"ema_{iv}_seed"] = np.array(
+            [[b[p].seed_sum for p in EMA_PERIODS] for b in banks], dtype=np.float64).reshape(len(banks), len(EMA_PERIODS))
+    return arrays
+
+def write_snapshot(arrays, path=SNAPSHOT_PATH):
+    # 先寫暫存檔再 os.replace，避免寫到一半被讀到
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    if not os.path.exists(path):
+        return 0
+    start = time.time()
+    now = time.time()
+    with np.load(path, allow_pickle=False) as z:
+        d = {k: z[k] for k in z.files}
+    if int(d.get("version", 1)) != SNAPSHOT_VERSION:
+        log.warning(f"狀態快照格式不符，略過：{path}")
+        return 0
+
+    for i, sym in enumerate(d["symbols"].tolist()):
+        st = register_symbol(sym, now)
+        for f in SCALAR_FIELDS:
+            v = float(d[f][i])
+            if f in ("last_price", "last_oi"):
+                v = None if np.isnan(v) else v
+            elif f == "last_kline_close_time":
+                v = int(v)
+            setattr(st, f, v)
+        for iv in KLINE_INTERVALS:
+            track = st.klines[iv]
+            track.last_close_time = int(d[f"last_kline_{iv}_close_time"][i])
+            off = d[f"kline_{iv}_closes_off"]
+            track.closes.extend(d[f"kline_{iv}_closes"][off[i]:off[i + 1]].tolist())
+            emas = track.ema.emas
+            for j, p in enumerate(EMA_PERIODS):
+                v = float(d[f"ema_{iv}_value"][i, j])
+                emas[p].value = None if np.isnan(v) else v
+                emas[p].count = int(d[f"ema_{iv}_count"][i, j])
+                emas[p].seed_sum = float(d[f"ema_{iv}_seed"][i, j])
+
+        slot = st.slot
+        market.monitor_start[slot] = st.monitor_start
+        market.last_oi[slot] = np.nan if st.last_oi is None else st.last_oi
+        market.sync_emas(st)
+
+        # 丟掉超出視窗的歷史與已過冷卻的告警
+        for name, store, keep in _stores():
+            off = d[f"{name}_off"]
+            rows = d[name][off[i]:off[i + 1]]
+            if keep is not None:
+                rows = rows[rows[:, 0] >= now - keep]
+            store.load(slot, rows[:, 0], rows[:, 1])
+        off = d["last_alert_off"]
+        for chat, alert_t in zip(d["last_alert_chat"][off[i]:off[i + 1]].tolist(), d["last_alert"][off[i]:off[i + 1]].tolist()):
+            rule = subscriptions.rules.get(chat)
+            if rule is not None and now - alert_t < rule.cooldown:
+                last_alert[sym][chat] = alert_t
+
+    log.info(f"載入狀態快照：{len(d['symbols'])} 幣，耗時 {(time.time() - start) * 1000:.0f} ms")
+    return len(d["symbols"])
+
+async def save_snapshot():
+    arrays = build_snapshot()
+    # 寫檔放到 thread，不卡 event loop
+    await asyncio.to_thread(write_snapshot, arrays)
+
+async def periodic_snapshot():
+    while running:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await save_snapshot()
+        except Exception as e:
+            log.error("[快照錯誤] %s", e)
@@ -0,0 +1,143 @@
+import json
+import os
+import numpy as np
+from config import CHAT_ID, PRICE_THRESHOLD, VOLUME_THRESHOLD, ALERT_COOLDOWN, LIQ_THRESHOLD, SUBSCRIPTIONS_PATH
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 訂閱規則（多聊天室） ==================
+# 每個聊天室一組規則：價格 / 成交量 / 持倉 / 15 分鐘空單爆倉門檻、冷卻秒數、幣種白名單 / 黑名單。
+# 篩選以所有規則中最寬鬆的門檻跑一次，觸發的幣種再依「相同門檻」分組比對，
+# 成本隨不同門檻組數增加，而不是聊天室數 × 幣種數
+
+RULE_FIELDS = ("price", "volume", "oi", "liq", "cooldown")
+OPTIONAL_FIELDS = ("oi", "liq")  # 可設為 none（不作為條件）
+
+
+class Rule:
+    __slots__ = ("price", "volume", "oi", "liq", "cooldown", "allow", "deny")
+
+    def __init__(self, price=PRICE_THRESHOLD, volume=VOLUME_THRESHOLD, oi=None, liq=LIQ_THRESHOLD,
+                 cooldown=ALERT_COOLDOWN, allow=None, deny=()):
+        self.price = float(price)
+        self.volume = float(volume)
+        self.oi = None if oi is None else float(oi)  # None 為不限持倉變化
+        self.liq = None if liq is None else float(liq)  # None 為不限爆倉金額
+        self.cooldown = float(cooldown)
+        self.allow = None if allow is None else set(allow)  # None 為全部幣種
+        self.deny = set(deny)
+
+    def key(self):
+        return self.price, self.volume, self.oi, self.liq
+
+    def accepts(self, sym):
+        return sym not in self.deny and (self.allow is None or sym in self.allow)
+
+    def to_dict(self):
+        return {"price": self.price, "volume": self.volume, "oi": self.oi, "liq": self.liq, "cooldown": self.cooldown,
+                "allow": None if self.allow is None else sorted(self.allow), "deny": sorted(self.deny)}
+
+    def describe(self):
+        oi = "不限" if self.oi is None else f"> {self.oi:g}%"
+        liq = "不限" if self.liq is None else f"> {self.liq:,.0f} USDT"
+        allow = "全部" if self.allow is None else " ".join(sorted(self.allow)) or "（空）"
+        deny = " ".join(sorted(self.deny)) or "無"
+        return (f"價格 > {self.price:g}%\n成交量 > {self.volume:g}×\n持倉變化 {oi}\n15 分鐘空單爆倉 {liq}\n"
+                f"冷卻 {self.cooldown:g} 秒\n白名單：{allow}\n黑名單：{deny}")
+
+
+class SubscriptionRegistry:
+    def __init__(self, path=SUBSCRIPTIONS_PATH):
+        self.path = path
+        self.rules = {}    # chat_id(str) -> Rule
+        self._groups = None
+
+    # ---------- 讀寫 ----------
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            # 第一次啟動沿用原本的單一聊天室與 config 門檻
+            if CHAT_ID:
+                self.rules[str(CHAT_ID)] = Rule()
+                self.save()
+            return len(self.rules)
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.rules = {chat: Rule(**r) for chat, r in data.items()}
+        self._groups = None
+        log.info(f"載入訂閱：{len(self.rules)} 個聊天室，{len(self.groups())} 組門檻")
+        return len(self.rules)
+
+    def save(self):
+        self._groups = None
+        if self.path is None:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({chat: r.to_dict() for chat, r in self.rules.items()}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    # ---------- 編輯 ----------
+
+    def subscribe(self, chat_id):
+        rule = self.rules.get(chat_id)
+        if rule is None:
+            rule = self.rules[chat_id] = Rule()
+            self.save()
+        return rule
+
+    def unsubscribe(self, chat_id):
+        rule = self.rules.pop(chat_id, None)
+        if rule is not None:
+            self.save()
+        return rule
+
+    def update(self, chat_id, **fields):
+        rule = self.rules[chat_id]
+        for k, v in fields.items():
+            setattr(rule, k, v)
+        self.save()
+        return rule
+
+    # ---------- 篩選 ----------
+
+    def groups(self):
+        """{(價格, 成交量, 持倉, 爆倉) 門檻: [(chat_id, Rule)]}，規則變動後重建"""
+        if self._groups is None:
+            groups = {}
+            for chat, rule in self.rules.items():
+                groups.setdefault(rule.key(), []).append((chat, rule))
+            self._groups = groups
+        return self._groups
+
+    def loosest(self):
+        """所有規則中最低的價格 / 成交量門檻，給 MarketArrays.screen 當一次篩選的下限"""
+        keys = self.groups()
+        return min(k[0] for k in keys), min(k[1] for k in keys)
+
+    def route(self, triggered):
+        """triggered 為 screen 的結果，回傳 [(chat_id, Rule, symbol, alert_data)]"""
+        if not triggered:
+            return []
+        price = np.array([res["price_pct"] for _, res in triggered])
+        volume = np.array([res["vol_ratio"] for _, res in triggered])
+        oi = np.array([np.nan if res["oi_pct"] is None else res["oi_pct"] for _, res in triggered])
+        liq = np.array([res["liq_short"][1] for _, res in triggered])  # 15 分鐘空單爆倉金額
+        out = []
+        with np.errstate(invalid="ignore"):
+            for (p, v, o, l), members in self.groups().items():
+                met = (price > p) & (volume > v)
+                if o is not None:
+                    met &= oi > o
+                if l is not None:
+                    met &= liq > l
+                for i in np.flatnonzero(met).tolist():
+                    sym, res = triggered[i]
+                    for chat, rule in members:
+                        if rule.accepts(sym):
+                            out.append((chat, rule, sym, res))
+        return out
+
+
+subscriptions = SubscriptionRegistry()
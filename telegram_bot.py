@@ -1,51 +1,220 @@
+import asyncio
+import statistics
 import time
+import clock
 import models
+import metrics
 from datetime import datetime
-from config import CHAT_ID, ALERT_COOLDOWN
-from models import symbol_state, last_alert
+from telegram.error import RetryAfter, NetworkError, TimedOut
+from config import ALERT_COOLDOWN, ALERT_QUEUE_SIZE, ALERT_DIGEST_MAX, DEPTH_TOP_N
+from models import symbol_state, market, last_alert, alert_latency
+from depth import depth
+from metrics import TELEGRAM_SEND, ALERTS
 from utils import setup_logging
 
 log = setup_logging()
 
 # ================== Telegram Bot ==================
 
-async def send_alert(symbol: str, alert_data: dict):
-    try:
-        now = time.time()
-        if now - last_alert[symbol] < ALERT_COOLDOWN:
-            return
-        last_alert[symbol] = now
-
-        state = symbol_state[symbol]
-        price = state["last_price"]
-        oi_pct = alert_data.get("oi_pct")
-        funding = state["funding_rate"]
-        reason = alert_data["reason"]
-        current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-
-        title = f"🚨 {symbol} 異動警報！ ⌚ 觸發時間：{current_time}"
-        price_line = f"💰 價格：`{price:,.8f}` USDT"
-        trigger_line = ""
-        if alert_data.get("price_pct") is not None:
-            trigger_line = "🟢📈 上漲" if alert_data.get("price_pct", 0) >= 0 else "🔴📉 下跌" if alert_data.get("price_pct") is not None else ""
-            pct = alert_data["price_pct"]
-            sign = "+" if pct >= 0 else ""
-            price_line += f" （`{sign}{pct:.2f}%`）"
-
-        oi_line = f"📊 持倉量變化：`{oi_pct:+.1f}%`" if oi_pct is not None else "📊 持倉量變化：`N/A`"
-        fund_line = f"💲 資金費率：`{funding:.4f}%`"
-        if isinstance(reason, (list, tuple)):
-            reason_text = "\n".join(reason)
+def format_alert(symbol, alert_data, now):
+    # 價格 / 資金費率取共享陣列，分片模式下由 worker 行程寫入
+    slot = symbol_state[symbol].slot
+    price = float(market.last_price[slot])
+    oi_pct = alert_data.get("oi_pct")
+    funding = float(market.funding_rate[slot])
+    reason = alert_data["reason"]
+    current_time = datetime.fromtimestamp(now).strftime("%Y/%m/%d %H:%M:%S")
+
+    title = f"🚨 {symbol} 異動警報！ ⌚ 觸發時間：{current_time}"
+    price_line = f"💰 價格：`{price:,.8f}` USDT"
+    trigger_line = ""
+    if alert_data.get("price_pct") is not None:
+        trigger_line = "🟢📈 上漲" if alert_data.get("price_pct", 0) >= 0 else "🔴📉 下跌" if alert_data.get("price_pct") is not None else ""
+        pct = alert_data["price_pct"]
+        sign = "+" if pct >= 0 else ""
+        price_line += f" （`{sign}{pct:.2f}%`）"
+
+    oi_line = f"📊 持倉量變化：`{oi_pct:+.1f}%`" if oi_pct is not None else "📊 持倉量變化：`N/A`"
+    liq_line = ""
+    short, long = alert_data.get("liq_short"), alert_data.get("liq_long")
+    if short is not None and (any(short) or any(long)):
+        # 5m / 15m / 1h 爆倉金額：空單被強平（軋空）/ 多單被強平
+        liq_line = (f"💥 爆倉 5m/15m/1h：空單 `{' / '.join(map(_usd, short))}`，"
+                    f"多單 `{' / '.join(map(_usd, long))}`")
+    depth_line = ""
+    imbalance = depth.imbalance(symbol)
+    if imbalance is not None:
+        # 本地委託簿前 N 檔掛單量占比
+        depth_line = f"📚 前 {DEPTH_TOP_N} 檔掛單：買 `{(1 + imbalance) * 50:.0f}%` / 賣 `{(1 - imbalance) * 50:.0f}%`"
+    fund_line = f"💲 資金費率：`{funding:.4f}%`"
+    if isinstance(reason, (list, tuple)):
+        reason_text = "\n".join(reason)
+    else:
+        reason_text = str(reason)
+    reason_line = f"🧩 觸發原因：{reason_text}"
+    chart_link = f"📈 [查看圖表](https://www.binance.com/en/futures/{symbol})"
+
+    return "\n".join(filter(None, [title, trigger_line, price_line, oi_line, liq_line, depth_line, fund_line, reason_line, chart_link]))
+
+def _usd(v):
+    if v >= 1e6:
+        return f"{v / 1e6:.1f}M"
+    if v >= 1e3:
+        return f"{v / 1e3:.0f}K"
+    return f"{v:.0f}"
+
+# ================== 告警派送佇列 ==================
+# 篩選只把告警排進佇列，不等網路；背景 worker 依 Telegram 限制送出：
+# 同一聊天室每秒 1 則、全域每秒 30 則，429 依 retry_after 暫停後重送。
+# 排隊中累積多則時依聊天室合併成摘要；送達後才寫入該聊天室的冷卻時間
+
+TELEGRAM_MAX_CHARS = 4096
+MAX_RETRIES = 5
+DIGEST_HEADER = "📦 {} 個幣種同時異動\n\n"
+
+
+class AlertDispatcher:
+    def __init__(self, maxsize=ALERT_QUEUE_SIZE, chat_interval=1.0, global_interval=1 / 30):
+        self.maxsize = maxsize
+        self.chat_interval = chat_interval
+        self.global_interval = global_interval
+        self.queue = None
+        self.worker = None
+        self.pending = set()     # 已排隊、尚未送達的 (chat_id, 幣種)
+        self.last_chat_send = {}
+        self.last_send = 0.0
+        self.dropped = 0
+
+    def start(self):
+        if self.worker is None:
+            self.queue = asyncio.Queue(self.maxsize)
+            self.worker = asyncio.create_task(self.run())
+        return self.worker
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    def submit(self, chat_id, symbol, alert_data, recv_t=None, cooldown=ALERT_COOLDOWN):
+        """排入一則告警（不等待），冷卻中、已在佇列或佇列已滿時回傳 False"""
+        now = clock.now()
+        key = (chat_id, symbol)
+        if key in self.pending or now - last_alert[symbol].get(chat_id, 0.0) < cooldown:
+            return False
+        self.start()
+        try:
+            self.queue.put_nowait((symbol, format_alert(symbol, alert_data, now), now, recv_t, alert_data["reason"], chat_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            log.warning("[告警佇列已滿] 略過 %s", symbol)
+            return False
+        self.pending.add(key)
+        return True
+
+    async def join(self):
+        if self.queue is not None:
+            await self.queue.join()
+
+    # ---------- worker ----------
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # 排隊中已累積的告警一起取出，合併成摘要
+            while len(batch) < ALERT_DIGEST_MAX and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # 同一聊天室的告警合併，各聊天室分開送
+            chats = {}
+            for item in batch:
+                chats.setdefault(item[5], []).append(item)
+            try:
+                for chat_id, items in chats.items():
+                    for chunk in self._chunks(items):
+                        await self._deliver(chat_id, chunk)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    @staticmethod
+    def _chunks(batch):
+        # 摘要（含標題）不超過 Telegram 單則上限
+        head = len(DIGEST_HEADER.format(len(batch)))
+        chunk, size = [], head
+        for item in batch:
+            n = len(item[1]) + 2
+            if chunk and size + n > TELEGRAM_MAX_CHARS:
+                yield chunk
+                chunk, size = [], head
+            chunk.append(item)
+            size += n
+        if chunk:
+            yield chunk
+
+    async def _pace(self, chat_id):
+        now = time.monotonic()
+        wait = max(self.last_chat_send.get(chat_id, 0.0) + self.chat_interval,
+                   self.last_send + self.global_interval) - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.last_send = self.last_chat_send[chat_id] = time.monotonic()
+
+    async def _deliver(self, chat_id, items):
+        if len(items) == 1:
+            text = items[0][1]
         else:
-            reason_text = str(reason)
-        reason_line = f"🧩 觸發原因：{reason_text}"
-        chart_link = f"📈 [查看圖表](https://www.binance.com/en/futures/{symbol})"
-
-        text = "\n".join(filter(None, [title, trigger_line, price_line, oi_line, fund_line, reason_line, chart_link]))
-
-        await models.bot.send_message(chat_id=CHAT_ID, text=text, parse_mode="Markdown", disable_web_page_preview=True)
-        log.info(f"告警 → {symbol}：{reason}")
-        return 1
-    except Exception as e:
-        log.info(f"[Telegram 錯誤] {symbol}: {e} \n {symbol_state[symbol]} \n {alert_data}")
-        return 0
\ No newline at end of file
+            text = DIGEST_HEADER.format(len(items)) + "\n\n".join(item[1] for item in items)
+        symbols = [item[0] for item in items]
+        sent = False
+        for attempt in range(MAX_RETRIES):
+            await self._pace(chat_id)
+            try:
+                t0 = time.perf_counter()
+                await models.bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown", disable_web_page_preview=True)
+                TELEGRAM_SEND.observe(time.perf_counter() - t0)
+                sent = True
+                break
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                log.warning("[Telegram 限流] %s 暫停 %.0f 秒後重送", ",".join(symbols), delay)
+                await asyncio.sleep(delay)
+            except (TimedOut, NetworkError) as e:
+                log.warning("[Telegram 連線錯誤] %s: %s（第 %d 次）", ",".join(symbols), e, attempt + 1)
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                log.info("[Telegram 錯誤] %s: %s \n %s", symbols, e, [symbol_state.get(s) for s in symbols])
+                break
+
+        self.pending.difference_update((chat_id, s) for s in symbols)
+        if not sent:
+            # 送出失敗不寫入冷卻，下次符合條件可再告警
+            log.error("[Telegram 錯誤] %s 告警未送達", ",".join(symbols))
+            return False
+
+        # 送達才寫入冷卻
+        now = clock.now()
+        for symbol, _, queued_at, recv_t, reason, _ in items:
+            last_alert[symbol][chat_id] = queued_at
+            if recv_t is not None:
+                # WS 訊息進來到告警送達的延遲
+                alert_latency.append(now - recv_t)
+            log.info("告警 → %s（%s）：%s", symbol, chat_id, reason)
+        ALERTS.inc(len(items))
+        if alert_latency:
+            log.info("告警延遲：最近 %.0f ms，中位數 %.0f ms（%d 筆）",
+                     alert_latency[-1] * 1000, statistics.median(alert_latency) * 1000, len(alert_latency))
+        return True
+
+    def collect(self):
+        depth = self.queue.qsize() if self.queue is not None else 0
+        return (metrics.family("alert_queue_depth", "gauge", "等待送出的告警數", [({}, depth)])
+                + metrics.family("alerts_dropped_total", "counter", "佇列已滿而略過的告警數", [({}, self.dropped)]))
+
+
+dispatcher = AlertDispatcher()
+metrics.collectors.append(dispatcher.collect)
+
+
+def send_alert(chat_id, symbol, alert_data, recv_t=None, cooldown=ALERT_COOLDOWN):
+    return dispatcher.submit(chat_id, symbol, alert_data, recv_t, cooldown)
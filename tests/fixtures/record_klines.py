@@ -0,0 +1,55 @@
+"""錄製 REST K線當作 aggregator 測試資料（需可連線 fapi.binance.com）
+
+  python tests/fixtures/record_klines.py BTCUSDT --start 2025-10-01T00:00 --hours 8
+
+同一段時間的 1m / 5m / 1h / 4h K線寫到 tests/fixtures/klines_<symbol>.json，
+起點需對齊 4 小時邊界（UTC）。檔案的 source 記錄來源：實際錄製為 REST 主機名稱，
+離線合成（高週期由 1m 加總而來）為 synthetic，後者不拿來驗證合成結果
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config import REST_BASE_URL
+from gateway import gateway, kline_weight
+
+INTERVALS = {"1m": 60_000, "5m": 300_000, "1h": 3_600_000, "4h": 14_400_000}
+
+
+async def record(symbol, start_ms, hours):
+    end_ms = start_ms + hours * 3_600_000
+    out = {"symbol": symbol, "source": urlparse(REST_BASE_URL).hostname, "start": start_ms, "end": end_ms}
+    try:
+        for interval, span in INTERVALS.items():
+            rows, t = [], start_ms
+            while t < end_ms:
+                limit = min(1500, (end_ms - t) // span)
+                batch = await gateway.get("/fapi/v1/klines", {"symbol": symbol, "interval": interval, "startTime": t,
+                                                              "endTime": end_ms - 1, "limit": limit},
+                                          weight=kline_weight(limit))
+                rows += batch
+                t = batch[-1][0] + span if batch else end_ms
+            out[interval] = rows
+    finally:
+        await gateway.close()
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("symbol")
+    parser.add_argument("--start", default="2025-10-01T00:00", help="UTC，需對齊 4 小時")
+    parser.add_argument("--hours", type=int, default=8)
+    args = parser.parse_args()
+    start = int(datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc).timestamp() * 1000)
+    assert start % INTERVALS["4h"] == 0, "起點需對齊 4 小時邊界"
+    data = asyncio.run(record(args.symbol.upper(), start, args.hours))
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"klines_{args.symbol.upper()}.json")
+    with open(path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    print(f"寫入 {path}：" + "，".join(f"{iv} {len(data[iv])} 根" for iv in INTERVALS))
@@ -0,0 +1,116 @@
+import json
+import os
+import pytest
+from aggregator import CandleAggregator, TIMEFRAMES, MINUTE_MS
+from klinestore import KlineStore
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "klines_BTCUSDT.json")
+
+
+@pytest.fixture(scope="module")
+def rest():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def feed(agg, sym, rows):
+    for k in rows:
+        agg.add_minute(sym, k[0], float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), float(k[7]))
+
+
+def collect(rows, sym="BTCUSDT"):
+    out = []
+    agg = CandleAggregator(lambda s, iv, c, close_ms, complete: out.append((iv, c, close_ms, complete)))
+    feed(agg, sym, rows)
+    return out
+
+
+@pytest.mark.parametrize("interval", list(TIMEFRAMES))
+def test_aggregated_candles_match_rest(rest, interval):
+    if rest.get("source") == "synthetic":
+        # 離線合成的高週期本身就是 1m 加總，比對沒有意義
+        pytest.skip("fixture 非實際錄製，請以 tests/fixtures/record_klines.py 重新錄製")
+    emitted = [(c, close_ms, complete) for iv, c, close_ms, complete in collect(rest["1m"]) if iv == interval]
+    expected = rest[interval]
+    assert len(emitted) == len(expected)
+    for (c, close_ms, complete), k in zip(emitted, expected):
+        assert complete
+        assert (c.open_ms, close_ms) == (k[0], k[6])
+        assert (c.open, c.high, c.low, c.close) == tuple(float(x) for x in k[1:5])
+        assert c.volume == pytest.approx(float(k[5]), rel=1e-12)
+        assert c.quote_vol == pytest.approx(float(k[7]), rel=1e-12)
+
+
+def test_missing_minute_emits_incomplete(rest):
+    span = TIMEFRAMES["5m"]
+    # 拿掉第二根 5m 的最後一分鐘：那根改在換桶時以不完整送出，其餘不受影響
+    drop = rest["5m"][1][0] + span - MINUTE_MS
+    rows = [k for k in rest["1m"] if k[0] != drop]
+    emitted = [(c.open_ms, complete) for iv, c, _, complete in collect(rows) if iv == "5m"]
+    assert (rest["5m"][1][0], False) in emitted
+    assert sum(not complete for _, complete in emitted) == 1
+    assert len(emitted) == len(rest["5m"])
+    hours = [(c.open_ms, complete) for iv, c, _, complete in collect(rows) if iv == "1h"]
+    assert hours[0] == (rest["1h"][0][0], False)
+
+
+def test_first_partial_bucket_is_incomplete(rest):
+    # 訂閱在 5m 中途開始：第一根不完整（交給 REST 補抓），之後都對得上
+    emitted = [(c.open_ms, complete) for iv, c, _, complete in collect(rest["1m"][2:]) if iv == "5m"]
+    assert emitted[0] == (rest["5m"][0][0], False)
+    assert all(complete for _, complete in emitted[1:])
+
+
+def test_duplicate_minutes_ignored(rest):
+    rows = rest["1m"][:60]
+    doubled = [k for k in rows for _ in range(2)]
+    assert [(iv, c.row()) for iv, c, _, _ in collect(doubled)] == [(iv, c.row()) for iv, c, _, _ in collect(rows)]
+
+
+def test_gap_callback_on_first_and_resumed_minute(rest):
+    gaps = []
+    agg = CandleAggregator(lambda *a: None, on_gap=lambda s, open_ms: gaps.append(open_ms))
+    rows = rest["1m"][:10] + rest["1m"][15:20]
+    feed(agg, "BTCUSDT", rows)
+    assert gaps == [rows[0][0], rest["1m"][15][0]]
+
+
+def test_backfill_gap_filled_from_rest(rest, monkeypatch, tmp_path):
+    # 啟動回補停在 5m 第 4 根 / 1h 第 1 根，第一根 WS 分K卻是第 132 分鐘：
+    # 中間整根收盤的 5m（第 5 ~ 26 根）與 1h（第 2 根）要由 REST 補上
+    import asyncio
+    import binance_opendata as bo
+    from models import register_symbol, unregister_symbol
+
+    now = rest["1m"][133][0]
+    applied = []
+
+    async def klines(sym, interval, limit, priority=None):
+        return [k for k in rest[interval] if k[0] <= now][-limit:]
+
+    def apply(sym, interval, close_time, close_price, quote_vol):
+        applied.append((interval, close_time))
+        return True
+
+    monkeypatch.setattr(bo.gateway, "klines", klines)
+    monkeypatch.setattr(bo, "apply_closed_kline", apply)
+    store = KlineStore(str(tmp_path))
+    monkeypatch.setattr(bo, "kline_store", store)
+    state = register_symbol("BTCUSDT", now / 1000)
+    state.last_kline_close_time = rest["5m"][3][6] // 1000
+    state.klines["1h"].last_close_time = rest["1h"][0][6] // 1000
+    agg = CandleAggregator(bo.on_candle_close, on_gap=bo.on_minute_gap)
+
+    async def run():
+        feed(agg, "BTCUSDT", rest["1m"][132:133])
+        await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not asyncio.current_task()))
+
+    try:
+        asyncio.run(run())
+    finally:
+        unregister_symbol("BTCUSDT")
+    assert [t for iv, t in applied if iv == "5m"] == [k[6] // 1000 for k in rest["5m"][4:26]]
+    assert [t for iv, t in applied if iv == "1h"] == [rest["1h"][1][6] // 1000]
+    assert not [iv for iv, _ in applied if iv == "4h"]
+    # 補上的K棒寫進注入的儲存（暫存中，尚未寫檔），不影響全域 kline_store
+    assert store.tail("BTCUSDT", "5m", 100)["open_ms"].tolist() == [k[0] for k in rest["5m"][4:26]]
@@ -0,0 +1,186 @@
+import math
+import numpy as np
+import pytest
+import backtest as bt
+from backtest import BAR_MS, HORIZONS, COLUMNS
+from indicators import EMABank, EMA_PERIODS
+from klinestore import KlineStore, KLINE_DTYPE, OI_DTYPE
+from screener import MarketArrays
+
+START_MS = 1_700_006_400_000  # 4 小時整點
+MIN_PRICE, MIN_VOLUME = 1.0, 2.0
+
+
+def synthetic(seed, bars, offset=0):
+    """隨機漫步 + 不定期拉升（3 根內漲數 % 且成交量放大），持倉量每 5 分鐘一筆"""
+    rng = np.random.default_rng(seed)
+    open_ms = START_MS + (offset + np.arange(bars)) * BAR_MS
+    ret = rng.normal(0.0003, 0.004, bars)
+    qv = rng.uniform(1e5, 3e5, bars)
+    for p in rng.choice(np.arange(300, bars - 3), bars // 60, replace=False):
+        ret[p:p + 3] += rng.uniform(0.005, 0.02)
+        qv[p - 40:p + 3] *= rng.uniform(3, 8)
+    close = 100 * np.exp(np.cumsum(ret))
+    k = np.zeros(bars, dtype=KLINE_DTYPE)
+    k["open_ms"], k["close"], k["quote_vol"] = open_ms, close, qv
+    k["open"] = k["high"] = k["low"] = close
+    oi = np.zeros(bars, dtype=OI_DTYPE)
+    oi["t"] = open_ms + BAR_MS - 1000
+    oi["oi"] = 1e6 * np.exp(np.cumsum(rng.normal(0.001, 0.01, bars)))
+    return k, oi
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    store = KlineStore(str(tmp_path_factory.mktemp("store")))
+    # A 夠長（4h EMA60 需 60 根 4h）；B 的持倉量較晚才有；C 從小時中間開始，第一根 1h / 4h 不完整不可計入 EMA
+    for sym, seed, bars, offset, oi_from in (("AUSDT", 1, 3200, 0, 0), ("BUSDT", 2, 1500, 0, 900),
+                                             ("CUSDT", 3, 1400, 6, 0)):
+        k, oi = synthetic(seed, bars, offset)
+        store.append(sym, "5m", k)
+        store.append(sym, "oi", oi[oi_from:])
+    data = bt.load_dataset(store)
+    symbols, table = bt.candidates(data, MIN_PRICE, MIN_VOLUME)
+    return data, symbols, table
+
+
+def live_replay(data):
+    """逐根 5m 收盤把資料餵進 MarketArrays（同即時路徑），每個收盤時間點全市場 screen 一次"""
+    m = MarketArrays(8)
+    slots = {sym: m.add(sym, 0.0) for sym in data}
+    # 回測在沒有持倉量資料時不以持倉量過濾：即時端對應「持倉量為 0」（照樣篩選，持倉變化為 None）
+    m.last_oi[list(slots.values())] = 0.0
+    banks = {(sym, span): EMABank() for sym in data for span in (12, 48)}
+    counts = dict.fromkeys(banks, 0)
+    oi_pos = dict.fromkeys(data, 0)
+    times = sorted({int(t) for d in data.values() for t in d["open_ms"]})
+    hits = []
+    for open_ms in times:
+        close_ms = open_ms + BAR_MS
+        for sym, d in data.items():
+            i = np.searchsorted(d["open_ms"], open_ms)
+            if i == len(d["open_ms"]) or d["open_ms"][i] != open_ms:
+                continue
+            slot, close = slots[sym], float(d["close"][i])
+            for span, arr in ((12, m.ema_1h), (48, m.ema_4h)):
+                key = (sym, span)
+                # 換桶時重新計數，桶內滿 span 根才算一根完整的 1h / 4h
+                if open_ms % (span * BAR_MS) == 0:
+                    counts[key] = 0
+                counts[key] += 1
+                if counts[key] == span:
+                    banks[key].update(close)
+                    arr[slot] = [np.nan if banks[key][p] is None else banks[key][p] for p in EMA_PERIODS]
+            m.vol_5m.append(slot, close_ms / 1000, float(d["quote_vol"][i]))
+            m.price_hist.append(slot, close_ms / 1000, close)
+            m.last_price[slot] = close
+            while oi_pos[sym] < len(d["oi_t"]) and d["oi_t"][oi_pos[sym]] <= close_ms:
+                j = oi_pos[sym]
+                m.oi_hist.append(slot, d["oi_t"][j] / 1000, float(d["oi"][j]))
+                m.last_oi[slot] = float(d["oi"][j])
+                oi_pos[sym] += 1
+        for sym, res in m.screen(close_ms / 1000, None, MIN_PRICE, MIN_VOLUME):
+            hits.append((sym, close_ms / 1000, res))
+    return hits
+
+
+def test_candidates_match_live_screen(dataset):
+    data, symbols, table = dataset
+    hits = live_replay(data)
+    assert len(hits) > 30
+    c = {name: table[:, k] for k, name in enumerate(COLUMNS)}
+    rows = {(symbols[int(s)], t): k for k, (s, t) in enumerate(zip(c["sym"], c["t"]))}
+    assert set(rows) == {(sym, t) for sym, t, _ in hits}
+    for sym, t, res in hits:
+        k = rows[(sym, t)]
+        assert c["price_pct"][k] == pytest.approx(res["price_pct"])
+        assert c["vol_ratio"][k] == pytest.approx(res["vol_ratio"])
+        assert c["oi_pct"][k] == pytest.approx(res["oi_pct"] if res["oi_pct"] is not None else np.nan, nan_ok=True)
+        assert bool(c["trend_4h"][k]) == ("4小時呈多頭趨勢" in res["reason"])
+
+
+def test_volume_stats_matches_market_arrays():
+    rng = np.random.default_rng(4)
+    qv = rng.uniform(1, 100, 400)
+    cur, avg, n = bt.volume_stats(qv)
+    m = MarketArrays(1)
+    slot = m.add("AUSDT", 0.0)
+    for i, v in enumerate(qv):
+        m.vol_5m.append(slot, float(i), float(v))
+        ref = m.volume_stats(np.array([slot]))
+        assert (cur[i], avg[i], n[i]) == pytest.approx(tuple(float(x[0]) for x in ref))
+
+
+def brute_evaluate(data, symbols, params):
+    """逐幣逐根重算條件並套用冷卻，不經過候選表"""
+    price, volume, oi, cooldown = params
+    rets = {h: [] for h in HORIZONS}
+    alerts, syms = 0, set()
+    for sym in symbols:
+        d = data[sym]
+        close, open_ms = d["close"], d["open_ms"]
+        cur, avg, n = bt.volume_stats(d["quote_vol"])
+        trend = bt.trend_series(open_ms, close, 3_600_000)
+        last_t = -math.inf
+        for i in range(bt.PRICE_BARS, len(close)):
+            if not (trend[i] and n[i] >= 24 and avg[i] > 0):
+                continue
+            ref = close[i - bt.PRICE_BARS]
+            if not ((close[i] - ref) / ref * 100 > price and cur[i] / avg[i] > volume):
+                continue
+            t = (open_ms[i] + BAR_MS) / 1000
+            if oi is not None:
+                o = bt.oi_change(np.array([open_ms[i] + BAR_MS]), d["oi_t"], d["oi"])[0]
+                if not o > oi:
+                    continue
+            if t - last_t < cooldown:
+                continue
+            last_t = t
+            alerts += 1
+            syms.add(sym)
+            for h, bars in HORIZONS.items():
+                if i + bars < len(close):
+                    rets[h].append((close[i + bars] - close[i]) / close[i] * 100)
+    return alerts, len(syms), {h: np.mean(r) if r else np.nan for h, r in rets.items()}
+
+
+@pytest.mark.parametrize("params", [(1.0, 2.0, None, 0), (2.0, 3.0, None, 3600), (1.5, 2.0, 0.0, 1800),
+                                    (3.0, 5.0, 2.0, 7200)])
+def test_evaluate_matches_brute_force(dataset, params):
+    data, symbols, table = dataset
+    alerts, n_syms, means = brute_evaluate(data, symbols, params)
+    res = bt.evaluate(params, table)
+    assert (res["alerts"], res["symbols"]) == (alerts, n_syms)
+    for h in HORIZONS:
+        assert res[f"mean_{h}"] == pytest.approx(means[h], nan_ok=True)
+
+
+def test_evaluate_cooldown_per_symbol():
+    table = np.zeros((6, len(COLUMNS)))
+    col = {name: k for k, name in enumerate(COLUMNS)}
+    table[:, col["sym"]] = [0, 0, 0, 0, 0, 1]
+    table[:, col["t"]] = [0, 100, 1900, 2000, 4000, 50]
+    table[:, col["price_pct"]] = 10
+    table[:, col["vol_ratio"]] = 10
+    table[:, col["ret_1h"]] = [1, 2, 3, 4, 5, 6]
+    res = bt.evaluate((5, 5, None, 1800), table)
+    # 0 → 1900（距上次告警 1900 秒）→ 4000；另一幣種不受影響
+    assert res["alerts"] == 4 and res["symbols"] == 2
+    assert res["mean_1h"] == pytest.approx((1 + 3 + 5 + 6) / 4)
+    assert bt.evaluate((5, 5, None, 0), table)["alerts"] == 6
+
+
+def test_sweep_shared_memory_matches_in_process(dataset):
+    _, _, table = dataset
+    grid = [(p, v, oi, cd) for p in (1, 2, 4) for v in (2, 4) for oi in (None, 1.0) for cd in (0, 3600)]
+    expected = [bt.evaluate(p, table) for p in grid]
+    results = bt.sweep(table, grid, workers=2)
+    # 結果依分塊順序排列，以參數對應
+    by_params = {(r["price"], r["volume"], r["oi"], r["cooldown"]): r for r in results}
+    assert len(by_params) == len(grid)
+    for p, exp in zip(grid, expected):
+        got = by_params[p]
+        assert got.keys() == exp.keys()
+        for k in exp:
+            assert got[k] == pytest.approx(exp[k], nan_ok=True)
+    assert bt.sweep(np.zeros((0, len(COLUMNS))), grid[:2])[0]["alerts"] == 0
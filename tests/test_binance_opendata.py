@@ -0,0 +1,147 @@
+import asyncio
+import numpy as np
+import pytest
+import clock
+import binance_opendata as bo
+from models import market, register_symbol, unregister_symbol
+from screener import LIQ_BUY, LIQ_SELL
+from aggregator import Candle
+from klinestore import KlineStore
+
+T0 = 1_760_000_000.0
+
+
+def force_order(sym, side, trade_ms, price="100", qty="2"):
+    return {"e": "forceOrder", "E": trade_ms + 5, "o": {"s": sym, "S": side, "o": "LIMIT", "f": "IOC", "q": qty,
+                                                        "p": price, "ap": price, "X": "FILLED", "l": qty, "z": qty,
+                                                        "T": trade_ms}}
+
+
+@pytest.fixture
+def liq(monkeypatch):
+    vclock = clock.VirtualClock(T0)
+    monkeypatch.setattr(clock, "now", vclock)
+    monkeypatch.setattr(bo, "seen_liqs", type(bo.seen_liqs)())
+    slot = register_symbol("LIQUSDT", T0).slot
+    yield vclock, lambda side: float(market.liq.sums[5][slot, side])
+    unregister_symbol("LIQUSDT")
+
+
+def test_rotation_overlap_counted_once(liq):
+    vclock, total = liq
+    ms = int(T0 * 1000)
+    events = [force_order("LIQUSDT", "SELL", ms), force_order("LIQUSDT", "BUY", ms + 300)]
+    # 舊連線（陣列格式）與新連線各收到一次
+    bo.on_force_order(None, events)
+    vclock.t += 0.2
+    for ev in events:
+        bo.on_force_order(None, ev)
+    assert total(LIQ_SELL) == 200.0
+    assert total(LIQ_BUY) == 200.0
+
+    bo.on_force_order(None, force_order("LIQUSDT", "SELL", ms + 1000))
+    assert total(LIQ_SELL) == 400.0
+
+
+def test_dedupe_window_expires(liq):
+    vclock, total = liq
+    ms = int(T0 * 1000)
+    for i in range(5):
+        bo.on_force_order(None, force_order("LIQUSDT", "SELL", ms + i * 1000))
+    assert len(bo.seen_liqs) == 5
+    vclock.t += bo.LIQ_DEDUP_SECONDS
+    bo.on_force_order(None, force_order("LIQUSDT", "SELL", ms + 9000))
+    assert list(bo.seen_liqs) == [("LIQUSDT", "SELL", ms + 9000)]
+    assert total(LIQ_SELL) == 1200.0
+
+
+def test_mark_price_arr_equals_per_symbol_stream(monkeypatch):
+    monkeypatch.setattr(clock, "now", clock.VirtualClock(T0))
+    syms = [f"ARR{i}USDT" for i in range(5)]
+    slots = [register_symbol(s, T0).slot for s in syms]
+    try:
+        frame = [{"e": "markPriceUpdate", "E": int(T0 * 1000), "s": s, "p": f"{10 + i}.5", "r": f"0.000{i + 1}"}
+                 for i, s in enumerate(syms)]
+        frame.append(dict(frame[0], s="NOTLISTEDUSDT"))
+        bo.on_mark_price_arr(None, frame)
+        batch = (market.last_price[slots].copy(), market.funding_rate[slots].copy(),
+                 [market.price_hist.series(s) for s in slots])
+        for s in slots:
+            market.price_hist.clear(s)
+            market.last_price[s] = market.funding_rate[s] = np.nan
+        for s, d in zip(syms, frame):
+            bo.on_mark_price(bo.symbol_state[s], d)
+        np.testing.assert_array_equal(market.last_price[slots], batch[0])
+        np.testing.assert_array_equal(market.funding_rate[slots], batch[1])
+        for s, (t, v) in zip(slots, batch[2]):
+            assert [a.tolist() for a in market.price_hist.series(s)] == [t.tolist(), v.tolist()]
+        assert batch[0].tolist() == [10.5, 11.5, 12.5, 13.5, 14.5]
+    finally:
+        for s in syms:
+            unregister_symbol(s)
+
+
+def rest_kline(open_ms, span_ms, close="101.0"):
+    return [open_ms, "100.0", "102.0", "99.0", close, "10.0", open_ms + span_ms - 1, "1000.0"]
+
+
+def test_repair_task_kept_until_done(monkeypatch, tmp_path):
+    monkeypatch.setattr(bo, "kline_store", KlineStore(str(tmp_path)))
+    state = register_symbol("REPAIRUSDT", T0)
+    open_ms = 1_760_000_400_000 - 1_760_000_400_000 % 3_600_000
+    release = None
+
+    async def fake_klines(sym, interval, limit):
+        await release.wait()
+        return [rest_kline(open_ms, 3_600_000)]
+
+    monkeypatch.setattr(bo.gateway, "klines", fake_klines)
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        bo.on_candle_close("REPAIRUSDT", "1h", Candle(open_ms, 100.0), open_ms + 3_600_000, False)
+        await asyncio.sleep(0)
+        # 補抓進行中：任務有參考，不會被回收
+        assert len(bo.kline_tasks) == 1
+        release.set()
+        await asyncio.gather(*bo.kline_tasks)
+        await asyncio.sleep(0)
+        assert not bo.kline_tasks
+
+    try:
+        asyncio.run(main())
+        assert state.klines["1h"].last_close_time == (open_ms + 3_600_000 - 1) // 1000
+    finally:
+        unregister_symbol("REPAIRUSDT")
+
+
+def test_gap_fill_tasks_kept_until_done(monkeypatch, tmp_path):
+    monkeypatch.setattr(bo, "kline_store", KlineStore(str(tmp_path)))
+    state = register_symbol("GAPUSDT", T0)
+    base = 1_760_000_400_000 - 1_760_000_400_000 % 14_400_000
+    # 上次收盤在 base 之前，第一根分K在 3 小時後：5m / 1h 各缺一段
+    state.last_kline_close_time = state.klines["1h"].last_close_time = (base - 1) // 1000
+    release = None
+
+    async def fake_klines(sym, interval, limit):
+        await release.wait()
+        return []
+
+    monkeypatch.setattr(bo.gateway, "klines", fake_klines)
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        bo.on_minute_gap("GAPUSDT", base + 3 * 3_600_000)
+        await asyncio.sleep(0)
+        assert len(bo.kline_tasks) == 2
+        release.set()
+        await asyncio.gather(*bo.kline_tasks)
+        await asyncio.sleep(0)
+        assert not bo.kline_tasks
+
+    try:
+        asyncio.run(main())
+    finally:
+        unregister_symbol("GAPUSDT")
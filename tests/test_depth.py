@@ -0,0 +1,221 @@
+import asyncio
+import json
+import random
+import numpy as np
+import pytest
+import clock
+import depth as depth_mod
+from depth import BookSide, LocalBook, DepthMonitor
+from models import market, register_symbol, unregister_symbol
+
+
+class DictBook:
+    """參考實作：價格 -> 數量的 dict，數量 0 刪除"""
+
+    def __init__(self):
+        self.bids, self.asks = {}, {}
+
+    def load(self, snapshot):
+        self.bids = {float(p): float(q) for p, q in snapshot["bids"] if float(q) > 0}
+        self.asks = {float(p): float(q) for p, q in snapshot["asks"] if float(q) > 0}
+
+    def apply(self, bids, asks):
+        for book, levels in ((self.bids, bids), (self.asks, asks)):
+            for p, q in levels:
+                if float(q) == 0:
+                    book.pop(float(p), None)
+                else:
+                    book[float(p)] = float(q)
+
+
+def assert_same(book, ref):
+    # 買方價格遞增、賣方價格遞減（兩側最優價都在尾端）
+    assert (book.bids.keys.tolist(), book.bids.qty.tolist()) == (sorted(ref.bids), [ref.bids[p] for p in sorted(ref.bids)])
+    asks = sorted(ref.asks, reverse=True)
+    assert ((-book.asks.keys).tolist(), book.asks.qty.tolist()) == (asks, [ref.asks[p] for p in asks])
+
+
+def random_levels(rng, mid, side, n):
+    # 集中在最優價附近，約三成刪除（含不存在的價位）
+    sign = -1 if side == "bids" else 1
+    out = {}
+    for _ in range(n):
+        p = round(mid + sign * 0.01 * (1 + int(rng.expovariate(1 / 20))), 2)
+        out[f"{p:.2f}"] = "0.000" if rng.random() < 0.3 else f"{rng.uniform(0.1, 50):.3f}"
+    return [list(kv) for kv in out.items()]
+
+
+def snapshot(rng, last_id, mid=100.0, n=200):
+    return {"lastUpdateId": last_id,
+            "bids": [[f"{mid - 0.01 * (i + 1):.2f}", f"{rng.uniform(1, 50):.3f}"] for i in range(n)],
+            "asks": [[f"{mid + 0.01 * (i + 1):.2f}", f"{rng.uniform(1, 50):.3f}"] for i in range(n)]}
+
+
+def events(rng, first_u, n, mid=100.0):
+    out, u = [], first_u
+    for _ in range(n):
+        U, pu = u + 1, u
+        u = U + rng.randrange(0, 3)
+        out.append((U, u, pu, random_levels(rng, mid, "bids", 15), random_levels(rng, mid, "asks", 15)))
+    return out
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_book_side_apply_matches_dict(seed):
+    rng = random.Random(seed)
+    snap = snapshot(rng, 1)
+    bids, asks = BookSide(1), BookSide(-1)
+    bids.load(snap["bids"])
+    asks.load(snap["asks"])
+    book = type("Book", (), {"bids": bids, "asks": asks})
+    ref = DictBook()
+    ref.load(snap)
+    for _, _, _, b, a in events(rng, 1, 300):
+        bids.apply(b)
+        asks.apply(a)
+        ref.apply(b, a)
+    assert_same(book, ref)
+    assert bids.best() == max(ref.bids) and asks.best() == min(ref.asks)
+    assert bids.top(10) == pytest.approx(sum(ref.bids[p] for p in sorted(ref.bids)[-10:]))
+
+
+def test_snapshot_with_buffered_events_then_live_feed():
+    rng = random.Random(1)
+    evs = events(rng, 1000, 400)
+    book, ref = LocalBook("BTCUSDT", 0), DictBook()
+    # 先暫存 10 筆，快照落在第 6 筆的範圍內：前 5 筆（u < lastUpdateId）丟棄
+    for ev in evs[:10]:
+        book.buffer.append(ev)
+    snap = snapshot(rng, evs[5][1] - (evs[5][1] - evs[5][0]) // 2)
+    ref.load(snap)
+    for U, u, pu, b, a in evs[5:]:
+        ref.apply(b, a)
+    assert book.load(snap) and book.live
+    for ev in evs[10:]:
+        assert book.feed(ev)
+    assert book.last_u == evs[-1][1]
+    assert book.updates == len(evs) - 5
+    assert_same(book, ref)
+
+
+def test_duplicate_frames_during_rotation_are_ignored():
+    rng = random.Random(2)
+    evs = events(rng, 10, 50)
+    book, ref = LocalBook("BTCUSDT", 0), DictBook()
+    snap = snapshot(rng, evs[0][0])  # 第一筆須滿足 U <= lastUpdateId <= u
+    book.load(snap)
+    ref.load(snap)
+    for i, ev in enumerate(evs):
+        assert book.feed(ev)
+        ref.apply(ev[3], ev[4])
+        if i % 7 == 0:
+            # 新舊連線重疊：同一筆或更早的事件再送一次
+            assert book.feed(ev) and book.feed(evs[max(0, i - 3)])
+    assert book.updates == len(evs)
+    assert_same(book, ref)
+
+
+def test_gap_and_stale_snapshot_are_rejected():
+    book = LocalBook("BTCUSDT", 0)
+    book.load({"lastUpdateId": 100, "bids": [], "asks": []})
+    assert book.feed((100, 105, 99, [], []))
+    assert not book.feed((110, 112, 108, [], []))   # pu ≠ 上一筆 u
+    stale = LocalBook("BTCUSDT", 0)
+    stale.buffer.append((500, 510, 499, [], []))
+    assert not stale.load({"lastUpdateId": 400, "bids": [], "asks": []})  # 快照比暫存事件舊
+    assert not stale.live
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    monkeypatch.setattr(clock, "now", clock.VirtualClock(1_000_000.0))
+    return DepthMonitor(3)
+
+
+def message(sym, U, u, pu, b=(), a=()):
+    return json.dumps({"stream": f"{sym.lower()}@depth@100ms", "data": {
+        "e": "depthUpdate", "s": sym, "U": U, "u": u, "pu": pu, "b": list(b), "a": list(a)}})
+
+
+def test_on_message_snapshot_retry_and_gap_resync(monitor, monkeypatch):
+    calls = []
+
+    async def fake_depth(sym, limit):
+        calls.append(sym)
+        await asyncio.sleep(0)
+        # 第一次快照比暫存事件舊，第二次才對得上
+        return {"lastUpdateId": 90 if len(calls) == 1 else 105, "bids": [["1.0", "2"]], "asks": [["1.1", "3"]]}
+
+    monkeypatch.setattr(depth_mod.gateway, "depth", fake_depth)
+    monkeypatch.setattr(depth_mod, "RESYNC_BACKOFF", 0.0)
+    book = monitor.books["AAAUSDT"] = LocalBook("AAAUSDT", 0)
+
+    async def main():
+        monitor.on_message(message("AAAUSDT", 100, 103, 99))
+        await asyncio.sleep(0.01)
+        assert not book.live and monitor.resyncs == 1 and len(calls) == 1
+        monitor.on_message(message("AAAUSDT", 104, 106, 103, [["1.0", "4"]]))
+        await asyncio.sleep(0.01)
+        assert book.live and book.last_u == 106 and book.bids.qty.tolist() == [4.0]
+        assert monitor.imbalance("AAAUSDT") == pytest.approx((4 - 3) / 7)
+        monitor.on_message(message("AAAUSDT", 110, 111, 109))   # 序號斷裂
+        assert not book.live and monitor.resyncs == 2
+        await asyncio.sleep(0.01)
+        assert len(calls) == 3
+        monitor.on_message(message("ZZZUSDT", 1, 2, 0))          # 已退訂的殘留訊息
+        assert "ZZZUSDT" not in monitor.books
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def hot(monkeypatch):
+    syms = [f"DEPTH{i}USDT" for i in range(6)]
+    for s in syms:
+        register_symbol(s, 0)
+    heat = {}
+
+    def fake_heat(now, slots=None):
+        slots = np.flatnonzero(market.active) if slots is None else slots
+        return np.array([heat.get(market.symbols[s], 0.0) for s in slots])
+
+    monkeypatch.setattr(market, "heat", fake_heat)
+    yield heat
+    for s in syms:
+        unregister_symbol(s)
+
+
+def test_refresh_lru_eviction(monitor, hot):
+    now = clock.now()
+
+    def refresh_each(syms, t):
+        # 同一次 refresh 內依 slot 順序加入，slot 配置順序不固定，逐一加入才有確定的先後
+        for sym in syms:
+            hot.clear()
+            hot[sym] = 0.9
+            monitor.refresh(t)
+
+    refresh_each(["DEPTH2USDT", "DEPTH3USDT", "DEPTH1USDT"], now)
+    assert list(monitor.books) == ["DEPTH2USDT", "DEPTH3USDT", "DEPTH1USDT"]
+
+    # 超過上限：最久沒達標的先退訂
+    refresh_each(["DEPTH1USDT", "DEPTH4USDT"], now + 60)
+    assert list(monitor.books) == ["DEPTH3USDT", "DEPTH1USDT", "DEPTH4USDT"]
+    assert "DEPTH2USDT" not in monitor.books and monitor.evictions == 1
+
+    # 冷卻過久的退訂
+    hot.clear()
+    hot["DEPTH4USDT"] = 0.9
+    monitor.refresh(now + 60 + depth_mod.DEPTH_COOL_SECONDS + 1)
+    assert list(monitor.books) == ["DEPTH4USDT"]
+
+    # 達標的超過上限時只取活躍度最高的幾個
+    hot.clear()
+    hot.update({f"DEPTH{i}USDT": 0.7 + i / 100 for i in range(6)})
+    monitor.refresh(now + 1000)
+    assert set(monitor.books) == {"DEPTH3USDT", "DEPTH4USDT", "DEPTH5USDT"}
+
+    # 下架的幣種直接移除
+    unregister_symbol("DEPTH5USDT")
+    monitor.refresh(now + 1001)
+    assert "DEPTH5USDT" not in monitor.books
@@ -0,0 +1,163 @@
+import asyncio
+import time
+import pytest
+from aiohttp import web
+import gateway as gateway_mod
+from gateway import RestGateway, RestError, PRIORITY_COMMAND, PRIORITY_BACKFILL
+
+# 本地假 Binance：記錄每個請求到達的時間與 symbol，依腳本回傳指定狀態碼 / 標頭
+
+
+class MockBinance:
+    def __init__(self, script=None, weight_header=None):
+        self.hits = []              # [(monotonic 時間, symbol, 狀態碼)]
+        self.script = script or {}  # 第 n 個請求 -> (狀態碼, 標頭)
+        self.weight_header = weight_header  # 第 n 個請求 -> X-MBX-USED-WEIGHT-1M
+        self.runner = None
+
+    async def handle(self, request):
+        n = len(self.hits)
+        status, headers = self.script.get(n, (200, {}))
+        headers = dict(headers)
+        if self.weight_header is not None:
+            headers["X-MBX-USED-WEIGHT-1M"] = str(self.weight_header(n))
+        self.hits.append((time.monotonic(), request.query.get("symbol"), status))
+        return web.json_response({"openInterest": "1"}, status=status, headers=headers)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/fapi/v1/openInterest", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def close(self):
+        await self.runner.cleanup()
+
+
+class ShiftedTime:
+    """gateway 用的 time 模組替身：時鐘平移到距整分鐘只剩 to_boundary 秒，測試不用等一分鐘"""
+
+    def __init__(self, to_boundary):
+        now = time.time()
+        self.offset = (60 - to_boundary) - now % 60
+
+    def time(self):
+        return time.time() + self.offset
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _gateway(mock, **kwargs):
+    return RestGateway(base_url=await mock.start(), **kwargs)
+
+
+def test_requests_stay_within_weight_budget(monkeypatch):
+    monkeypatch.setattr(gateway_mod, "time", ShiftedTime(to_boundary=0.6))
+
+    async def main():
+        mock = MockBinance()
+        gw = await _gateway(mock, weight_limit=10, concurrency=4)
+        tasks = [asyncio.create_task(gw.open_interest(f"S{i}")) for i in range(25)]
+        try:
+            await asyncio.sleep(0.4)
+            # 本分鐘只放行預算內的 10 個，其餘排隊
+            assert len(mock.hits) == 10
+            assert gw.used == 10
+            await asyncio.sleep(0.6)
+            # 跨過整分鐘後再放行 10 個，第三批要等下一分鐘
+            assert len(mock.hits) == 20
+            assert sum(t.done() for t in tasks) == 20
+        finally:
+            for t in tasks:
+                t.cancel()
+            await gw.close()
+            await mock.close()
+
+    run(main())
+
+
+def test_server_reported_weight_is_respected(monkeypatch):
+    monkeypatch.setattr(gateway_mod, "time", ShiftedTime(to_boundary=30))
+
+    async def main():
+        # 同 IP 其他程式已用掉 7（標頭數字含本程式的請求）：本分鐘只剩 3 可用
+        mock = MockBinance(weight_header=lambda n: 7 + n + 1)
+        gw = await _gateway(mock, weight_limit=10, concurrency=1)
+        tasks = [asyncio.create_task(gw.open_interest(f"S{i}")) for i in range(6)]
+        try:
+            await asyncio.sleep(0.5)
+            assert len(mock.hits) == 3
+            assert gw.used == 10
+        finally:
+            for t in tasks:
+                t.cancel()
+            await gw.close()
+            await mock.close()
+
+    run(main())
+
+
+@pytest.mark.parametrize("status", [429, 418])
+def test_rate_limit_pauses_all_requests_then_retries(status):
+    async def main():
+        mock = MockBinance(script={2: (status, {"Retry-After": "1"})})
+        gw = await _gateway(mock, weight_limit=1000, concurrency=1)
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*[gw.open_interest(f"S{i}") for i in range(6)]), timeout=5)
+        finally:
+            await gw.close()
+            await mock.close()
+        assert all(r == {"openInterest": "1"} for r in results)
+        # 第 3 個請求收到限流，依 Retry-After 暫停 1 秒，之後重送成功
+        assert len(mock.hits) == 7
+        limited_at = mock.hits[2][0]
+        assert mock.hits[3][0] - limited_at >= 0.95
+        retried = [sym for _, sym, st in mock.hits if st == 200]
+        assert sorted(retried) == [f"S{i}" for i in range(6)]
+
+    run(main())
+
+
+def test_rate_limit_gives_up_after_max_retries():
+    async def main():
+        mock = MockBinance(script={n: (429, {"Retry-After": "0.1"}) for n in range(10)})
+        gw = await _gateway(mock, weight_limit=1000, concurrency=1)
+        try:
+            with pytest.raises(RestError):
+                await asyncio.wait_for(gw.open_interest("BTCUSDT"), timeout=5)
+        finally:
+            await gw.close()
+            await mock.close()
+        assert len(mock.hits) == gateway_mod.MAX_RETRIES
+
+    run(main())
+
+
+def test_higher_priority_goes_first_when_budget_frees(monkeypatch):
+    monkeypatch.setattr(gateway_mod, "time", ShiftedTime(to_boundary=0.5))
+
+    async def main():
+        mock = MockBinance()
+        gw = await _gateway(mock, weight_limit=2, concurrency=1)
+        low = [asyncio.create_task(gw.open_interest(f"L{i}", priority=PRIORITY_BACKFILL)) for i in range(4)]
+        await asyncio.sleep(0.2)
+        high = [asyncio.create_task(gw.open_interest(f"H{i}", priority=PRIORITY_COMMAND)) for i in range(2)]
+        try:
+            await asyncio.sleep(0.6)
+            order = [sym for _, sym, _ in mock.hits]
+            # L2 在預算用完時已被取出等待，下一分鐘先送；其後指令優先於回補
+            assert order == ["L0", "L1", "L2", "H0"]
+        finally:
+            for t in low + high:
+                t.cancel()
+            await gw.close()
+            await mock.close()
+
+    run(main())
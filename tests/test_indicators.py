@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from indicators import EMA, EMABank, EMA_PERIODS
+
+
+def reference_ema(closes, period):
+    """talib.EMA 的定義：前 period 根取 SMA 為種子，之前為 NaN"""
+    out = np.full(len(closes), np.nan)
+    if len(closes) < period:
+        return out
+    k = 2.0 / (period + 1)
+    out[period - 1] = np.mean(closes[:period])
+    for i in range(period, len(closes)):
+        out[i] = (closes[i] - out[i - 1]) * k + out[i - 1]
+    return out
+
+
+def closes(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+@pytest.mark.parametrize("period", EMA_PERIODS)
+def test_ema_matches_sma_seeded_reference(period):
+    data = closes()
+    ref = reference_ema(data, period)
+    ema = EMA(period)
+    out = [ema.update(c) for c in data]
+    assert all(v is None for v in out[:period - 1])
+    np.testing.assert_allclose(out[period - 1:], ref[period - 1:], rtol=1e-12)
+
+
+@pytest.mark.parametrize("period", EMA_PERIODS)
+def test_ema_matches_talib(period):
+    talib = pytest.importorskip("talib")
+    data = closes(seed=1)
+    ema = EMA(period)
+    out = [ema.update(c) for c in data]
+    np.testing.assert_allclose(out[period - 1:], talib.EMA(data, timeperiod=period)[period - 1:], rtol=1e-10)
+
+
+def test_bank_ready_after_longest_period():
+    bank = EMABank()
+    data = closes(max(EMA_PERIODS))
+    for c in data[:-1]:
+        bank.update(c)
+    assert not bank.ready()
+    assert bank[min(EMA_PERIODS)] is not None
+    bank.update(data[-1])
+    assert bank.ready()
+    assert bank[max(EMA_PERIODS)] == pytest.approx(np.mean(data))
+
+
+@pytest.mark.parametrize("period", EMA_PERIODS)
+def test_drift_vs_old_talib_window(period):
+    """舊版每根收盤用最近 100 根重算 talib.EMA（種子是視窗內前 period 根的 SMA），
+    新版從完整歷史的第一段 SMA 起算；兩者走同一條遞迴，差距只剩種子差 × (1-k)^(100-period)"""
+    talib = pytest.importorskip("talib")
+    window = 100
+    data = closes(600, seed=2)
+    ema = EMA(period)
+    new = np.array([np.nan if v is None else v for v in (ema.update(c) for c in data)])
+    decay = (1 - 2.0 / (period + 1)) ** (window - period)
+    for t in range(window - 1, len(data)):
+        seg = data[t - window + 1:t + 1]
+        old = talib.EMA(seg, timeperiod=period)[-1]
+        # 舊版種子位置上，新版值與視窗 SMA 的差
+        s = t - window + period
+        gap = new[s] - np.mean(seg[:period])
+        assert new[t] - old == pytest.approx(gap * decay, rel=1e-6, abs=1e-9)
+        # 價格每根波動約 1%：EMA60 最多偏離約 0.6%，EMA15 可忽略
+        assert abs(new[t] - old) / old < {15: 1e-6, 30: 5e-4, 45: 3e-3, 60: 1e-2}[period]
@@ -0,0 +1,68 @@
+import asyncio
+import numpy as np
+from klinestore import KlineStore, OI_DTYPE
+
+
+def oi_rows(start, n):
+    rows = np.zeros(n, dtype=OI_DTYPE)
+    rows["t"] = np.arange(start, start + n) * 1000
+    rows["oi"] = np.arange(start, start + n)
+    return rows
+
+
+def test_append_later_buffers_until_flush(tmp_path):
+    store = KlineStore(str(tmp_path))
+    assert store.append_later("AAA", "oi", oi_rows(0, 3)) == 3
+    assert store.append_later("AAA", "oi", oi_rows(1, 3)) == 1  # 只收時間較新的
+    assert not (tmp_path / "AAA" / "oi.bin").exists()
+    assert store.last_time("AAA", "oi") == 3000
+
+    assert store.flush() == 4
+    assert store.pending == {}
+    assert KlineStore(str(tmp_path)).view("AAA", "oi")["t"].tolist() == [0, 1000, 2000, 3000]
+
+
+def test_reads_and_sync_append_see_pending_rows(tmp_path):
+    store = KlineStore(str(tmp_path))
+    store.append("AAA", "oi", oi_rows(0, 2))
+    store.append_later("AAA", "oi", oi_rows(2, 2))
+    assert store.tail("AAA", "oi", 10)["t"].tolist() == [0, 1000, 2000, 3000]
+    store.append_later("AAA", "oi", oi_rows(4, 1))
+    # 同步追加時暫存的先寫，檔案維持時間遞增
+    store.append("AAA", "oi", oi_rows(5, 1))
+    assert store.range("AAA", "oi", 0, 10_000)["oi"].tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_run_flushes_in_background_and_on_exit(tmp_path):
+    store = KlineStore(str(tmp_path))
+    path = tmp_path / "AAA" / "oi.bin"
+
+    async def main():
+        task = asyncio.create_task(store.run(interval=0.01))
+        store.append_later("AAA", "oi", oi_rows(0, 2))
+        for _ in range(100):
+            if path.exists():
+                break
+            await asyncio.sleep(0.01)
+        assert path.stat().st_size == 2 * OI_DTYPE.itemsize
+        store.append_later("AAA", "oi", oi_rows(2, 1))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert path.stat().st_size == 3 * OI_DTYPE.itemsize
+
+
+def test_reopen_switches_directory(tmp_path):
+    live, temp = tmp_path / "live", tmp_path / "replay"
+    store = KlineStore(str(live))
+    store.append("AAA", "oi", oi_rows(0, 3))
+    store.append_later("AAA", "oi", oi_rows(3, 1))
+    assert store.reopen(str(temp)) == str(live)
+    # 暫存寫回原目錄；新目錄從空的開始，最後時間快取不沿用
+    assert KlineStore(str(live)).view("AAA", "oi")["t"].tolist() == [0, 1000, 2000, 3000]
+    assert len(store.view("AAA", "oi")) == 0 and store.last_time("AAA", "oi") == -1
+    store.append_later("AAA", "oi", oi_rows(10, 2))
+    store.reopen(str(live))
+    assert KlineStore(str(temp)).view("AAA", "oi")["t"].tolist() == [10_000, 11_000]
+    assert store.tail("AAA", "oi", 1)["t"].tolist() == [3000]
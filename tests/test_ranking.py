@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import clock
+import ranking as ranking_mod
+from ranking import Ranking, top_k, BOARDS
+from screener import MarketArrays
+
+T0 = 1_760_000_000.0
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("k", [1, 5, 20, 500])
+def test_top_k_matches_full_sort(seed, k):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0, 5, 300)
+    values[rng.random(300) < 0.2] = np.nan
+    mask = rng.random(300) < 0.8
+    rows = [i for i in range(300) if mask[i] and not np.isnan(values[i])]
+    expected = sorted(rows, key=lambda i: -values[i])[:k]
+    assert top_k(values, k, mask).tolist() == expected
+
+
+def test_top_k_ties_keep_values():
+    values = np.array([1.0, 3.0, 3.0, 2.0, 3.0, np.nan, 0.5])
+    got = top_k(values, 2, np.ones(7, bool))
+    assert values[got].tolist() == [3.0, 3.0] and set(got.tolist()) <= {1, 2, 4}
+    assert top_k(values, 3, np.zeros(7, bool)).tolist() == []
+
+
+@pytest.fixture
+def board(monkeypatch):
+    vclock = clock.VirtualClock(T0)
+    monkeypatch.setattr(clock, "now", vclock)
+    m = MarketArrays(16)
+    monkeypatch.setattr(ranking_mod, "market", m)
+    for i in range(6):
+        m.add(f"R{i}USDT", T0)
+    return vclock, m
+
+
+def test_reply_cached_within_interval(board):
+    vclock, m = board
+    r = Ranking(k=3, interval=60)
+    assert r.reply().count("（資料不足）") == len(BOARDS)
+
+    vclock.t += 60
+    m.movers[:6, 0] = [1.0, 5.0, -2.0, 3.0, np.nan, 4.0]
+    m.movers[:6, 1] = [2.0, 1.5, 9.0, np.nan, np.nan, np.nan]
+    m.remove("R1USDT")   # 下架的不列入
+    text = r.reply()
+    first = text.split("\n\n")[0].splitlines()
+    assert first[1:] == ["1. R5USDT +4.00%", "2. R3USDT +3.00%", "3. R0USDT +1.00%"]
+    assert "1. R2USDT 9.0×" in text and "R1USDT" not in text
+
+    # 同一週期內沿用快取，不重算
+    m.movers[:6, 0] = 99.0
+    vclock.t += 30
+    assert r.reply() is text
+    vclock.t += 30
+    assert "+99.00%" in r.reply()
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+from screener import MarketArrays, PRICE_WINDOW, OI_WINDOW
+
+NOW = 1_700_000_000.0
+
+
+def build_market(n, seed=0, now=NOW):
+    """n 個幣種的合成行情：價格 / 持倉每 10 秒一筆、5m 成交量、1h / 4h EMA，
+    各條件（監控時間、趨勢、成交量、漲幅、持倉）都混有通過與不通過的幣種"""
+    rng = np.random.default_rng(seed)
+    m = MarketArrays()
+    for i in range(n):
+        # 約一成剛開始監控（< 60 秒）
+        m.add(f"S{i}USDT", now - (30 if rng.random() < 0.1 else 3600))
+    slots = np.arange(n)
+
+    base = rng.uniform(0.01, 500, n)
+    for k in range(100, 0, -1):
+        m.price_hist.append_many(slots, now - k * 10, base * (1 + rng.normal(0, 0.002, n)))
+    # 最新價相對 15 分鐘前漲跌 -10% ~ +15%，少數缺價格
+    m.last_price[slots] = base * (1 + rng.uniform(-0.10, 0.15, n))
+    m.last_price[slots[rng.random(n) < 0.03]] = np.nan
+
+    oi_base = rng.uniform(1e4, 1e7, n)
+    for k in range(370, 0, -1):
+        m.oi_hist.append_many(slots, now - k * 10, oi_base * (1 + rng.normal(0, 0.002, n)))
+    m.last_oi[slots] = oi_base * (1 + rng.uniform(-0.05, 0.20, n))
+    m.last_oi[slots[rng.random(n) < 0.05]] = np.nan
+    m.last_oi[slots[rng.random(n) < 0.1]] = 0.0  # 持倉量為 0：照樣篩選，持倉變化為 None
+
+    # 5m 成交量：各幣種根數不同（部分不足 24 根），約三成最近 60 根爆量
+    bars = rng.choice([10, 30, 120, 240], n)
+    spike = np.where(rng.random(n) < 0.3, rng.uniform(3, 12, n), 1.0)
+    vol = rng.uniform(1e4, 1e6, n)
+    for k in range(240, 0, -1):
+        rows = slots[bars >= k]
+        v = vol[rows] * rng.uniform(0.5, 1.5, len(rows)) * np.where(k <= 60, spike[rows], 1.0)
+        m.vol_5m.append_many(rows, now - k * 300, v)
+
+    # EMA：約六成多頭排列，部分最新價跌破 EMA45
+    for arr in (m.ema_1h, m.ema_4h):
+        bull = rng.random(n) < 0.6
+        steps = np.sort(rng.uniform(0.9, 1.0, (n, 4)), axis=1)[:, ::-1]
+        arr[slots] = np.where(bull[:, None], steps, steps[:, ::-1]) * base[:, None]
+        arr[slots[rng.random(n) < 0.05], 3] = np.nan
+    return m
+
+
+def reference_check(m, slot, now, price_threshold, volume_threshold):
+    """逐幣判斷（原 conditions.check_conditions）：回傳 (漲幅, 持倉變化, 量比, 4h 多頭) 或 None"""
+    cur, oi = float(m.last_price[slot]), float(m.last_oi[slot])
+    if np.isnan(cur) or np.isnan(oi):
+        return None
+    if now - m.monitor_start[slot] < 60:
+        return None
+
+    def overfulfil(ema):
+        e15, e30, e45, e60 = ema
+        return not np.isnan(ema).any() and e15 > e30 > e45 > e60 and cur > e45
+
+    if not overfulfil(m.ema_1h[slot]):
+        return None
+    current_vol, avg_vol, n = (float(a[0]) for a in m.volume_stats(np.array([slot])))
+    if n < 24 or not (avg_vol > 0 and current_vol > avg_vol * volume_threshold):
+        return None
+    _, old_p = m.lookback(m.price_hist, slot, now, PRICE_WINDOW)
+    if cur <= 0 or old_p is None or old_p <= 0:
+        return None
+    price_pct = (cur - old_p) / old_p * 100
+    if price_pct <= price_threshold:
+        return None
+    _, old_oi = m.lookback(m.oi_hist, slot, now, OI_WINDOW)
+    oi_pct = (oi - old_oi) / old_oi * 100 if oi > 0 and old_oi is not None and old_oi > 0 else None
+    return price_pct, oi_pct, current_vol / avg_vol, overfulfil(m.ema_4h[slot])
+
+
+def reference_screen(m, now, price_threshold, volume_threshold):
+    out = {}
+    for sym, slot in m.slots.items():
+        res = reference_check(m, slot, now, price_threshold, volume_threshold)
+        if res is not None:
+            out[sym] = res
+    return out
+
+
+@pytest.mark.parametrize("price_threshold, volume_threshold", [(6, 5), (3, 2), (0, 1)])
+def test_screen_matches_per_symbol_reference(price_threshold, volume_threshold):
+    m = build_market(300, seed=price_threshold)
+    expected = reference_screen(m, NOW, price_threshold, volume_threshold)
+    got = dict(m.screen(NOW, None, price_threshold, volume_threshold))
+    assert expected  # 合成資料要有觸發的幣種才有比對意義
+    assert set(got) == set(expected)
+    for sym, (price_pct, oi_pct, vol_ratio, trend_4h) in expected.items():
+        res = got[sym]
+        assert res["price_pct"] == pytest.approx(price_pct)
+        assert res["vol_ratio"] == pytest.approx(vol_ratio)
+        assert (res["oi_pct"] is None) == (oi_pct is None)
+        if oi_pct is not None:
+            assert res["oi_pct"] == pytest.approx(oi_pct)
+        assert ("4小時呈多頭趨勢" in res["reason"]) == trend_4h
+
+
+def test_screen_subset_only_checks_dirty_slots():
+    m = build_market(300, seed=3)
+    full = dict(m.screen(NOW, None, 0, 1))
+    subset = np.zeros(m.capacity, bool)
+    subset[:150] = True
+    part = dict(m.screen(NOW, subset, 0, 1))
+    assert set(part) == {s for s in full if m.slots[s] < 150}
+
+
+def test_worker_release_keeps_shared_flags():
+    # 分片搬移：原 worker 放掉 slot 不可清掉共享的 active / dirty，否則搬過去的幣種不再被篩選
+    m = build_market(50)
+    before = m.screen(NOW, None, 3, 2)
+    shm = m.share()
+    try:
+        old, new = MarketArrays(), MarketArrays()
+        old.share(shm.name, m.capacity)
+        new.share(shm.name, m.capacity)
+        slots = [m.slots[f"S{i}USDT"] for i in range(10)]
+        for i, slot in enumerate(slots):
+            old.adopt(f"S{i}USDT", slot)
+        m.dirty[slots] = True
+        for i in range(10):
+            old.forget(f"S{i}USDT")
+        assert m.active[slots].all() and m.dirty[slots].all()
+        assert not old.slots and all(old.symbols[s] is None for s in slots)
+        for i, slot in enumerate(slots):
+            new.adopt(f"S{i}USDT", slot)
+        assert m.screen(NOW, None, 3, 2) == before
+    finally:
+        shm.unlink()
+
+
+def test_set_prices_batch_equals_per_slot():
+    rng = np.random.default_rng(7)
+    batch, single = build_market(40, seed=7), build_market(40, seed=7)
+    t = NOW
+    for _ in range(60):
+        # 每個 frame 只含部分幣種，間隔不固定：有的 slot 到取樣間隔、有的沒到
+        t += rng.choice([1.0, 3.0, 11.0])
+        slots = np.sort(rng.choice(40, rng.integers(1, 40), replace=False))
+        prices, funding = rng.uniform(1, 100, len(slots)), rng.uniform(-0.1, 0.1, len(slots))
+        batch.set_prices(slots, prices, funding, t)
+        for s, p, f in zip(slots, prices, funding):
+            single.funding_rate[s] = f
+            single.set_price(int(s), float(p), t)
+    for name in ("last_price", "funding_rate", "dirty"):
+        np.testing.assert_array_equal(getattr(batch, name), getattr(single, name))
+    for name in ("t", "v", "start", "count", "total"):
+        np.testing.assert_array_equal(getattr(batch.price_hist, name), getattr(single.price_hist, name))
@@ -0,0 +1,63 @@
+import pytest
+import sharding
+from sharding import ShardCoordinator, weight_share
+from config import REST_WEIGHT_LIMIT
+from models import symbol_state, register_symbol, unregister_symbol
+
+
+class Control(list):
+    put = list.append
+
+
+class DeadProc:
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+
+@pytest.fixture
+def coord(monkeypatch):
+    # 不啟動行程：控制佇列換成 list，重啟只記錄 index
+    released, spawned = [], []
+    monkeypatch.setattr(sharding.market, "release", lambda slots: released.extend(slots))
+    monkeypatch.setattr(ShardCoordinator, "_spawn", lambda self, i: spawned.append(i))
+    c = ShardCoordinator(workers=2, capacity=0)
+    c.controls = [Control(), Control()]
+    syms = [f"SHARD{i}USDT" for i in range(4)]
+    for s in syms:
+        register_symbol(s, 0)
+    c.rebalance()
+    yield c, syms, released, spawned
+    for s in syms:
+        if s in symbol_state:
+            unregister_symbol(s)
+
+
+def test_weight_budget_split_between_main_and_workers():
+    assert weight_share(3) * 4 <= REST_WEIGHT_LIMIT
+    assert weight_share(0) == REST_WEIGHT_LIMIT
+
+
+def test_dropped_slot_released_on_ack(coord):
+    c, syms, released, _ = coord
+    w, slot = c.owner[syms[0]]
+    unregister_symbol(syms[0])
+    c.rebalance()
+    assert c.controls[w][-1] == ("drop", [syms[0]])
+    assert released == []
+    c._released(w, [(syms[0], slot)])
+    assert released == [slot] and c.dropping[w] == {}
+
+
+def test_dead_worker_leaks_no_dropped_slots(coord):
+    c, syms, released, spawned = coord
+    w, slot = c.owner[syms[1]]
+    unregister_symbol(syms[1])
+    c.rebalance()
+    # worker 在確認放掉之前就結束：重啟時回收，之後遲到的確認不重複回收
+    c.procs[w] = DeadProc()
+    c.supervise()
+    assert spawned == [w] and released == [slot] and w not in c.dropping
+    c._released(w, [(syms[1], slot)])
+    assert released == [slot]
@@ -0,0 +1,103 @@
+import json
+import random
+import pytest
+import subscriptions as subs
+from subscriptions import Rule, SubscriptionRegistry
+from tests.test_screener import build_market, NOW
+
+
+def registry(rng, chats=12):
+    reg = SubscriptionRegistry(path=None)
+    # 門檻只從少數幾組裡挑，多個聊天室共用同一組
+    keys = [(3, 2, None, None), (5, 4, 0.0, None), (3, 2, None, 1e5), (8, 6, 5.0, 5e4)]
+    for i in range(chats):
+        p, v, o, l = rng.choice(keys)
+        allow = None if rng.random() < 0.6 else {f"S{j}USDT" for j in rng.sample(range(300), 150)}
+        deny = {f"S{j}USDT" for j in rng.sample(range(300), 20)} if rng.random() < 0.5 else ()
+        reg.rules[f"chat{i}"] = Rule(p, v, o, l, cooldown=600 * (i + 1), allow=allow, deny=deny)
+    return reg
+
+
+def brute_route(reg, triggered):
+    out = set()
+    for chat, rule in reg.rules.items():
+        for sym, res in triggered:
+            oi = res["oi_pct"]
+            if (res["price_pct"] > rule.price and res["vol_ratio"] > rule.volume
+                    and (rule.oi is None or (oi is not None and oi > rule.oi))
+                    and (rule.liq is None or res["liq_short"][1] > rule.liq)
+                    and rule.accepts(sym)):
+                out.add((chat, sym))
+    return out
+
+
+def synthetic_triggered(rng, n=300):
+    return [(f"S{i}USDT", {"price_pct": rng.uniform(0, 12), "vol_ratio": rng.uniform(1, 10),
+                           "oi_pct": None if rng.random() < 0.2 else rng.uniform(-5, 15),
+                           "liq_short": [0.0, rng.choice((0.0, 3e4, 8e4, 2e5)), 0.0], "reason": []})
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_route_matches_per_chat_loop(seed):
+    rng = random.Random(seed)
+    reg = registry(rng)
+    triggered = synthetic_triggered(rng)
+    routed = reg.route(triggered)
+    assert {(chat, sym) for chat, _, sym, _ in routed} == brute_route(reg, triggered)
+    assert len(routed) == len({(chat, sym) for chat, _, sym, _ in routed})
+    assert all(reg.rules[chat] is rule for chat, rule, _, _ in routed)
+    # 門檻相同的聊天室共用一組比對
+    assert len(reg.groups()) == len({r.key() for r in reg.rules.values()})
+    assert sum(len(m) for m in reg.groups().values()) == len(reg.rules)
+
+
+def test_loosest_screen_then_route_equals_screen_per_chat():
+    m = build_market(300, seed=5)
+    reg = registry(random.Random(9))
+    assert reg.loosest() == (3, 2)
+    routed = reg.route(m.screen(NOW, None, *reg.loosest()))
+    expected = set()
+    for chat, rule in reg.rules.items():
+        # 每個聊天室用自己的門檻各跑一次 screen，再套用持倉 / 爆倉 / 名單
+        own = SubscriptionRegistry(path=None)
+        own.rules[chat] = rule
+        expected |= {(c, sym) for c, _, sym, _ in own.route(m.screen(NOW, None, rule.price, rule.volume))}
+    assert {(chat, sym) for chat, _, sym, _ in routed} == expected
+    assert expected
+
+
+def test_groups_rebuilt_after_update(tmp_path):
+    reg = SubscriptionRegistry(path=str(tmp_path / "subs.json"))
+    reg.subscribe("a")
+    reg.subscribe("b")
+    assert len(reg.groups()) == 1
+    reg.update("b", price=9.0)
+    assert len(reg.groups()) == 2 and reg.loosest()[0] == min(reg.rules["a"].price, 9.0)
+    reg.unsubscribe("a")
+    assert list(reg.groups()) == [reg.rules["b"].key()]
+
+
+def test_json_round_trip(tmp_path):
+    path = str(tmp_path / "subs.json")
+    reg = SubscriptionRegistry(path)
+    reg.rules = {"1": Rule(4, 3, None, None, 900, allow=None, deny={"XUSDT"}),
+                 "-100": Rule(2.5, 1.5, 0.0, 5e4, 60, allow={"AUSDT", "BUSDT"}),
+                 "42": Rule(allow=set())}
+    reg.save()
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    assert raw["-100"]["allow"] == ["AUSDT", "BUSDT"] and raw["1"]["oi"] is None and raw["42"]["allow"] == []
+    loaded = SubscriptionRegistry(path)
+    assert loaded.load() == 3
+    assert {c: r.to_dict() for c, r in loaded.rules.items()} == {c: r.to_dict() for c, r in reg.rules.items()}
+    assert not loaded.rules["42"].accepts("AUSDT") and loaded.rules["1"].accepts("AUSDT")
+    assert not loaded.rules["1"].accepts("XUSDT")
+
+
+def test_first_start_uses_config_chat(tmp_path, monkeypatch):
+    monkeypatch.setattr(subs, "CHAT_ID", 12345)
+    path = tmp_path / "subs.json"
+    reg = SubscriptionRegistry(str(path))
+    assert reg.load() == 1 and reg.rules["12345"].to_dict() == Rule().to_dict()
+    assert path.exists()
@@ -0,0 +1,171 @@
+import asyncio
+from collections import defaultdict, deque
+from datetime import timedelta
+import pytest
+from telegram.error import RetryAfter
+import clock
+import models
+import telegram_bot as tb
+from telegram_bot import AlertDispatcher, TELEGRAM_MAX_CHARS, DIGEST_HEADER
+
+T0 = 1_760_000_000.0
+
+
+class FakeTime:
+    """取代 telegram_bot 的 time 與 asyncio.sleep：sleep 只推進時間，間隔可精確比對"""
+
+    def __init__(self):
+        self.t = 100.0
+        self.real_sleep = asyncio.sleep
+
+    def monotonic(self):
+        return self.t
+
+    perf_counter = monotonic
+
+    async def sleep(self, delay):
+        self.t += max(delay, 0)
+        await self.real_sleep(0)
+
+
+class FakeBot:
+    """記錄每次送出的 (chat_id, 內文, monotonic 時間)；errors 依序在前幾次呼叫丟出"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, tb.time.monotonic()))
+
+
+@pytest.fixture
+def tg(monkeypatch):
+    vclock = clock.VirtualClock(T0)
+    monkeypatch.setattr(clock, "now", vclock)
+    monkeypatch.setattr(tb, "last_alert", defaultdict(dict))
+    monkeypatch.setattr(tb, "alert_latency", deque(maxlen=10))
+    # 內文由 alert_data 指定，不依賴幣種狀態
+    monkeypatch.setattr(tb, "format_alert", lambda symbol, data, now: data.get("text", f"{symbol} 告警"))
+
+    fake = FakeTime()
+    monkeypatch.setattr(tb, "time", fake)
+    monkeypatch.setattr(asyncio, "sleep", fake.sleep)
+
+    def use(bot):
+        monkeypatch.setattr(models, "bot", bot)
+        return bot
+    return vclock, use, fake
+
+
+def alert(text=None):
+    data = {"reason": ["測試"]}
+    if text is not None:
+        data["text"] = text
+    return data
+
+
+def test_cooldown_written_only_after_delivery(tg):
+    vclock, use, _ = tg
+    bot = use(FakeBot([ValueError("壞掉的 Markdown")]))
+    d = AlertDispatcher(chat_interval=0, global_interval=0)
+
+    async def main():
+        assert d.submit(1, "AUSDT", alert())
+        assert not d.submit(1, "AUSDT", alert())   # 已在佇列
+        await d.join()
+        # 送出失敗：不寫冷卻、不再視為排隊中，下次符合條件可再告警
+        assert tb.last_alert["AUSDT"] == {} and not d.pending
+        vclock.t += 1
+        assert d.submit(1, "AUSDT", alert())
+        await d.join()
+        assert tb.last_alert["AUSDT"] == {1: T0 + 1}
+        assert len(bot.sent) == 1
+        vclock.t += tb.ALERT_COOLDOWN - 1
+        assert not d.submit(1, "AUSDT", alert())   # 冷卻中
+        assert d.submit(2, "AUSDT", alert())       # 冷卻依聊天室分開
+        vclock.t += 1
+        await d.join()
+        assert d.submit(1, "AUSDT", alert())
+        await d.join()
+        await d.close()
+
+    asyncio.run(main())
+
+
+def test_chunks_respect_message_limit():
+    items = [(f"S{i}", "x" * n) for i, n in enumerate((2000, 2000, 2000, 100, 4070, 10, 4090))]
+    chunks = list(AlertDispatcher._chunks(items))
+    assert [[s for s, _ in c] for c in chunks] == [["S0", "S1"], ["S2", "S3"], ["S4"], ["S5"], ["S6"]]
+    # 合併的摘要連同標題也不可超過上限（單則照原樣送出）
+    for c in chunks:
+        if len(c) > 1:
+            assert len(DIGEST_HEADER.format(len(c)) + "\n\n".join(t for _, t in c)) <= TELEGRAM_MAX_CHARS
+
+
+def test_queued_alerts_merged_per_chat(tg):
+    _, use, _ = tg
+    bot = use(FakeBot())
+    d = AlertDispatcher(chat_interval=0, global_interval=0)
+
+    async def main():
+        for i in range(5):
+            d.submit(1, f"S{i}USDT", alert())
+        d.submit(2, "S0USDT", alert())
+        # 超過單則上限的部分拆成下一則
+        d.submit(3, "BIGAUSDT", alert("a" * 3000))
+        d.submit(3, "BIGBUSDT", alert("b" * 3000))
+        await d.join()
+        await d.close()
+
+    asyncio.run(main())
+    by_chat = {}
+    for chat, text, _ in bot.sent:
+        by_chat.setdefault(chat, []).append(text)
+    assert len(by_chat[1]) == 1 and by_chat[1][0].startswith("📦 5 個幣種同時異動")
+    assert by_chat[2] == ["S0USDT 告警"]
+    assert by_chat[3] == ["a" * 3000, "b" * 3000]
+    assert set(tb.last_alert) == {f"S{i}USDT" for i in range(5)} | {"BIGAUSDT", "BIGBUSDT"}
+
+
+def test_retry_after_waits_then_resends(tg):
+    _, use, fake = tg
+    bot = use(FakeBot([RetryAfter(timedelta(seconds=3))]))
+    d = AlertDispatcher(chat_interval=1, global_interval=0)
+
+    async def main():
+        d.submit(1, "AUSDT", alert())
+        await d.join()
+        await d.close()
+
+    t0 = fake.t
+    asyncio.run(main())
+    assert bot.calls == 2 and len(bot.sent) == 1
+    # 暫停 retry_after 秒；重送前的間隔已超過聊天室間隔，不再多等
+    assert bot.sent[0][2] - t0 == pytest.approx(3)
+    assert tb.last_alert["AUSDT"] == {1: T0}
+
+
+def test_per_chat_and_global_pacing(tg):
+    _, use, _ = tg
+    bot = use(FakeBot())
+    d = AlertDispatcher(chat_interval=1.0, global_interval=0.2)
+
+    async def main():
+        # 每則都超過半個上限：同一聊天室拆成多則依序送
+        for chat in (1, 2):
+            for i in range(3):
+                d.submit(chat, f"S{i}USDT", alert(str(chat) * 2500))
+        await d.join()
+        await d.close()
+
+    asyncio.run(main())
+    assert [c for c, _, _ in bot.sent] == [1, 1, 1, 2, 2, 2]
+    times = [t for _, _, t in bot.sent]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # 同聊天室間隔 chat_interval，換聊天室只需 global_interval
+    assert gaps == pytest.approx([1.0, 1.0, 0.2, 1.0, 1.0])
@@ -0,0 +1,117 @@
+import bisect
+import random
+from collections import deque
+import numpy as np
+import pytest
+from screener import MarketArrays
+from timeseries import TimeSeriesStore, BucketWindows
+
+
+def fill(rng, slots, length, n, windows=(3, 7)):
+    """隨機寫入，回傳 store 與每個 slot 的 deque 參考"""
+    store = TimeSeriesStore(slots, length, windows)
+    ref = [deque(maxlen=length) for _ in range(slots)]
+    t = [0.0] * slots
+    for _ in range(n):
+        s = rng.randrange(slots)
+        t[s] += rng.choice((1.0, 10.0, 10.0, 35.0))
+        v = round(rng.uniform(-5, 100), 3)
+        store.append(s, t[s], v)
+        ref[s].append((t[s], v))
+    return store, ref
+
+
+def assert_matches(store, ref):
+    for s, hist in enumerate(ref):
+        t, v = store.series(s)
+        assert t.tolist() == [x[0] for x in hist] and v.tolist() == [x[1] for x in hist]
+        vals = [x[1] for x in hist]
+        assert store.total[s] == pytest.approx(sum(vals))
+        for w, arr in store.sums.items():
+            assert arr[s] == pytest.approx(sum(vals[-w:]))
+        last = store.last(s)
+        assert last == (hist[-1] if hist else (None, None))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_append_matches_deque_across_wraparound(seed):
+    store, ref = fill(random.Random(seed), 6, 10, 400)
+    assert_matches(store, ref)
+
+
+def test_append_many_equals_per_slot_append():
+    rng = random.Random(4)
+    batch, single = TimeSeriesStore(8, 5, (2, 4)), TimeSeriesStore(8, 5, (2, 4))
+    for step in range(30):
+        slots = np.array(sorted(rng.sample(range(8), rng.randrange(1, 8))))
+        v = np.array([rng.uniform(0, 10) for _ in slots])
+        batch.append_many(slots, float(step), v)
+        for s, x in zip(slots, v):
+            single.append(int(s), float(step), float(x))
+    for name in ("t", "v", "start", "count", "total"):
+        np.testing.assert_allclose(getattr(batch, name), getattr(single, name))
+    for w in batch.sums:
+        np.testing.assert_allclose(batch.sums[w], single.sums[w])
+
+
+def test_as_of_vectorized_matches_bisect():
+    rng = random.Random(5)
+    store, ref = fill(rng, 12, 20, 600)
+    store.clear(11)
+    ref[11].clear()
+    slots = np.arange(12)
+    for _ in range(50):
+        when = np.array([rng.uniform(-50, 1200) for _ in slots])
+        t, v = store.as_of(slots, when)
+        for s in slots:
+            times = [x[0] for x in ref[s]]
+            i = bisect.bisect_right(times, when[s])
+            if i == 0:
+                assert np.isnan(t[s]) and np.isnan(v[s])
+            else:
+                assert (t[s], v[s]) == ref[s][i - 1]
+    # 純量 when 對整批 slot 廣播
+    t, _ = store.as_of(slots, 1e9)
+    assert t[:11].tolist() == [ref[s][-1][0] for s in range(11)] and np.isnan(t[11])
+
+
+def test_lookback_is_exact_not_oldest_sample():
+    market = MarketArrays(4)
+    slot = market.add("AAAUSDT", 0)
+    # 10 秒一筆、100 筆緩衝 > 15 分鐘：舊做法取 hist[0] 是 990 秒前，精確回看應取 900 秒前那筆
+    for i in range(100):
+        market.price_hist.append(slot, 1000.0 + 10 * i, 1.0 + i)
+    now = 1000.0 + 990
+    assert market.lookback(market.price_hist, slot, now, 900) == (1090.0, 10.0)
+    assert market.lookback(market.price_hist, slot, now, 905) == (1080.0, 9.0)
+    # 歷史不足
+    assert market.lookback(market.price_hist, slot, now, 2000) == (None, None)
+
+
+def brute_windows(events, now, span, windows, slots, channels):
+    b = int(now // span)
+    out = {w: np.zeros((slots, channels)) for w in windows}
+    for t, s, c, v in events:
+        age = b - int(t // span)
+        for w in windows:
+            if 0 <= age < w:
+                out[w][s, c] += v
+    return out
+
+
+def test_bucket_windows_roll_and_add_match_event_list():
+    rng = random.Random(6)
+    win = BucketWindows(5, 60, 60, (5, 15, 60), channels=2)
+    events, now = [], 10_000.0
+    for _ in range(2000):
+        # 偶爾整段沒有事件（跳過多桶，含超過環形長度）
+        now += rng.choice((0.5, 3.0, 20.0, 200.0)) if rng.random() < 0.98 else 5000.0
+        s, c, v = rng.randrange(5), rng.randrange(2), rng.uniform(1, 1000)
+        win.add(s, c, now, v)
+        events.append((now, s, c, v))
+    for t in (now, now + 60, now + 600, now + 7200):
+        win.roll(t)
+        ref = brute_windows(events, t, 60, win.windows, 5, 2)
+        for w in win.windows:
+            np.testing.assert_allclose(win.sums[w], ref[w], atol=1e-6)
+    assert all((arr == 0).all() for arr in win.sums.values())
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+import universe as universe_mod
+from universe import MarketUniverse, RECONCILE_BACKOFF
+
+T0 = 1_760_000_000.0
+
+
+class FakeGateway:
+    """futures_ticker 依序丟出 errors，之後回傳固定清單"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def futures_ticker(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [{"symbol": "AUSDT", "quoteVolume": "1e12"}]
+
+
+class FakeStream:
+    """每則訊息推進時間 step 秒，送完 n 則後停止 run 迴圈"""
+
+    def __init__(self, clock, n, step):
+        self.clock, self.n, self.step = clock, n, step
+        self.opened = 0
+
+    def __call__(self, streams):
+        self.opened += 1
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def recv(self):
+        self.n -= 1
+        if self.n <= 0:
+            universe_mod.running = False
+        self.clock[0] += self.step
+        return {"data": [{"s": "CUSDT", "q": "1e12"}]}
+
+
+@pytest.fixture
+def env(monkeypatch):
+    now = [T0]
+    monkeypatch.setattr(universe_mod.time, "time", lambda: now[0])
+    monkeypatch.setattr(universe_mod, "running", True)
+    warned = []
+    monkeypatch.setattr(universe_mod.log, "warning", lambda msg, *args: warned.append(args))
+    return now, warned
+
+
+def test_reconcile_failure_backs_off_without_reconnect(env, monkeypatch):
+    now, warned = env
+    gw = FakeGateway([RuntimeError("503")] * 3)
+    monkeypatch.setattr(universe_mod, "gateway", gw)
+    stream = FakeStream(now, n=50, step=10)
+
+    class FakeManager:
+        def __init__(self, client, user_timeout):
+            self.futures_multiplex_socket = stream
+
+    monkeypatch.setattr(universe_mod, "BinanceSocketManager", FakeManager)
+    u = MarketUniverse()
+    asyncio.run(u.run(None))
+    # 串流只開一次；失敗後隔 30 / 60 / 120 秒重試，第 4 次成功
+    assert stream.opened == 1
+    assert gw.calls == 4 and u.failures == 0
+    assert u.reconciled_at == T0 + 30 + 60 + 120
+    assert [delay for _, delay in warned] == [30, 60, 120]
+    assert "AUSDT" in u.valid and "CUSDT" in u.valid
+
+
+def test_backoff_capped_at_reconcile_interval(env, monkeypatch):
+    now, _ = env
+    monkeypatch.setattr(universe_mod, "gateway", FakeGateway([RuntimeError("down")] * 20))
+    u = MarketUniverse()
+    for _ in range(10):
+        now[0] = max(u.retry_at, T0)
+        asyncio.run(u.maybe_reconcile())
+    assert u.failures == 10
+    assert u.retry_at - now[0] == universe_mod.UNIVERSE_RECONCILE_INTERVAL
+    assert RECONCILE_BACKOFF < universe_mod.UNIVERSE_RECONCILE_INTERVAL
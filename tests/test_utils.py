@@ -0,0 +1,89 @@
+import logging
+import queue
+import pytest
+import utils
+from utils import BurstFilter, BURST_LIMIT, BURST_WINDOW
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(utils.time, "monotonic", c)
+    return c
+
+
+def record(msg, level=logging.ERROR, args=()):
+    return logging.LogRecord("test", level, __file__, 0, msg, args, None)
+
+
+def passed(burst, msg, n, level=logging.ERROR):
+    return sum(burst.filter(record(msg, level, (i,))) for i in range(n))
+
+
+def test_limits_each_template_per_window(clock):
+    burst = BurstFilter()
+    assert passed(burst, "[錯誤] %s", 20) == BURST_LIMIT
+    assert passed(burst, "[另一則] %s", 3) == 3
+    assert passed(burst, "一般訊息 %s", 20, logging.INFO) == 20
+
+
+def test_summary_reported_without_further_records_of_that_template(clock):
+    out = []
+    burst = BurstFilter(out.append)
+    passed(burst, "[錯誤] %s", 12)
+    clock.t += BURST_WINDOW
+    # 之後只有其他訊息（INFO 也算）經過：過期視窗被清掉並補發摘要
+    burst.filter(record("其他 %s", logging.INFO, (0,)))
+    assert [r.getMessage() for r in out] == [f"[錯誤] 11（前 {BURST_WINDOW} 秒內另有 7 筆相同訊息已略過）"]
+    assert out[0].levelno == logging.ERROR and burst.filter(out[0])
+    assert burst.windows == {}
+
+
+def test_windows_are_pruned(clock):
+    burst = BurstFilter()
+    for i in range(100):
+        burst.filter(record(f"[錯誤] 每次都不同的模板 {i}"))
+    assert len(burst.windows) == 100
+    clock.t += BURST_WINDOW
+    burst.filter(record("下一筆", logging.INFO))
+    assert burst.windows == {}
+
+
+def test_summary_when_template_fires_again(clock):
+    out = []
+    burst = BurstFilter(out.append)
+    passed(burst, "[錯誤] %s", BURST_LIMIT + 2)
+    clock.t += BURST_WINDOW / 2
+    burst.filter(record("其他", logging.INFO))   # 掃描時間點在視窗中間，尚未過期
+    clock.t += BURST_WINDOW / 2
+    assert burst.filter(record("[錯誤] %s", args=(0,)))
+    assert len(out) == 1 and "另有 2 筆" in out[0].getMessage()
+
+
+def test_flush_at_exit_reports_open_windows(clock):
+    out = []
+    burst = BurstFilter(out.append)
+    passed(burst, "[錯誤] %s", BURST_LIMIT + 1)
+    burst.sweep(float("inf"))
+    assert len(out) == 1 and "另有 1 筆" in out[0].getMessage()
+
+
+def test_lazy_queue_handler_snapshots_mutable_args():
+    q = queue.Queue()
+    handler = utils.LazyQueueHandler(q)
+    state = {"price": 1.0}
+    handler.handle(record("狀態 %s", logging.INFO, (state,)))
+    handler.handle(record("價格 %.1f %s", logging.INFO, (2.0, "AUSDT")))
+    state["price"] = 99.0   # listener 格式化前被改掉
+    mutable, plain = q.get_nowait(), q.get_nowait()
+    assert mutable.getMessage() == "狀態 {'price': 1.0}" and mutable.args is None
+    # 純量參數維持延後格式化
+    assert plain.args == (2.0, "AUSDT") and plain.getMessage() == "價格 2.0 AUSDT"
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import pytest
+from websockets.asyncio.server import serve
+import ws_manager
+from ws_manager import ConnectionManager
+
+
+def streams_for(sym):
+    return (f"{sym.lower()}@kline_1m",)
+
+
+class FakeStream:
+    """本機假 Binance combined stream：記錄每條連線的訂閱，持續對已訂閱的 stream 推訊息"""
+
+    def __init__(self, tick=0.02):
+        self.tick = tick
+        self.conns = []   # 每條連線一個 dict：subs / frames / frozen / ws
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await serve(self.handler, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self):
+        return "ws://127.0.0.1:%d/stream" % self.server.sockets[0].getsockname()[1]
+
+    async def handler(self, ws):
+        conn = {"subs": set(), "frames": [], "frozen": False, "ws": ws, "open": True}
+        self.conns.append(conn)
+        pump = asyncio.create_task(self.pump(conn))
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                conn["frames"].append((msg["method"], msg["params"]))
+                if msg["method"] == "SUBSCRIBE":
+                    conn["subs"] |= set(msg["params"])
+                elif msg["method"] == "UNSUBSCRIBE":
+                    conn["subs"] -= set(msg["params"])
+                await ws.send(json.dumps({"result": None, "id": msg["id"]}))
+        except Exception:
+            pass
+        finally:
+            conn["open"] = False
+            pump.cancel()
+
+    async def pump(self, conn):
+        while True:
+            await asyncio.sleep(self.tick)
+            if conn["frozen"]:
+                continue
+            for st in sorted(conn["subs"]):
+                await conn["ws"].send(json.dumps({"stream": st, "data": {"s": st}}))
+
+    def live(self):
+        return [c for c in self.conns if c["open"]]
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(ws_manager, "FRAME_INTERVAL", 0)
+    monkeypatch.setattr(ws_manager, "WS_STALL_TIMEOUT", 0.3)
+    monkeypatch.setattr(ws_manager, "WATCHDOG_INTERVAL", 0.05)
+
+
+async def wait_for(cond, timeout=3.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not cond():
+        assert loop.time() < deadline, "等待逾時"
+        await asyncio.sleep(0.01)
+
+
+def run(scenario, monkeypatch):
+    async def main():
+        async with FakeStream() as server:
+            monkeypatch.setattr(ws_manager, "WS_URL", server.url)
+            received = []
+            manager = ConnectionManager(received.append, streams_for, per_conn=2)
+            try:
+                await scenario(server, manager, received)
+            finally:
+                await manager.close()
+    asyncio.run(main())
+
+
+def test_subscribe_and_unsubscribe_in_place(fast, monkeypatch):
+    async def scenario(server, manager, received):
+        await manager.sync(["AAA", "BBB", "CCC"])
+        await wait_for(lambda: sum(len(c["subs"]) for c in server.live()) == 3)
+        assert len(manager.conns) == 2
+        assert sorted(sorted(c["subs"]) for c in server.live()) == [
+            ["aaa@kline_1m", "bbb@kline_1m"], ["ccc@kline_1m"]]
+
+        # BBB 退訂、CCC 那條清空後關閉、DDD 塞進第一條的空位：不新開連線
+        await manager.sync(["AAA", "DDD"])
+        await wait_for(lambda: len(server.live()) == 1)
+        first = server.live()[0]
+        await wait_for(lambda: first["subs"] == {"aaa@kline_1m", "ddd@kline_1m"})
+        assert ("UNSUBSCRIBE", ["bbb@kline_1m"]) in first["frames"]
+        assert ("SUBSCRIBE", ["ddd@kline_1m"]) in first["frames"]
+        assert len(server.conns) == 2
+        assert set(manager.sym_conn) == {"AAA", "DDD"}
+        n = len(received)
+        await wait_for(lambda: any('"ddd@kline_1m"' in raw for raw in received[n:]))
+    run(scenario, monkeypatch)
+
+
+def test_rotation_connects_before_disconnecting(fast, monkeypatch):
+    async def scenario(server, manager, received):
+        await manager.sync(["AAA", "BBB"])
+        old = manager.conns[0]
+        await asyncio.wait_for(old.ready.wait(), 3)
+
+        await manager.replace(old, "測試輪替")
+        new = manager.conns[0]
+        assert new is not old and new.ready.is_set()
+        assert old.task.done()
+        assert all(manager.sym_conn[s] is new for s in ("AAA", "BBB"))
+        await wait_for(lambda: len(server.live()) == 1)
+        assert server.live()[0]["subs"] == {"aaa@kline_1m", "bbb@kline_1m"}
+        # 新連線在舊連線關閉前就已收到資料
+        assert new.messages > 0
+        n = new.messages
+        await wait_for(lambda: new.messages > n)
+    run(scenario, monkeypatch)
+
+
+def test_rotation_picks_up_symbols_changed_while_waiting(fast, monkeypatch):
+    async def scenario(server, manager, received):
+        await manager.sync(["AAA"])
+        old = manager.conns[0]
+        await asyncio.wait_for(old.ready.wait(), 3)
+        # 新連線等資料期間 BBB 加進舊連線
+        server.tick = 0.2
+        task = asyncio.create_task(manager.replace(old, "測試輪替"))
+        await asyncio.sleep(0.05)
+        await manager.sync(["AAA", "BBB"])
+        await task
+        new = manager.conns[0]
+        assert new.symbols == {"AAA", "BBB"}
+        await wait_for(lambda: len(server.live()) == 1 and server.live()[0]["subs"] == {"aaa@kline_1m", "bbb@kline_1m"})
+    run(scenario, monkeypatch)
+
+
+def test_watchdog_replaces_only_the_stalled_connection(fast, monkeypatch):
+    async def scenario(server, manager, received):
+        await manager.sync(["AAA", "BBB", "CCC"])
+        await asyncio.wait_for(asyncio.gather(*(c.ready.wait() for c in manager.conns)), 3)
+        healthy, stalled = manager.conns
+        frozen = next(c for c in server.live() if "ccc@kline_1m" in c["subs"])
+        frozen["frozen"] = True
+
+        watchdog = asyncio.create_task(manager.watchdog())
+        try:
+            await wait_for(lambda: stalled not in manager.conns)
+        finally:
+            watchdog.cancel()
+        assert manager.conns[0] is healthy
+        replacement = manager.conns[1]
+        assert replacement.symbols == {"CCC"} and manager.sym_conn["CCC"] is replacement
+        await wait_for(lambda: not frozen["open"])
+        await wait_for(lambda: replacement.messages > 0)
+    run(scenario, monkeypatch)
+
+
+def test_watchdog_reconnects_after_server_drop(fast, monkeypatch):
+    async def scenario(server, manager, received):
+        await manager.sync(["AAA"])
+        conn = manager.conns[0]
+        await asyncio.wait_for(conn.ready.wait(), 3)
+        await server.live()[0]["ws"].close()
+        await wait_for(lambda: conn.task.done())
+
+        watchdog = asyncio.create_task(manager.watchdog())
+        try:
+            await wait_for(lambda: manager.conns[0] is not conn)
+        finally:
+            watchdog.cancel()
+        await wait_for(lambda: manager.conns[0].messages > 0)
+        assert server.live()[0]["subs"] == {"aaa@kline_1m"}
+    run(scenario, monkeypatch)
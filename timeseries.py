@@ -0,0 +1,184 @@
+import numpy as np
+
+# ================== 欄式環形時間序列 ==================
+# 所有幣種共用一塊 2-D 陣列（slot × 長度），每個 slot 一個環形緩衝：
+# append O(1)、「T 時間點的值」二分搜尋 O(log n)（可一次查整批 slot）、
+# 視窗加總 O(1)（寫入時增量維護）
+
+
+class TimeSeriesStore:
+    def __init__(self, slots, length, windows=()):
+        self.length = length
+        self.windows = tuple(windows)
+        self.t = np.zeros((slots, length))
+        self.v = np.zeros((slots, length))
+        self.start = np.zeros(slots, dtype=np.int64)
+        self.count = np.zeros(slots, dtype=np.int64)
+        self.total = np.zeros(slots)
+        self.sums = {w: np.zeros(slots) for w in self.windows}
+
+    def grow(self, slots):
+        old = len(self.count)
+        for name in ("t", "v"):
+            arr = np.zeros((slots, self.length))
+            arr[:old] = getattr(self, name)
+            setattr(self, name, arr)
+        for name in ("start", "count", "total"):
+            arr = np.zeros(slots, dtype=getattr(self, name).dtype)
+            arr[:old] = getattr(self, name)
+            setattr(self, name, arr)
+        for w, arr in self.sums.items():
+            grown = np.zeros(slots)
+            grown[:old] = arr
+            self.sums[w] = grown
+
+    def clear(self, slot):
+        self.start[slot] = self.count[slot] = 0
+        self.total[slot] = 0.0
+        for arr in self.sums.values():
+            arr[slot] = 0.0
+
+    def load(self, slot, t, v):
+        # 整段寫入（快照還原用），覆蓋該 slot 原有資料
+        t, v = np.asarray(t)[-self.length:], np.asarray(v)[-self.length:]
+        n = len(v)
+        self.t[slot, :n] = t
+        self.v[slot, :n] = v
+        self.start[slot] = 0
+        self.count[slot] = n
+        self.total[slot] = v.sum()
+        for w, arr in self.sums.items():
+            arr[slot] = v[-w:].sum()
+
+    def _phys(self, slot, i):
+        return (self.start[slot] + i) % self.length
+
+    def append(self, slot, t, v):
+        n = int(self.count[slot])
+        vals = self.v[slot]
+        # 先扣掉這筆寫入後會離開各視窗的值
+        for w, arr in self.sums.items():
+            if n >= w:
+                arr[slot] += v - vals[self._phys(slot, n - w)]
+            else:
+                arr[slot] += v
+        if n == self.length:
+            self.total[slot] += v - vals[self.start[slot]]
+            pos = self.start[slot]
+            self.start[slot] = (pos + 1) % self.length
+        else:
+            self.total[slot] += v
+            pos = self._phys(slot, n)
+            self.count[slot] = n + 1
+        self.t[slot, pos] = t
+        vals[pos] = v
+
+    def append_many(self, slots, t, v):
+        """多個 slot 各追加一筆（slots 不可重複），與逐筆 append 結果相同"""
+        start = self.start[slots]
+        n = self.count[slots]
+        vals = self.v
+        for w, arr in self.sums.items():
+            leaving = np.where(n >= w, vals[slots, (start + n - w) % self.length], 0.0)
+            arr[slots] += v - leaving
+        full = n == self.length
+        pos = np.where(full, start, (start + n) % self.length)
+        self.total[slots] += v - np.where(full, vals[slots, pos], 0.0)
+        self.start[slots] = np.where(full, (start + 1) % self.length, start)
+        self.count[slots] = np.minimum(n + 1, self.length)
+        self.t[slots, pos] = t
+        vals[slots, pos] = v
+
+    def last_t(self, slots):
+        # 各 slot 最後一筆的時間，沒有資料為 NaN
+        n = self.count[slots]
+        t = self.t[slots, (self.start[slots] + n - 1) % self.length]
+        return np.where(n > 0, t, np.nan)
+
+    def last(self, slot):
+        n = self.count[slot]
+        if not n:
+            return None, None
+        pos = self._phys(slot, n - 1)
+        return self.t[slot, pos], self.v[slot, pos]
+
+    def series(self, slot):
+        # 依時間排序的 (t, v) 複本
+        idx = (self.start[slot] + np.arange(self.count[slot])) % self.length
+        return self.t[slot, idx], self.v[slot, idx]
+
+    def as_of(self, slots, when):
+        """每個 slot 在 when（可為陣列）當下或之前最近的一筆，沒有則為 NaN"""
+        slots = np.asarray(slots, dtype=np.int64)
+        when = np.broadcast_to(np.asarray(when, dtype=np.float64), slots.shape)
+        start = self.start[slots]
+        count = self.count[slots]
+        lo = np.zeros(len(slots), dtype=np.int64)
+        hi = count.copy()
+        # 向量化二分搜尋：找第一個 t > when 的邏輯位置
+        while True:
+            active = lo < hi
+            if not active.any():
+                break
+            mid = (lo + hi) // 2
+            t_mid = self.t[slots, (start + mid) % self.length]
+            right = active & (t_mid <= when)
+            left = active & ~right
+            lo = np.where(right, mid + 1, lo)
+            hi = np.where(left, mid, hi)
+        found = lo > 0
+        pos = (start + np.maximum(lo - 1, 0)) % self.length
+        t = np.where(found, self.t[slots, pos], np.nan)
+        v = np.where(found, self.v[slots, pos], np.nan)
+        return t, v
+
+
+# ================== 分桶滾動視窗 ==================
+# 事件不逐筆保存，只累加到「目前這一桶」：每個 slot × 通道一個環形的桶陣列，
+# 所有 slot 共用同一個桶時鐘。寫入 O(1)（當前桶與各視窗加總各加一次），
+# 換桶時一次對全部 slot 重算視窗加總（每桶一次），記憶體固定為 slots × 通道 × 桶數
+
+
+class BucketWindows:
+    def __init__(self, slots, span, buckets, windows, channels=1):
+        self.span = span        # 每桶秒數
+        self.buckets = buckets  # 環形桶數（需 >= 最大視窗）
+        self.windows = tuple(windows)
+        self.ring = np.zeros((slots, channels, buckets))
+        self.sums = {w: np.zeros((slots, channels)) for w in self.windows}
+        self.bucket = None      # 目前的絕對桶編號
+
+    def grow(self, slots):
+        old = len(self.ring)
+        ring = np.zeros((slots,) + self.ring.shape[1:])
+        ring[:old] = self.ring
+        self.ring = ring
+        for w, arr in self.sums.items():
+            grown = np.zeros((slots,) + arr.shape[1:])
+            grown[:old] = arr
+            self.sums[w] = grown
+
+    def clear(self, slot):
+        self.ring[slot] = 0.0
+        for arr in self.sums.values():
+            arr[slot] = 0.0
+
+    def roll(self, now):
+        b = int(now // self.span)
+        if self.bucket is None:
+            self.bucket = b
+        steps = b - self.bucket
+        if steps <= 0:
+            return
+        # 跳過的桶清零後，各視窗加總依最近 w 桶重算（順便消除浮點累積誤差）
+        for k in range(1, min(steps, self.buckets) + 1):
+            self.ring[:, :, (self.bucket + k) % self.buckets] = 0.0
+        self.bucket = b
+        for w, arr in self.sums.items():
+            arr[:] = self.ring[:, :, (b - np.arange(w)) % self.buckets].sum(axis=2)
+
+    def add(self, slot, channel, now, v):
+        self.roll(now)
+        self.ring[slot, channel, self.bucket % self.buckets] += v
+        for arr in self.sums.values():
+            arr[slot, channel] += v
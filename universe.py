@@ -0,0 +1,91 @@
+import asyncio
+import re
+import time
+from binance import BinanceSocketManager
+from config import EXCLUDE_SYMBOLS, QUOTE_VOLUME, UNIVERSE_RECONCILE_INTERVAL
+from models import running
+from gateway import gateway
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== 合約幣對 宇宙（24h ticker 快取） ==================
+# !ticker@arr 串流持續更新 24h 成交額，REST 只做低頻校正；
+# initialize_symbols 與篩選共用同一份已過濾的幣種集合
+
+# 預先編譯：USDT 結尾且不含任何排除字串
+SYMBOL_FILTER = re.compile(
+    r"^(?!.*(?:" + "|".join(map(re.escape, sorted(EXCLUDE_SYMBOLS))) + r")).*USDT$"
+)
+
+RECONCILE_BACKOFF = 30.0   # REST 校正失敗後的第一次重試間隔（秒），之後加倍，最多到校正間隔
+
+
+class MarketUniverse:
+    def __init__(self):
+        self.quote_volume = {}
+        self.valid = set()
+        self.updated_at = 0.0
+        self.reconciled_at = 0.0
+        self.retry_at = 0.0
+        self.failures = 0
+
+    def apply(self, items, sym_key, vol_key):
+        # 只有符合格式的幣種才記錄，串流只會送有變動的幣種
+        match = SYMBOL_FILTER.match
+        for t in items:
+            s = t[sym_key]
+            if not match(s):
+                continue
+            qv = float(t[vol_key])
+            self.quote_volume[s] = qv
+            if qv >= QUOTE_VOLUME:
+                self.valid.add(s)
+            else:
+                self.valid.discard(s)
+        self.updated_at = time.time()
+
+    async def reconcile(self):
+        ticker24 = await gateway.futures_ticker()
+        # REST 為完整清單，順便移除已下架的幣種
+        self.quote_volume.clear()
+        self.valid.clear()
+        self.apply(ticker24, "symbol", "quoteVolume")
+        self.reconciled_at = time.time()
+
+    async def maybe_reconcile(self):
+        """到期才做 REST 校正；失敗只延後重試，不影響串流連線"""
+        now = time.time()
+        if now - self.reconciled_at < UNIVERSE_RECONCILE_INTERVAL or now < self.retry_at:
+            return
+        try:
+            await self.reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            delay = min(RECONCILE_BACKOFF * 2 ** self.failures, UNIVERSE_RECONCILE_INTERVAL)
+            self.failures += 1
+            self.retry_at = now + delay
+            log.warning("[24h ticker 校正失敗] %s，%.0f 秒後重試", e, delay)
+        else:
+            self.failures = 0
+
+    async def run(self, client):
+        while running:
+            bm = BinanceSocketManager(client, user_timeout=60)
+            try:
+                async with bm.futures_multiplex_socket(["!ticker@arr"]) as stream:
+                    while running:
+                        await self.maybe_reconcile()
+                        msg = await stream.recv()
+                        if not msg or "data" not in msg:
+                            continue
+                        self.apply(msg["data"], "s", "q")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Ticker WebSocket 錯誤: %s", e)
+                await asyncio.sleep(5)
+
+
+universe = MarketUniverse()
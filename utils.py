@@ -1,21 +1,148 @@
+import atexit
+import json
 import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+try:
+    import orjson  # 選用：裝了就用較快的 JSON 解碼
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # ================== LOG 設定：同時輸出到控制台 + 檔案 ==================
+# event loop 只把 record 丟進佇列，格式化與寫檔在 QueueListener 的背景執行緒；
+# 檔案依大小輪替，同一則警告 / 錯誤短時間內大量重複時只保留前幾筆
+
+LOG_FILE = '_codeExecution.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+BURST_WINDOW = 10  # 秒
+BURST_LIMIT = 5    # 每個視窗內同一則訊息最多輸出幾筆
+
+_listener = None
+
+
+class BurstFilter(logging.Filter):
+    """WARNING 以上依訊息模板限流，視窗結束後補一行被略過的次數
+
+    emit 為所屬 handler 的 handle：每過一個視窗掃一次已結束的視窗，移除之餘，
+    有略過筆數的補發摘要（之後不再出現的訊息也會回報）
+    """
+
+    def __init__(self, emit=None):
+        super().__init__()
+        self.windows = {}  # (level, 模板) -> [視窗開始, 本視窗筆數, 最後一筆的參數]
+        self.emit = emit
+        self.next_sweep = 0.0
+
+    def filter(self, record):
+        now = time.monotonic()
+        if now >= self.next_sweep:
+            self.sweep(now)
+        if record.levelno < logging.WARNING or getattr(record, "burst_summary", False):
+            return True
+        key = (record.levelno, record.msg)
+        w = self.windows.get(key)
+        if w is None or now - w[0] >= BURST_WINDOW:
+            if w is not None and w[1] > BURST_LIMIT:
+                self._summary(record.name, key, w)
+            self.windows[key] = [now, 1, record.args]
+            return True
+        w[1] += 1
+        w[2] = record.args
+        return w[1] <= BURST_LIMIT
+
+    def sweep(self, now):
+        self.next_sweep = now + BURST_WINDOW
+        for key, w in list(self.windows.items()):
+            if now - w[0] >= BURST_WINDOW:
+                self.windows.pop(key, None)
+                if w[1] > BURST_LIMIT:
+                    self._summary("root", key, w)
+
+    def _summary(self, name, key, w):
+        # 以最後一筆被略過的內容加上略過次數
+        if self.emit is None:
+            return
+        level, msg = key
+        record = logging.LogRecord(name, level, __file__, 0,
+                                   f"{msg}（前 {BURST_WINDOW} 秒內另有 {w[1] - BURST_LIMIT} 筆相同訊息已略過）", w[2], None)
+        record.burst_summary = True
+        self.emit(record)
+
+
+IMMUTABLE_ARGS = (str, int, float, bytes, type(None))
+
+
+class LazyQueueHandler(QueueHandler):
+    # 預設的 prepare 會在呼叫端先格式化訊息，這裡留給 listener 執行緒處理；
+    # 參數含可變物件（list / dict / 狀態物件）時，listener 格式化前可能已被改掉，當場格式化
+    def prepare(self, record):
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, IMMUTABLE_ARGS) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def forward_logs(q):
+    """主行程用：子行程送來的 record 交給同一組 handler 輸出"""
+    setup_logging()
+    listener = QueueListener(q, *_listener.handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_to_queue(q):
+    """子行程用：停掉本行程的寫檔，record 格式化後送到主行程（同一個 log 檔只由主行程寫）"""
+    root = setup_logging()
+    atexit.unregister(_listener.stop)
+    _listener.stop()
+    for h in _listener.handlers:
+        h.close()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    handler = QueueHandler(q)
+    _add_burst_filter(handler)
+    root.addHandler(handler)
+    return root
+
+
+def _add_burst_filter(handler):
+    burst = BurstFilter(handler.handle)
+    handler.addFilter(burst)
+    # 結束前把還在視窗內的略過筆數補出來（atexit 後註冊先執行，早於 listener 停止）
+    atexit.register(burst.sweep, float("inf"))
+
+
 def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s | %(message)s',
-        datefmt='%H:%M:%S',
-        handlers=[
-            logging.FileHandler('_codeExecution.log', encoding='utf-8'),
-            logging.StreamHandler()  # 輸出到控制台
-        ]
-    )
-    
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        return root
+
+    formatter = logging.Formatter('%(asctime)s | %(message)s', datefmt='%H:%M:%S')
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    console = logging.StreamHandler()  # 輸出到控制台
+    for h in (file_handler, console):
+        h.setFormatter(formatter)
+
+    q = queue.SimpleQueue()
+    handler = LazyQueueHandler(q)
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+    _listener = QueueListener(q, file_handler, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    _add_burst_filter(handler)
+
     # 過濾 Telegram Bot API 的 HTTP 請求日誌
     logging.getLogger('httpx').setLevel(logging.WARNING)
     logging.getLogger('httpcore').setLevel(logging.WARNING)
     logging.getLogger('telegram').setLevel(logging.WARNING)
     logging.getLogger('telegram.ext').setLevel(logging.WARNING)
-    
-    return logging.getLogger()
\ No newline at end of file
+
+    return root
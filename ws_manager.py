@@ -0,0 +1,194 @@
+import asyncio
+import itertools
+import json
+import time
+import websockets
+from config import WS_URL, BATCH_SIZE, RESTART_INTERVAL, WS_STALL_TIMEOUT
+from models import running
+import metrics
+from utils import setup_logging
+
+log = setup_logging()
+
+# ================== WebSocket 連線管理 ==================
+# 1. 幣種增減用 SUBSCRIBE / UNSUBSCRIBE 直接改現有連線，不用重連
+# 2. 定期輪替採「先連後斷」：新連線收到資料後才關掉舊的，重疊期間的
+#    重複訊息由 K棒 close time、強平單成交時間去重
+# 3. 每條連線各自心跳檢查，只重連卡住的那一條
+
+MAX_PARAMS_PER_FRAME = 100  # 單個 SUBSCRIBE 最多帶幾個 stream
+FRAME_INTERVAL = 0.2        # Binance 每條連線每秒最多 10 個上行訊息
+WATCHDOG_INTERVAL = 5       # 心跳檢查間隔（秒）
+
+_ids = itertools.count(1)
+
+
+class WsConnection:
+    def __init__(self, on_message, symbols, streams_for):
+        self.id = next(_ids)
+        self.on_message = on_message
+        self.streams_for = streams_for
+        self.symbols = set(symbols)
+        self.ws = None
+        self.task = None
+        self.ready = asyncio.Event()
+        self.last_msg = time.time()
+        self.started_at = time.time()
+        self.messages = 0
+
+    def streams(self, symbols=None):
+        return [st for sym in sorted(self.symbols if symbols is None else symbols) for st in self.streams_for(sym)]
+
+    def start(self):
+        self.started_at = self.last_msg = time.time()
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def run(self):
+        try:
+            async with websockets.connect(WS_URL, ping_interval=None, max_queue=None) as ws:
+                self.ws = ws
+                await self._send("SUBSCRIBE", self.streams())
+                async for raw in ws:
+                    self.last_msg = time.time()
+                    self.messages += 1
+                    if not self.ready.is_set() and '"stream"' in raw:
+                        self.ready.set()
+                    self.on_message(raw)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("[WS#%d] 連線錯誤: %s", self.id, e)
+        finally:
+            self.ws = None
+
+    async def _send(self, method, params):
+        for i in range(0, len(params), MAX_PARAMS_PER_FRAME):
+            if self.ws is None:
+                return  # 尚未連上，連上後會以 self.symbols 重新訂閱
+            await self.ws.send(json.dumps({"method": method, "params": params[i:i + MAX_PARAMS_PER_FRAME], "id": next(_ids)}))
+            await asyncio.sleep(FRAME_INTERVAL)
+
+    async def subscribe(self, symbols):
+        self.symbols |= set(symbols)
+        await self._send("SUBSCRIBE", self.streams(symbols))
+
+    async def unsubscribe(self, symbols):
+        self.symbols -= set(symbols)
+        await self._send("UNSUBSCRIBE", self.streams(symbols))
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+class ConnectionManager:
+    def __init__(self, on_message, streams_for, per_conn=BATCH_SIZE):
+        self.on_message = on_message
+        self.streams_for = streams_for
+        self.per_conn = per_conn
+        self.conns = []
+        self.sym_conn = {}
+        self.replacing = set()
+        self.lock = asyncio.Lock()
+
+    # ---------- 幣種增減 ----------
+
+    async def sync(self, symbols):
+        async with self.lock:
+            symbols = set(symbols)
+            removed = set(self.sym_conn) - symbols
+            added = sorted(symbols - set(self.sym_conn))
+            n_added = len(added)
+
+            by_conn = {}
+            for sym in removed:
+                by_conn.setdefault(self.sym_conn.pop(sym), []).append(sym)
+            for conn, syms in by_conn.items():
+                await conn.unsubscribe(syms)
+            for conn in [c for c in self.conns if not c.symbols]:
+                self.conns.remove(conn)
+                await conn.close()
+
+            # 先塞進有空位的連線，不夠再開新連線
+            for conn in self.conns:
+                room = self.per_conn - len(conn.symbols)
+                if room > 0 and added:
+                    batch, added = added[:room], added[room:]
+                    for sym in batch:
+                        self.sym_conn[sym] = conn
+                    await conn.subscribe(batch)
+            for i in range(0, len(added), self.per_conn):
+                batch = added[i:i + self.per_conn]
+                conn = WsConnection(self.on_message, batch, self.streams_for).start()
+                self.conns.append(conn)
+                for sym in batch:
+                    self.sym_conn[sym] = conn
+
+            if removed or n_added:
+                log.info("WS 訂閱更新：+%d / -%d 幣，共 %d 條連線", n_added, len(removed), len(self.conns))
+
+    # ---------- 先連後斷 ----------
+
+    async def replace(self, old, reason):
+        if old in self.replacing:
+            return
+        self.replacing.add(old)
+        try:
+            await self._replace(old, reason)
+        finally:
+            self.replacing.discard(old)
+
+    async def _replace(self, old, reason):
+        new = WsConnection(self.on_message, old.symbols, self.streams_for).start()
+        try:
+            await asyncio.wait_for(new.ready.wait(), timeout=WS_STALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.warning("[WS#%d] 新連線 %s 秒內無資料，仍切換", new.id, WS_STALL_TIMEOUT)
+        async with self.lock:
+            # 等待期間幣種可能有增減，以舊連線最新的清單為準
+            missing = old.symbols - new.symbols
+            extra = new.symbols - old.symbols
+            if missing:
+                await new.subscribe(missing)
+            if extra:
+                await new.unsubscribe(extra)
+            if old not in self.conns:
+                # 等待期間整條連線的幣種都被移除了
+                await new.close()
+                await old.close()
+                return
+            self.conns[self.conns.index(old)] = new
+            for sym in new.symbols:
+                self.sym_conn[sym] = new
+        await old.close()
+        log.info("♻️ WS#%d → WS#%d（%s，%d 幣）", old.id, new.id, reason, len(new.symbols))
+
+    async def rotate(self):
+        # 錯開輪替：每次只換最舊的一條
+        while running:
+            await asyncio.sleep(RESTART_INTERVAL / max(1, len(self.conns)))
+            if self.conns:
+                await self.replace(min(self.conns, key=lambda c: c.started_at), "定期輪替")
+
+    async def watchdog(self):
+        while running:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            now = time.time()
+            for conn in list(self.conns):
+                if conn.task.done() or now - conn.last_msg > WS_STALL_TIMEOUT:
+                    await self.replace(conn, "心跳逾時")
+
+    def collect(self):
+        # 每條連線的累計訊息數，每秒訊息量由 Prometheus rate() 計算
+        return (metrics.family("ws_messages_total", "counter", "各條 WS 連線收到的訊息數",
+                               [({"conn": c.id}, c.messages) for c in self.conns])
+                + metrics.family("ws_connections", "gauge", "WS 連線數", [({}, len(self.conns))])
+                + metrics.family("ws_symbols", "gauge", "WS 訂閱幣種數", [({}, len(self.sym_conn))]))
+
+    async def close(self):
+        for conn in self.conns:
+            await conn.close()
+        self.conns.clear()
+        self.sym_conn.clear()